@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+from __future__ import division
+from os import path, stat
+import time
+import hashlib
+import json
+import log
+
+
+def file_signature(filename):
+    """Return a string identifying the state of the file *filename*
+    (its name, size and modification time), or 'missing' if the file
+    does not exist.
+
+    """
+    try:
+        st = stat(filename)
+    except OSError:
+        return '{0}:missing'.format(path.basename(filename))
+    return '{0}:{1}:{2!r}'.format(
+        path.basename(filename), st.st_size, st.st_mtime)
+
+
+class ArtifactRegistry(object):
+    def __init__(self, filename, force=False):
+        """Keep track of the artifacts (files) produced by the steps of
+        the post-processing, so that only stale artifacts are rebuilt.
+
+        Each build step is registered under a unique key together with
+        a signature of its input files and its recipe (e.g. the command
+        calls or parameters used to produce the output). A step is up
+        to date if neither inputs nor recipe changed since it was last
+        registered and all its output files still exist.
+
+        :param filename:
+            the json file where the registry is saved. It will be
+            created if it does not exist yet.
+        :param force:
+            if True, all steps are considered stale (but the registry
+            will still be updated).
+
+        """
+        self.filename = filename
+        self.force = force
+        self._steps = dict()
+        # start times of the steps found stale, to measure their duration:
+        self._started = dict()
+        if path.isfile(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self._steps = json.load(f)
+            except ValueError:
+                log.warning('could not read artifact registry {0}, will '
+                            'rebuild all artifacts.'.format(filename))
+                self._steps = dict()
+
+    def _signature(self, inputs, recipe):
+        md5 = hashlib.md5()
+        for fname in inputs:
+            md5.update(file_signature(fname).encode('utf-8'))
+        md5.update(str(recipe).encode('utf-8'))
+        return md5.hexdigest()
+
+    def is_up_to_date(self, key, inputs, recipe=''):
+        """Return True if the step *key* was registered before with the
+        same *inputs* (list of file names) and *recipe* (any object with
+        a meaningful str representation) and all its outputs exist.
+
+        """
+        step = self._steps.get(key, None)
+        uptodate = (
+            not self.force and step is not None and
+            step['signature'] == self._signature(inputs, recipe) and
+            all(path.isfile(fname) for fname in step['outputs']))
+        if uptodate:
+            log.info('{0}: up to date, skipping.'.format(key))
+        else:
+            log.debug('{0}: stale or not built yet.'.format(key))
+            self._started[key] = time.time()
+        log.event('cache', key=key, hit=uptodate)
+        return uptodate
+
+    def update(self, key, inputs, outputs, recipe=''):
+        """Register the step *key* as built from the *inputs* (list of
+        file names) with *recipe*, producing *outputs* (list of file
+        names), and save the registry to disk.
+
+        """
+        self._steps[key] = dict(
+            signature=self._signature(inputs, recipe),
+            outputs=list(outputs))
+        self.save()
+        if key in self._started:
+            log.event('stage', name=key,
+                      duration=time.time() - self._started.pop(key))
+
+    def invalidate(self, key):
+        """Remove the step *key* from the registry, so it will be rebuilt
+        the next time."""
+        if self._steps.pop(key, None) is not None:
+            self.save()
+
+    def save(self):
+        with open(self.filename, 'w') as f:
+            json.dump(self._steps, f, indent=1, sort_keys=True)
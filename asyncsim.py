@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Run simulations and their post-processing with asyncio (Python 3).
+
+Simulation.run_simulation and Simulation.post_process block until the
+external programs (MPB, mpb-data, h5topng) are finished. The coroutines
+in this module, which are also available as Simulation.arun and
+Simulation.apost_process, start these programs with
+asyncio.create_subprocess_exec instead, so that one event loop can drive
+many simulations at once, without threads:
+
+    limit = asyncio.Semaphore(4)
+    retcodes = await asyncio.gather(
+        *[sim.arun(num_processors=2, limit=limit) for sim in sims])
+
+The optional *limit* (an asyncio.Semaphore shared by all simulations)
+limits the number of concurrently running external programs. run_all
+does the above, including the post-processing of each simulation.
+
+The Python parts of the post-processing (e.g. exporting the csv files)
+still run in the event loop, and the log messages of all concurrently
+running simulations go to the same logger. Stage profiling (see
+profiler.py) is only meaningful for simulations run one at a time.
+
+"""
+
+import asyncio
+from types import GeneratorType
+import log
+
+
+class _Unlimited(object):
+    """Used instead of a Semaphore if there is no limit."""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+_unlimited = _Unlimited()
+
+
+async def call(args, cwd, limit=None):
+    """Asynchronously call the external program *args* (list of program
+    and arguments) in the folder *cwd* and return its return code. Emits
+    a 'subprocess' event (see log.event), the time waiting for *limit*
+    excluded.
+
+    """
+    async with limit or _unlimited:
+        with log.timed('subprocess', command=' '.join(args)) as ev:
+            proc = await asyncio.create_subprocess_exec(*args, cwd=cwd)
+            ev['returncode'] = retcode = await proc.wait()
+    return retcode
+
+
+async def run_steps(steps, cwd, limit=None):
+    """Asynchronous version of simulation._run_steps: run the step
+    generator *steps* and return its result, calling the external
+    programs with call."""
+    # simulation is only imported here, because this module is imported
+    # by simulation:
+    from simulation import _Return
+    send = steps.send
+    value = None
+    while True:
+        try:
+            request = send(value)
+        except StopIteration:
+            return None
+        if isinstance(request, _Return):
+            steps.close()
+            return request.value
+        try:
+            if isinstance(request, GeneratorType):
+                value = await run_steps(request, cwd, limit)
+            else:
+                value = await call(request, cwd, limit)
+            send = steps.send
+        except OSError as err:
+            value = err
+            send = steps.throw
+
+
+async def run_simulation(sim, num_processors=2, limit=None):
+    """Asynchronous version of sim.run_simulation. MPB counts as one
+    program for *limit*, independent of *num_processors*."""
+    ctl = sim.write_ctl_file(sim.workingdir)
+    args = sim._get_mpb_args(num_processors)
+    with open(sim.out_file, 'w') as outputFile:
+        async with limit or _unlimited:
+            starttime = sim._start_out_file(outputFile, ctl, num_processors)
+            proc = await asyncio.create_subprocess_exec(
+                *args, stdout=outputFile,
+                stderr=asyncio.subprocess.STDOUT, cwd=sim.workingdir)
+            retcode = await proc.wait()
+        sim._finish_out_file(outputFile, starttime, retcode)
+    return retcode
+
+
+async def post_process(
+        sim, convert_field_patterns=True, project_bands_list=None,
+        force=False, limit=None):
+    """Asynchronous version of sim.post_process."""
+    return await run_steps(
+        sim._post_process_steps(
+            convert_field_patterns, project_bands_list, force),
+        sim.workingdir, limit)
+
+
+async def run_all(
+        sims, num_processors=2, max_concurrent=4, post_process=True,
+        convert_field_patterns=True):
+    """Run all simulations in the list *sims* concurrently, followed by
+    their post-processing (if *post_process*), with at most
+    *max_concurrent* external programs running at the same time.
+
+    :return: a list with the return codes of MPB for all simulations.
+
+    """
+    limit = asyncio.Semaphore(max_concurrent)
+
+    async def run_one(sim):
+        retcode = await sim.arun(num_processors, limit)
+        if retcode:
+            log.error('simulation {0} failed, returncode: {1}'.format(
+                sim.jobname, retcode))
+        elif post_process:
+            await sim.apost_process(
+                convert_field_patterns=convert_field_patterns, limit=limit)
+        return retcode
+
+    return await asyncio.gather(*[run_one(sim) for sim in sims])
@@ -24,9 +24,12 @@ from __future__ import division, print_function
 from matplotlib import ticker as mticker
 import numpy as np
 from fractions import Fraction
+from collections import OrderedDict
+import hashlib
 import re
 import defaults
 from utility import strip_format_spec, ContinuousStepwiseLinearFunction
+from kspace import KSpace
 import log
 
 
@@ -69,6 +72,54 @@ def infer_k_axis_label_from_format_string(format_str):
             '$' + kvec.replace(' ', '\ ') + '$')
 
 
+# the tick positions and labels of recently plotted k-paths (see
+# KVectorAxisFormatter.set_hover_data):
+_tick_cache = OrderedDict()
+_tick_cache_size = 32
+
+
+# the fraction strings of recently converted numbers (see _fraction_str):
+_fraction_cache = OrderedDict()
+_fraction_cache_size = 4096
+
+
+def _fraction_str(floatnum):
+    """Return *floatnum* (a number or a string with a number) written as
+    fraction string, or None if the fraction's denominator is greater
+    than defaults.tick_max_denominator or *floatnum* is no number. The
+    results of the most recently used numbers are memoized.
+
+    """
+    key = (floatnum, defaults.tick_max_denominator)
+    try:
+        # mark as recently used:
+        fstr = _fraction_cache.pop(key)
+        _fraction_cache[key] = fstr
+        return fstr
+    except KeyError:
+        pass
+    except TypeError:
+        # unhashable, can't be a number anyway
+        return None
+    try:
+        # Limit to rather high denominator just to remove inaccuracies
+        # due to floating point error:
+        f = Fraction(floatnum).limit_denominator(100000)
+        # But don't make a tick label with such a high denominator.
+        # Only return fraction if not too high:
+        if f.denominator <= defaults.tick_max_denominator:
+            fstr = str(f)
+        else:
+            fstr = None
+    except (ValueError, TypeError):
+        # could not make fraction: probably bad/unknown string
+        fstr = None
+    _fraction_cache[key] = fstr
+    while len(_fraction_cache) > _fraction_cache_size:
+        _fraction_cache.popitem(last=False)
+    return fstr
+
+
 class CustomAxisFormatter(mticker.Formatter):
     def __init__(self, ticks=list(), labels=list(), hover_data=None,
                  axis_label=''):
@@ -105,6 +156,7 @@ class CustomAxisFormatter(mticker.Formatter):
         self._ticks = np.array(ticks)
         self._labels = labels[:]
         self._hover_data = None
+        self._hover_strings = []
         self._hover_func = lambda x: x
         self._hover_func_is_default = True
         self.set_hover_data(hover_data)
@@ -137,6 +189,19 @@ class CustomAxisFormatter(mticker.Formatter):
         else:
             return x
 
+    def _get_hover_string_from_continuous_index(self, x):
+        # Like _get_hover_data_from_continuous_index, but returns the
+        # string shown in the status bar. The strings are only made once
+        # for each index, because __call__ is called constantly while
+        # the mouse moves over the plot:
+        if x >= 0 and int(x + 0.5) < len(self._hover_data):
+            i = int(x + 0.5)
+            if self._hover_strings[i] is None:
+                self._hover_strings[i] = str(self._hover_data[i])
+            return self._hover_strings[i]
+        else:
+            return x
+
     def get_tick_positions(self):
         """Return the current tick positions, i.e. the sequence with the
         major tick positions.
@@ -193,7 +258,8 @@ class CustomAxisFormatter(mticker.Formatter):
             self._hover_func = hover_data
         else:
             self._hover_data = np.array(hover_data)  # make copy
-            self._hover_func = self._get_hover_data_from_continuous_index
+            self._hover_strings = [None] * len(self._hover_data)
+            self._hover_func = self._get_hover_string_from_continuous_index
 
     def get_longest_label_length(self):
         """Return the length of the longest string in list of axis labels."""
@@ -302,6 +368,17 @@ class KVectorAxisFormatter(CustomAxisFormatter):
             strings,
 
         """
+        if (isinstance(floatnum, np.ndarray) and floatnum.ndim and
+                floatnum.dtype.kind in 'iuf'):
+            # Only convert each distinct value once:
+            values, inverse = np.unique(floatnum, return_inverse=True)
+            strings = [_fraction_str(value) for value in values.tolist()]
+            result = np.empty(len(values), dtype=object)
+            result[:] = [
+                value if fstr is None else fstr
+                for value, fstr in zip(values.tolist(), strings)]
+            return result[inverse.reshape(floatnum.shape)].tolist()
+
         try:
             l = len(floatnum)
             if hasattr(floatnum, 'isalnum'):
@@ -316,19 +393,8 @@ class KVectorAxisFormatter(CustomAxisFormatter):
             return [self._make_fraction_str(comp) for comp in floatnum]
         else:
             # it's a single entry:
-            try:
-                # Limit to rather high denominator just to remove inaccuracies
-                # due to floating point error:
-                f = Fraction(floatnum).limit_denominator(100000)
-                # But don't make a tick label with such a high denominator.
-                # Only return fraction if not too high:
-                if f.denominator <= defaults.tick_max_denominator:
-                    return str(f)
-                else:
-                    return floatnum
-            except ValueError:
-                # could not make fraction: probably bad/unknown string
-                return floatnum
+            fstr = _fraction_str(floatnum)
+            return floatnum if fstr is None else fstr
 
     def set_hover_data(self, hover_data):
         """Set the data that will be shown when the mouse hovers over
@@ -357,14 +423,46 @@ class KVectorAxisFormatter(CustomAxisFormatter):
             log.error('KVectorAxisFormatter: Could not set ticks, '
                       'hover_data must be a sequence.')
             return
+
+        key = self._get_tick_cache_key()
+        if key is not None and key in _tick_cache:
+            # same k-path as in a recent plot; mark as recently used:
+            ticks, labels = _tick_cache.pop(key)
+        else:
+            ticks, labels = self._make_ticks(axis_length)
+        if key is not None:
+            _tick_cache[key] = (ticks, labels)
+            while len(_tick_cache) > _tick_cache_size:
+                _tick_cache.popitem(last=False)
+        self._ticks = np.array(ticks)  # make copy
+        self._labels = labels[:]
+
+    def _get_tick_cache_key(self):
+        """Return a key identifying the ticks made from the current hover
+        data with the current settings, or None if the hover data can't
+        be hashed."""
+        if self._hover_data.dtype.hasobject:
+            return None
+        md5 = hashlib.md5(np.ascontiguousarray(self._hover_data).tobytes())
+        return (self._hover_data.shape, self._hover_data.dtype.str,
+                md5.hexdigest(), self._num_ticks, self._format_str,
+                self._fractions, defaults.tick_max_denominator)
+
+    def _make_ticks(self, axis_length):
+        """Return the tick positions and labels for the hover data."""
+        ticks = []
+        labels = []
         if axis_length:
             step = max(1, np.floor(axis_length / (self._num_ticks - 1)))
-            self._ticks = np.arange(0, axis_length + 1, step, dtype=np.int32)
+            ticks = np.arange(0, axis_length + 1, step, dtype=np.int32)
 
         vecs = [
             self._get_hover_data_from_continuous_index(x)
-            for x in self._ticks]
+            for x in ticks]
         if self._fractions:
+            if len(vecs) and not self._hover_data.dtype.hasobject:
+                # convert all components at once:
+                vecs = np.array(vecs)
             vecs = self._make_fraction_str(vecs)
         for vec in vecs:
             try:
@@ -380,7 +478,8 @@ class KVectorAxisFormatter(CustomAxisFormatter):
                 # But if format_str is intended for numbers, we need to
                 # strip the format-spec from it:
                 lbl = strip_format_spec(self._format_str).format(*vec)
-            self._labels.append(lbl)
+            labels.append(lbl)
+        return ticks, labels
 
 
 class KSpaceAxisFormatter(CustomAxisFormatter):
@@ -401,11 +500,7 @@ class KSpaceAxisFormatter(CustomAxisFormatter):
 
         """
         if kspace.has_labels():
-            ticks = np.arange(
-                0, kspace.count_interpolated(),
-                step=kspace.k_interpolation+1,
-                dtype=np.int32
-            )
+            ticks = np.array(kspace.point_indices(), dtype=np.int32)
             labels = [
                 self._symmetry_point_to_latex.get(l, '${0}$'.format(l))
                 for l in kspace.labels()
@@ -420,3 +515,50 @@ class KSpaceAxisFormatter(CustomAxisFormatter):
             ticks=ticks,
             labels=labels,
             axis_label=defaults.default_kspace_axis_label)
+
+
+def get_axis_formatter(x_axis_hint):
+    """Return a CustomAxisFormatter for the k-vector axis made from
+    *x_axis_hint* (see graphics.draw_bands for the possible values).
+    If the hint is not understood, a KVectorAxisFormatter with
+    defaults.default_x_axis_hint ticks is returned.
+
+    """
+    x_axis_formatter = None
+    if isinstance(x_axis_hint, CustomAxisFormatter):
+        # use the supplied CustomAxisFormatter:
+        x_axis_formatter = x_axis_hint
+    elif isinstance(x_axis_hint, KSpace):
+        # make a KSpaceAxisFormatter instance from kspace object:
+        x_axis_formatter = KSpaceAxisFormatter(x_axis_hint)
+    elif isinstance(x_axis_hint, int):
+        # make a standard KVectorAxisFormatter with supplied number of ticks:
+        x_axis_formatter = KVectorAxisFormatter(x_axis_hint)
+    else:
+        num = 0
+        hintlen = 0
+        if hasattr(x_axis_hint, '__len__'):
+            hintlen = len(x_axis_hint)
+        else:
+            # no sequence
+            try:
+                # is this a number?
+                num = int(x_axis_hint)
+            except (ValueError, TypeError):
+                # no number
+                pass
+        if hintlen > 1 and (isinstance(x_axis_hint[0], int) and
+                hasattr(x_axis_hint[1], 'format')):
+            # Supplied a list with at least an int and format_str.
+            # Use all items in list as KVectorAxisFormatter arguments:
+            x_axis_formatter = KVectorAxisFormatter(*x_axis_hint)
+        elif num > 0:
+            # make a standard KVectorAxisFormatter with supplied number
+            # of ticks:
+            x_axis_formatter = KVectorAxisFormatter(num)
+    if x_axis_formatter is None:
+        log.warning('draw_bands: Did not understand x_axis_hint, '
+            'using default.')
+        x_axis_formatter = KVectorAxisFormatter(
+            defaults.default_x_axis_hint)
+    return x_axis_formatter
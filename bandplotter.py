@@ -23,12 +23,55 @@ else:
 from matplotlib.offsetbox import OffsetImage, AnchoredOffsetbox
 import numpy as np
 from itertools import cycle
+from collections import OrderedDict
+import hashlib
 from utility import get_intersection_knum, get_intersection
 from axis_formatter import CustomAxisFormatter
 import log
 import defaults
 
 
+# the default colors of the bands (the seaborn default color palette with
+# red and green exchanged to meet common conventions):
+band_colors = [
+    (0.2980392156862745, 0.4470588235294118, 0.6901960784313725),
+    (0.7686274509803922, 0.3058823529411765, 0.3215686274509804),
+    (0.3333333333333333, 0.6588235294117647, 0.40784313725490196),
+    (0.5058823529411764, 0.4470588235294118, 0.6980392156862745),
+    (0.8, 0.7254901960784313, 0.4549019607843137),
+    (0.39215686274509803, 0.7098039215686275, 0.803921568627451)]
+
+# the corrected x-values of recently plotted k-paths, keyed by a hash
+# of the k-vectors (see corrected_x_values):
+_x_values_cache = OrderedDict()
+_x_values_cache_size = 32
+
+
+def corrected_x_values(k_data):
+    """Return the x-values of the k-vectors (rows of *k_data*, the
+    first three columns are used, the kmag/2pi column is irrelevant
+    here), equidistant according to the Euclidean distance between the
+    k-vectors.
+
+    The result is cached, so plotting several modes or subplots of the
+    same simulation only calculates it once. The returned array is
+    read-only.
+
+    """
+    kvecs = np.ascontiguousarray(k_data[:, :3], dtype=float)
+    key = (kvecs.shape, hashlib.md5(kvecs.tobytes()).hexdigest())
+    if key in _x_values_cache:
+        # mark as recently used:
+        x_vals = _x_values_cache.pop(key)
+    else:
+        steps = np.sqrt(np.sum(np.square(np.diff(kvecs, axis=0)), axis=1))
+        x_vals = np.concatenate([[0], np.cumsum(steps)])
+        x_vals.flags.writeable = False
+    _x_values_cache[key] = x_vals
+    while len(_x_values_cache) > _x_values_cache_size:
+        _x_values_cache.popitem(last=False)
+    return x_vals
+
 class BandPlotter:
     def __init__(
             self, figure_size=defaults.fig_size,
@@ -122,22 +165,9 @@ class BandPlotter:
         # all graphs.
         # The same goes for the minimum values.
 
-        # start new plot at blue again (using the seaborn default color 
-        # palette with red and green exchanged to meet common conventions):
-        self._colors = cycle([(0.2980392156862745, 0.4470588235294118, 
-                               0.6901960784313725),
-                              (0.7686274509803922, 0.3058823529411765, 
-                               0.3215686274509804),
-                              (0.3333333333333333, 0.6588235294117647, 
-                               0.40784313725490196),
-                              (0.5058823529411764, 0.4470588235294118, 
-                               0.6980392156862745),
-                              (0.8, 0.7254901960784313, 
-                               0.4549019607843137),
-                              (0.39215686274509803, 0.7098039215686275, 
-                               0.803921568627451)])
-        self._last_color = (0.2980392156862745, 0.4470588235294118, 
-                            0.6901960784313725)
+        # start new plot at blue again:
+        self._colors = cycle(band_colors)
+        self._last_color = band_colors[0]
         self._distribute_subplots()
 
     def set_num_rows(self, numrows):
@@ -164,15 +194,7 @@ class BandPlotter:
     def _calc_corrected_x_values(self, k_data):
         """Calculate new x-axis values based on the Euclidean point
         distance of the k-vectors."""
-        def point_distance(p1, p2):
-            """Euclidean point distance in 3D space"""
-            return np.sqrt(np.sum(np.square(p2 - p1)))
-        
-        x_vals = np.zeros(len(k_data))
-        k_data_vecs = k_data[:, :-1]  # the kmag/2pi column is irrelevant here
-        for i, k in enumerate(k_data_vecs[:-1]):
-            x_vals[i + 1] = point_distance(k, k_data_vecs[i + 1]) + x_vals[i]
-        return x_vals
+        return corrected_x_values(k_data)
     
     def plot_bands(
             self, banddata, k_data, formatstr='',
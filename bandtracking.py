@@ -0,0 +1,277 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Band tracking (mode following) across k-points.
+
+MPB returns the bands sorted by frequency at each k-vector, so where two
+bands cross, the band numbers swap. The functions in this module reorder
+the bands from one k-vector to the next, so that each column of the
+returned band data follows one physical band, using the continuity of
+frequencies, group velocities and parities.
+
+"""
+
+from __future__ import division
+from os import path
+import numpy as np
+from numpy import loadtxt
+from utility import load_velocity_data
+import log
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def _greedy_assignment(cost):
+    """Fallback if scipy is not available: assign the pairs with the
+    lowest costs first. Returns (rows, cols) like
+    scipy.optimize.linear_sum_assignment.
+
+    """
+    num = cost.shape[0]
+    cols = np.empty(num, dtype=int)
+    used_rows = np.zeros(num, dtype=bool)
+    used_cols = np.zeros(num, dtype=bool)
+    for flat in np.argsort(cost, axis=None):
+        row, col = divmod(flat, num)
+        if not used_rows[row] and not used_cols[col]:
+            cols[row] = col
+            used_rows[row] = True
+            used_cols[col] = True
+    return np.arange(num), cols
+
+
+def _assign(cost):
+    """Solve the assignment problem for the square *cost* matrix."""
+    if linear_sum_assignment is None:
+        return _greedy_assignment(cost)
+    return linear_sum_assignment(cost)
+
+
+def _scale(values):
+    """Return a typical magnitude of *values*, used to normalize the
+    different contributions to the assignment costs."""
+    values = np.abs(values[np.isfinite(values)])
+    if values.size == 0:
+        return 1.0
+    scale = np.median(values)
+    if scale <= 0:
+        scale = values.max()
+    return scale if scale > 0 else 1.0
+
+
+def track_bands(
+        freqs, k_vectors=None, velocities=None, parities=None,
+        velocity_weight=1.0, parity_weight=1.0):
+    """Find the order of bands at each k-vector so that each band is
+    followed continuously along the k-path, even where bands cross.
+
+    Between each pair of neighboring k-vectors, the frequencies at the
+    second k-vector are predicted from the first, using the group
+    velocities if available (or linear extrapolation otherwise). The
+    bands are then matched by solving an assignment problem (Hungarian
+    algorithm) on a cost matrix built from the frequency mismatch, the
+    change of group velocity and the change of parity.
+
+    :param freqs:
+        array with shape (number_of_k_vecs, number_of_bands) with the
+        frequencies as sorted by MPB.
+    :param k_vectors:
+        array with shape (number_of_k_vecs, 3) with the k-vectors in
+        cartesian coordinates (in units of 2 pi / a). Needed to use the
+        velocities for the frequency prediction and to extrapolate
+        correctly on non-equidistant k-paths.
+    :param velocities:
+        array with shape (number_of_k_vecs, number_of_bands, 3) with the
+        group velocities (e.g. from utility.load_velocity_data), or
+        None.
+    :param parities:
+        array with shape (number_of_k_vecs, number_of_bands) with the
+        parities of the bands, or None.
+    :param velocity_weight: weight of the velocity change in the costs.
+    :param parity_weight: weight of the parity change in the costs.
+    :return:
+        integer array with the same shape as *freqs*. Row i contains
+        the indices into freqs[i] of the tracked bands, i.e. the
+        tracked band j is at freqs[i, order[i, j]]. Use reorder_bands
+        to apply it.
+
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    numk, numbands = freqs.shape
+    order = np.empty((numk, numbands), dtype=int)
+    order[0] = np.arange(numbands)
+    if numk < 2:
+        return order
+
+    if velocities is not None:
+        velocities = np.asarray(velocities, dtype=float)
+        if velocities.shape[:2] != freqs.shape:
+            log.warning('track_bands: shape of velocities {0} does not '
+                        'match that of freqs {1}. Will not use them.'.format(
+                            velocities.shape, freqs.shape))
+            velocities = None
+    if parities is not None:
+        parities = np.asarray(parities, dtype=float)
+        if parities.shape != freqs.shape:
+            log.warning('track_bands: shape of parities {0} does not '
+                        'match that of freqs {1}. Will not use them.'.format(
+                            parities.shape, freqs.shape))
+            parities = None
+
+    if k_vectors is not None:
+        k_vectors = np.asarray(k_vectors, dtype=float)
+        steps = np.diff(k_vectors, axis=0)
+        step_lengths = np.sqrt(np.sum(np.square(steps), axis=1))
+    else:
+        steps = None
+        step_lengths = np.ones(numk - 1)
+
+    # typical changes, used to make the cost contributions comparable:
+    fscale = _scale(np.diff(freqs, axis=0))
+    if velocities is not None:
+        vscale = _scale(np.sqrt(np.sum(
+            np.square(np.diff(velocities, axis=0)), axis=2)))
+
+    for i in range(numk - 1):
+        current = freqs[i, order[i]]
+        if velocities is not None and steps is not None:
+            predicted = current + velocities[i, order[i]].dot(steps[i])
+        elif i > 0 and step_lengths[i - 1] > 0:
+            previous = freqs[i - 1, order[i - 1]]
+            predicted = current + (current - previous) * (
+                step_lengths[i] / step_lengths[i - 1])
+        else:
+            predicted = current
+
+        cost = np.square(
+            (predicted[:, np.newaxis] - freqs[i + 1][np.newaxis, :]) / fscale)
+        if velocities is not None:
+            cost += velocity_weight * np.sum(np.square(
+                velocities[i, order[i]][:, np.newaxis, :] -
+                velocities[i + 1][np.newaxis, :, :]), axis=2) / vscale ** 2
+        if parities is not None:
+            pardiff = np.square(
+                parities[i, order[i]][:, np.newaxis] -
+                parities[i + 1][np.newaxis, :])
+            cost += parity_weight * np.where(np.isfinite(pardiff), pardiff, 0)
+
+        rows, cols = _assign(cost)
+        order[i + 1, rows] = cols
+
+    return order
+
+
+def reorder_bands(data, order):
+    """Reorder *data* (array with shape (number_of_k_vecs,
+    number_of_bands, ...), e.g. frequencies, parities or velocities)
+    according to *order* returned from track_bands.
+
+    """
+    data = np.asarray(data)
+    return data[np.arange(order.shape[0])[:, np.newaxis], order]
+
+
+def track_band_data(
+        jobname, mode, data, parities=None, reciprocal_basis=None,
+        velocity_weight=1.0, parity_weight=1.0):
+    """Disentangle the bands of already loaded band data.
+
+    :param jobname: the group velocities are loaded from the file
+    jobname + '_' + mode + 'velocity.csv', if it exists.
+    :param mode: see jobname
+    :param data: the array loaded from the freqs.csv file, i.e. with
+    the columns k index, k1, k2, k3, kmag/2pi and one column per band.
+    :param parities: the parity data (array with one column per band),
+    or None.
+    :param reciprocal_basis: the reciprocal lattice vectors (rows of a
+    3x3-array, e.g. Geometry.reciprocal_basis), needed to convert the
+    k-vectors to cartesian coordinates. If None, the cartesian unit
+    vectors are used.
+    :return: a tuple (banddata, parities) with the tracked frequencies
+    and the tracked parities (None if parities was None or did not
+    match the band data).
+
+    """
+    freqs = data[:, 5:]
+    if reciprocal_basis is None:
+        reciprocal_basis = np.identity(3)
+    k_vectors = data[:, 1:4].dot(reciprocal_basis)
+
+    velocities = None
+    fname = '{0}_{1}velocity.csv'.format(jobname, mode)
+    if path.isfile(fname):
+        velocities = load_velocity_data(fname)
+
+    if parities is not None and np.shape(parities) != freqs.shape:
+        parities = None
+
+    order = track_bands(
+        freqs, k_vectors=k_vectors, velocities=velocities,
+        parities=parities, velocity_weight=velocity_weight,
+        parity_weight=parity_weight)
+    if parities is not None:
+        parities = reorder_bands(parities, order)
+    return reorder_bands(freqs, order), parities
+
+
+def load_tracked_bands(
+        jobname, mode, reciprocal_basis=None, parity_direction=None,
+        velocity_weight=1.0, parity_weight=1.0):
+    """Load the band data of a simulation from the csv files saved in
+    post-processing and return it with the bands disentangled.
+
+    The returned band data can directly be used with
+    BandPlotter.plot_bands or the analysis functions in utility, e.g.
+    sum_of_squares.
+
+    :param jobname: the band data is loaded from the files
+    jobname + '_' + mode + 'freqs.csv' (and 'velocity.csv' and
+    parity_direction + 'parity.csv', if these exist).
+    :param mode: see jobname
+    :param reciprocal_basis: see track_band_data
+    :param parity_direction: 'y' or 'z' to use the parity data for
+    tracking (and return it reordered), or None.
+    :return: a tuple (k_data, banddata, parities), where k_data are the
+    columns 1 to 4 of the freqs.csv file (k1, k2, k3, kmag/2pi, as
+    expected by BandPlotter.plot_bands), banddata the tracked
+    frequencies and parities the tracked parity data (or None if not
+    available).
+
+    """
+    data = loadtxt(
+        '{0}_{1}freqs.csv'.format(jobname, mode), delimiter=',',
+        skiprows=1, ndmin=2)
+
+    parities = None
+    if parity_direction:
+        fname = '{0}_{1}{2}parity.csv'.format(
+            jobname, mode, parity_direction)
+        if path.isfile(fname):
+            # ignore first column with k-indices:
+            parities = loadtxt(fname, delimiter=',', ndmin=2)[:, 1:]
+
+    banddata, parities = track_band_data(
+        jobname, mode, data, parities=parities,
+        reciprocal_basis=reciprocal_basis,
+        velocity_weight=velocity_weight, parity_weight=parity_weight)
+    return data[:, 1:5], banddata, parities
@@ -0,0 +1,278 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Fast rendering of many band diagrams, e.g. for all jobs of a sweep.
+
+graphics.draw_bands (used by Simulation.draw_bands) builds a new
+BandPlotter figure for each diagram, which is flexible but slow when
+thousands of diagrams are made. A BandRenderer instead keeps one
+figure with an Agg canvas (independent of pyplot and its interactive
+backends). As long as the modes, the number of k-vectors and the number
+of bands stay the same, only the data of the existing lines is updated
+between diagrams; the band gaps, light cone and tick labels are redrawn
+each time. Only the requested output formats are saved, without
+tight bounding box.
+
+render_batch renders the diagrams of many jobs in parallel in worker
+processes, each with its own BandRenderer:
+
+    render_batch(
+        [(path.join(sim.workingdir, sim.jobname), sim.modes)
+         for sim in sims],
+        formats=('png',), processes=4)
+
+Not supported (use graphics.draw_bands for those): projected bands,
+parity coloring, band tracking, insets, and clipping of the band gaps
+at the light line (the light cone is drawn over them instead).
+
+"""
+
+from __future__ import division
+from itertools import cycle
+from copy import copy
+from multiprocessing import Pool
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Polygon
+from bandplotter import band_colors, corrected_x_values
+from axis_formatter import get_axis_formatter, CustomAxisFormatter
+from utility import get_gap_bands
+import defaults
+import log
+
+
+class BandRenderer(object):
+    def __init__(self, figure_size=None, dpi=None):
+        """Renderer for band diagrams, reusing one figure for all of
+        them.
+
+        :param figure_size: the figure size in inches. Default:
+        defaults.fig_size
+        :param dpi: the resolution of raster output. Default:
+        matplotlib's savefig.dpi setting.
+
+        """
+        self.figure = Figure(figsize=figure_size or defaults.fig_size)
+        FigureCanvasAgg(self.figure)
+        self.dpi = dpi
+        # the modes and the shapes of the band data of the current
+        # figure layout:
+        self._layout = None
+        self._ax = None
+        # the band lines of each mode:
+        self._lines = dict()
+        self._colors = dict()
+        # artists that are removed before the next diagram is drawn:
+        self._extras = []
+
+    def _build(self, layout, modes, datas):
+        """(Re)create the axes and lines for a new layout."""
+        self.figure.clf()
+        self._ax = self.figure.add_subplot(111)
+        self._ax.set_ylabel(defaults.default_y_axis_label, size='x-large')
+        self._ax.grid(True)
+        self._lines = dict()
+        self._colors = dict()
+        self._extras = []
+        colors = cycle(band_colors)
+        for mode, data in zip(modes, datas):
+            color = next(colors)
+            self._colors[mode] = color
+            self._lines[mode] = self._ax.plot(
+                data[:, 1], data[:, 5:], defaults.draw_bands_formatstr,
+                color=color, label=mode.upper(),
+                **defaults.draw_bands_kwargs)
+        if len(modes) > 1 or (len(modes) == 1 and modes[0] != ''):
+            self._ax.legend(
+                [self._lines[mode][0] for mode in modes],
+                [mode.upper() for mode in modes], loc='upper left')
+        self._title = self._ax.set_title('', size='x-large')
+        self._layout = layout
+        self._needs_layout = True
+
+    def render(
+            self, jobname, modes, formats=('png',), title='', crop_y=True,
+            x_axis_hint=defaults.default_x_axis_hint, band_gaps=True,
+            light_cone=False, filename=None):
+        """Draw the band diagram of a job and save it.
+
+        :param jobname: the path and jobname of the simulation; the band
+        data is loaded from jobname + '_' + mode + 'freqs.csv'.
+        :param modes: the list of modes of the simulation.
+        :param formats: the file formats (extensions) to save.
+        :param filename: the file name without extension. Default:
+        jobname + '_bands'
+        :return: the list of saved files.
+
+        See graphics.draw_bands for the other parameters.
+
+        """
+        datas = [
+            np.loadtxt('{0}_{1}freqs.csv'.format(jobname, mode),
+                       delimiter=',', skiprows=1, ndmin=2)
+            for mode in modes]
+        layout = (tuple(modes), tuple(d.shape for d in datas))
+        if layout != self._layout:
+            self._build(layout, modes, datas)
+        for artist in self._extras:
+            artist.remove()
+        self._extras = []
+
+        if isinstance(x_axis_hint, CustomAxisFormatter):
+            # don't change the supplied formatter:
+            x_axis_formatter = copy(x_axis_hint)
+        else:
+            x_axis_formatter = get_axis_formatter(x_axis_hint)
+        if x_axis_formatter._hover_func_is_default:
+            x_axis_formatter.set_hover_data(datas[0][:, 1:4])
+        kdata = datas[0][:, 1:5]
+        if defaults.correct_x_axis:
+            x_data = corrected_x_values(kdata)
+            tick_pos = x_axis_formatter.get_tick_positions()
+            if tick_pos.dtype.kind == 'i':
+                x_axis_formatter.tweak_tick_positions(x_data[tick_pos])
+            else:
+                x_data = np.arange(len(kdata))
+        else:
+            x_data = np.arange(len(kdata))
+
+        refr_index = 1 if isinstance(light_cone, bool) else light_cone
+        for mode, data in zip(modes, datas):
+            for line, band in zip(self._lines[mode], data[:, 5:].T):
+                line.set_data(x_data, band)
+            if band_gaps:
+                light_line = data[:, 4] / refr_index if light_cone else None
+                for gap in get_gap_bands(data[:, 5:], light_line=light_line):
+                    self._add_gap(
+                        x_data, gap[1], gap[2], self._colors[mode])
+        if (x_axis_formatter.get_longest_label_length() >
+                defaults.long_xticklabels_when_longer_than):
+            kwargs = defaults.long_xticklabels_kwargs
+        else:
+            kwargs = defaults.xticklabels_kwargs
+        x_axis_formatter.apply_to_axis(self._ax.get_xaxis(), **kwargs)
+        self._title.set_text(title)
+        self._set_limits(x_data, datas, crop_y)
+        if light_cone:
+            self._add_light_cone(x_data, kdata[:, 3] / refr_index)
+
+        if self._needs_layout:
+            # only calculate the layout once for each figure layout:
+            self.figure.tight_layout()
+            self._needs_layout = False
+        if filename is None:
+            filename = jobname + '_bands'
+        saved = []
+        for fmt in formats:
+            fname = '{0}.{1}'.format(filename, fmt)
+            self.figure.savefig(fname, format=fmt, dpi=self.dpi)
+            saved.append(fname)
+        return saved
+
+    def _add_gap(self, x_data, from_freq, to_freq, color):
+        if from_freq < 0 or to_freq <= 0:
+            return
+        left, right = x_data[0], x_data[-1]
+        self._extras.append(self._ax.add_patch(Polygon(
+            [(left, from_freq), (right, from_freq), (right, to_freq),
+             (left, to_freq)],
+            color=color, alpha=0.35, linewidth=0.5)))
+        center = (from_freq + to_freq) / 2
+        self._extras.append(self._ax.text(
+            (left + right) / 2, center,
+            defaults.default_gaptext.format(
+                (to_freq - from_freq) / center * 100),
+            horizontalalignment='center', verticalalignment='center'))
+
+    def _add_light_cone(self, x_data, light_line, color='gray', alpha=0.5):
+        fillto = 1.1 * max(light_line.max(), self._ax.get_ylim()[1])
+        self._extras.extend(self._ax.fill(
+            np.append(x_data, [x_data[-1], x_data[0]]),
+            np.append(light_line, [fillto, fillto]),
+            color=color, alpha=alpha))
+        self._extras.extend(
+            self._ax.plot(x_data, light_line, color=color))
+
+    def _set_limits(self, x_data, datas, crop_y):
+        banddata = np.hstack([data[:, 5:] for data in datas])
+        miny, maxy = banddata.min(), banddata.max()
+        if crop_y is True:
+            # crop to just below the last band (of all modes):
+            maxy = min(data[:, -1].min() for data in datas)
+        elif hasattr(crop_y, '__len__') and len(crop_y) == 2:
+            miny, maxy = crop_y
+        elif crop_y:
+            maxy = crop_y
+        # no padding, so the diagram does not change with the data:
+        self._ax.set_xlim(x_data[0], x_data[-1])
+        self._ax.set_ylim(miny, maxy)
+
+
+# the BandRenderer of each worker process of render_batch:
+_worker_renderer = None
+
+
+def _render_job(args):
+    """Render one job in a worker process of render_batch."""
+    global _worker_renderer
+    job, render_kwargs = args
+    if _worker_renderer is None:
+        _worker_renderer = BandRenderer(
+            render_kwargs.pop('figure_size', None),
+            render_kwargs.pop('dpi', None))
+    else:
+        render_kwargs.pop('figure_size', None)
+        render_kwargs.pop('dpi', None)
+    if isinstance(job, dict):
+        render_kwargs = dict(render_kwargs, **job)
+    else:
+        render_kwargs = dict(render_kwargs, jobname=job[0], modes=job[1])
+    try:
+        return _worker_renderer.render(**render_kwargs)
+    except Exception as err:
+        log.error('render_batch: could not render band diagram of {0}: '
+                  '{1}'.format(render_kwargs['jobname'], err))
+        return []
+
+
+def render_batch(jobs, processes=None, **render_kwargs):
+    """Render the band diagrams of all *jobs* with BandRenderers in
+    *processes* worker processes (default: number of processors; if 1,
+    render in this process).
+
+    :param jobs: a list of tuples (jobname, modes) (see
+    BandRenderer.render), or of dictionaries with keyword arguments of
+    BandRenderer.render, which take precedence over *render_kwargs*.
+    :param render_kwargs: keyword arguments for BandRenderer.render used
+    for all jobs, plus figure_size and dpi for the BandRenderers.
+    :return: a list with the lists of saved files of all jobs.
+
+    """
+    tasks = [(job, dict(render_kwargs)) for job in jobs]
+    if processes == 1:
+        return [_render_job(task) for task in tasks]
+    pool = Pool(processes)
+    try:
+        return pool.map(_render_job, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
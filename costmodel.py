@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Estimate wall time and memory of MPB simulations before running them.
+
+The work of MPB's eigensolver per k-vector scales roughly with
+N * b * (log2(N) + b), with N the number of grid points and b the number
+of bands (FFTs and orthogonalization). Initializing the dielectric
+function scales with N * mesh_size**dimensions. The wall time is
+assumed proportional to the total work, divided by
+num_processors**parallel_exponent. The proportionality constant can be
+calibrated with the durations written to the end of the .out files of
+previous simulations.
+
+The model is rough, but good enough to tell a job of minutes from a job
+of hours, and to pick the number of processors.
+
+"""
+
+from __future__ import division
+from os import path, walk
+import re
+import numpy as np
+from rasterize import grid_shape
+import defaults
+import log
+
+
+def work_units(grid_points, dimensions, numbands, num_solves, mesh_size):
+    """Return the amount of work (arbitrary units) of a simulation.
+
+    :param grid_points: total number of grid points.
+    :param dimensions: number of dimensions with more than 1 grid point.
+    :param numbands: number of bands.
+    :param num_solves: number of eigenproblems, i.e. the number of
+    k-vectors times the number of runs (modes).
+    :param mesh_size: MPB's mesh-size.
+
+    """
+    log2n = np.log2(max(grid_points, 2))
+    return grid_points * (
+        num_solves * numbands * (log2n + numbands) +
+        mesh_size ** dimensions)
+
+
+def parse_out_file(filename):
+    """Read the parameters and the duration of a finished simulation from
+    its .out file.
+
+    :return: a dictionary with the keys grid_points, dimensions,
+    numbands, num_solves, mesh_size, num_processors (None if not
+    recorded) and duration (seconds), or None if the file could not be
+    parsed (e.g. because the simulation did not finish).
+
+    """
+    try:
+        with open(filename, 'r') as f:
+            text = f.read()
+    except IOError:
+        return None
+
+    def find(pattern):
+        return re.search(pattern, text, re.MULTILINE)
+
+    duration = find(
+        r'^finished on: .*\(duration: (?:(\d+) days?, )?'
+        r'(\d+):(\d+):(\d+(?:\.\d*)?)\)')
+    grid = find(r'Grid size is (\d+) x (\d+) x (\d+)')
+    numbands = find(r'^\(set! num-bands (\d+)\)')
+    mesh_size = find(r'^\(set! mesh-size (\d+)\)')
+    if None in (duration, grid, numbands, mesh_size):
+        return None
+    procs = find(r'^Number of processors: (\d+)')
+
+    days, hours, minutes, seconds = duration.groups()
+    gridsize = [int(n) for n in grid.groups()]
+    return dict(
+        grid_points=int(np.prod(gridsize)),
+        dimensions=sum(1 for n in gridsize if n > 1),
+        numbands=int(numbands.group(1)),
+        # one line with frequencies per k-vector and run:
+        num_solves=len(re.findall(r'^\w*freqs:, \d', text, re.MULTILINE)),
+        mesh_size=int(mesh_size.group(1)),
+        num_processors=int(procs.group(1)) if procs else None,
+        duration=(int(days or 0) * 86400 + int(hours) * 3600 +
+                  int(minutes) * 60 + float(seconds)))
+
+
+def find_out_files(folder):
+    """Return a list of all .out files in *folder* and its subfolders."""
+    result = []
+    for dirpath, dirnames, filenames in walk(folder):
+        result.extend(
+            path.join(dirpath, f) for f in filenames if f.endswith('.out'))
+    return sorted(result)
+
+
+class CostModel(object):
+    def __init__(
+            self, seconds_per_work_unit=None, parallel_exponent=None,
+            memory_base=None, memory_blocks=None):
+        """Model for the wall time and memory of simulations. All
+        parameters default to the cost_* values in defaults.py.
+
+        :param seconds_per_work_unit: wall time per unit of work (see
+        work_units) on one processor. Use calibrate to determine it
+        from previous simulations.
+        :param parallel_exponent: the wall time scales with
+        num_processors**(-parallel_exponent).
+        :param memory_base: memory (bytes) of each MPB process without
+        the fields.
+        :param memory_blocks: number of complex (grid points x bands)
+        arrays stored by MPB.
+
+        """
+        if seconds_per_work_unit is None:
+            seconds_per_work_unit = defaults.cost_seconds_per_work_unit
+        if parallel_exponent is None:
+            parallel_exponent = defaults.cost_parallel_exponent
+        if memory_base is None:
+            memory_base = defaults.cost_memory_base
+        if memory_blocks is None:
+            memory_blocks = defaults.cost_memory_blocks
+        self.seconds_per_work_unit = seconds_per_work_unit
+        self.parallel_exponent = parallel_exponent
+        self.memory_base = memory_base
+        self.memory_blocks = memory_blocks
+
+    def calibrate(self, out_files, default_num_processors=2):
+        """Set seconds_per_work_unit to the median of the values found
+        for the finished simulations in *out_files* (list of .out file
+        names, or a folder that will be searched recursively).
+
+        :param default_num_processors: the number of processors assumed
+        for .out files that do not record it.
+        :return: the number of .out files used for calibration.
+
+        """
+        if not isinstance(out_files, (list, tuple)):
+            out_files = find_out_files(out_files)
+        values = []
+        for fname in out_files:
+            rec = parse_out_file(fname)
+            if rec is None or rec['num_solves'] == 0:
+                continue
+            work = work_units(
+                rec['grid_points'], rec['dimensions'], rec['numbands'],
+                rec['num_solves'], rec['mesh_size'])
+            procs = rec['num_processors'] or default_num_processors
+            values.append(
+                rec['duration'] * procs ** self.parallel_exponent / work)
+        if values:
+            self.seconds_per_work_unit = float(np.median(values))
+            log.info('cost model calibrated with {0} simulations: {1:.3g} '
+                     'seconds per work unit'.format(
+                        len(values), self.seconds_per_work_unit))
+        else:
+            log.warning('cost model: no finished simulations found for '
+                        'calibration, will keep the previous value.')
+        return len(values)
+
+    def estimate(self, sim, num_processors=1):
+        """Estimate wall time and memory of the Simulation *sim*.
+
+        :return: a dictionary with the keys wall_time (seconds), memory
+        (bytes, all processes together), memory_per_process (bytes),
+        grid_points and num_solves.
+
+        """
+        shape = grid_shape(sim.geometry, sim.resolution)
+        grid_points = int(np.prod(shape))
+        dimensions = sum(1 for n in shape if n > 1)
+        num_solves = (sim.kspace.count_interpolated() *
+                      max(len(sim.modes), 1))
+        work = work_units(
+            grid_points, dimensions, sim.numbands, num_solves,
+            sim.meshsize)
+        wall_time = (self.seconds_per_work_unit * work /
+                     num_processors ** self.parallel_exponent)
+        # complex arrays (16 bytes per value) of all bands, plus the
+        # epsilon tensor (6 doubles):
+        field_memory = grid_points * (
+            16 * sim.numbands * self.memory_blocks + 48)
+        memory_per_process = self.memory_base + field_memory / num_processors
+        return dict(
+            wall_time=wall_time,
+            memory=memory_per_process * num_processors,
+            memory_per_process=memory_per_process,
+            grid_points=grid_points,
+            num_solves=num_solves)
+
+    def fits(self, sim, num_processors=1, max_wall_time=None,
+             max_memory_per_process=None):
+        """Return True if the estimated wall time (seconds) and memory
+        per process (bytes) of *sim* do not exceed the given limits."""
+        est = self.estimate(sim, num_processors)
+        if max_wall_time is not None and est['wall_time'] > max_wall_time:
+            return False
+        if (max_memory_per_process is not None and
+                est['memory_per_process'] > max_memory_per_process):
+            return False
+        return True
+
+    def suggest_num_processors(
+            self, sim, max_wall_time, max_memory_per_process=None,
+            choices=(1, 2, 4, 8, 16, 32, 64)):
+        """Return the smallest number of processors in *choices* for
+        which *sim* fits the limits (see fits), or None if it does not
+        fit with any of them."""
+        for num in sorted(choices):
+            if self.fits(sim, num, max_wall_time, max_memory_per_process):
+                return num
+        return None
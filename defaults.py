@@ -106,6 +106,39 @@ field_output_folder_prefix = 'pngs'
 # were converted to png files:
 delete_h5_after_postprocessing = True
 
+# Parameters of the cost model (see costmodel.py), used to estimate the
+# wall time and memory of simulations before running them. They will be
+# replaced by values calibrated with finished simulations, if available:
+cost_seconds_per_work_unit = 2e-9
+# wall time scales with (number of processors)**(-cost_parallel_exponent):
+cost_parallel_exponent = 0.8
+# memory (bytes) of MPB per process, without fields:
+cost_memory_base = 50e6
+# number of (grid points x bands) complex arrays stored by the eigensolver:
+cost_memory_blocks = 12
+
+# If not None, structured events (job start/finish, external program
+# calls, post-processing stages, cache hits; see log.event) are appended
+# as JSON lines to this file. A relative path is relative to the
+# simulation folder:
+event_log_file = None
+
+# ctl files (and the geometry) bigger than this (number of characters)
+# are not written to the log, only their md5 hash and location:
+max_logged_ctl_size = 20000
+
+# If True, post-processing only rebuilds artifacts (csv files, epsilon png)
+# whose inputs changed since the last post-processing. The state is kept
+# in the following file in the simulation folder:
+incremental_post_processing = True
+artifact_registry_file = 'postprocess_artifacts.json'
+# The band ranges (_ranges.csv) of the simulations used for projected bands
+# are collected in this binary table in the folder containing them (e.g.
+# the folder of the unperturbed structure in the projected_bands_folder),
+# so post-processing a waveguide reads one file instead of one per k-vector
+# (see projectedbands.py):
+projected_bands_table_file = 'projected_bands_table.npz'
+
 
 def default_band_func(poi, outputfunc):
     """Return a string which will be supplied to (run %s) as a bandfunction.
@@ -175,6 +208,8 @@ draw_bands_formatstr = 'o-'
 # see :class:`~matplotlib.lines.Line2D` for details.):
 draw_bands_kwargs = {'linewidth' : 2}
 hide_band_gap = False;
+# the file formats in which Simulation.draw_bands saves band diagrams:
+draw_bands_formats = ('pdf', 'png')
 
 # default kwargs for the tick labels for the k-vec-axis of band diagrams:
 # (will be forwarded to underlying matplotlib.text.Text objects)
@@ -284,6 +319,15 @@ def default_onclick(event, bandplotter):
 # parts be on top of each other? Otherwise, they go next to each other:
 field_dist_vertical_cmplx_comps=True
 field_dist_filetype = 'pdf'
+# Number of threads decoding the field pattern pngs, and the maximum
+# memory (in bytes) used for decoded pngs kept in memory, so that
+# repeated distributions (e.g. with different k-vector selections) don't
+# decode them again. A png is decoded to up to 4 float32 values (RGBA)
+# per pixel, i.e. up to 16 bytes per pixel, e.g. 4 MB for a 512x512
+# pattern, so 256 MB hold 64 of these or about 4000 small (64x64)
+# patterns. Set to 0 to disable the cache:
+field_dist_loader_threads = 4
+field_dist_tile_cache_bytes = 256 * 2**20
 
 
 contour_lines = {'colors':'k',
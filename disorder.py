@@ -0,0 +1,313 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Ensembles of randomly disordered geometries (fabrication disorder).
+
+A DisorderEnsemble generates random realizations of a geometry, where
+the positions and radii of the rods are jittered. The realizations are
+created lazily from a seed, so they are reproducible and only one of
+them is kept in memory at a time when iterating over the ensemble. The
+realizations can be simulated in parallel with pipeline.run_pipelined,
+after which ensemble_statistics computes the statistics of the band
+edges.
+
+"""
+
+from __future__ import division
+from os import path
+import numpy as np
+from numpy import loadtxt
+from geometry import Geometry
+from objects import Rod, RodArray
+import log
+import pipeline
+
+
+def _rods_to_arrays(objects):
+    """Return a copy of the list *objects*, where all consecutive Rods
+    are combined to RodArrays (keeping the order, which matters for
+    overlapping objects) and all RodArrays are copied.
+
+    """
+    result = []
+    rods = []
+    for obj in objects + [None]:
+        if isinstance(obj, Rod):
+            rods.append(obj)
+            continue
+        if rods:
+            result.append(RodArray.from_rods(rods))
+            rods = []
+        if isinstance(obj, RodArray):
+            result.append(obj.copy())
+        elif obj is not None:
+            result.append(obj)
+    return result
+
+
+def perturb_geometry(
+        geometry, random_state, position_sigma=0, radius_sigma=0,
+        mask=None):
+    """Return a new Geometry, where the positions and radii of the rods
+    in *geometry* are randomly changed. *geometry* is not changed.
+
+    :param geometry: the unperturbed Geometry.
+    :param random_state: an integer seed or numpy.random.RandomState.
+    :param position_sigma: the standard deviation of the (normally
+    distributed) shifts in cartesian x and y, in units of the lattice
+    constant. The shifts are converted to the lattice coordinates of
+    the rods with the inverse of geometry.basis, so they are isotropic
+    also in supercells and triangular lattices.
+    :param radius_sigma: the standard deviation of the radius changes.
+    :param mask: index array or boolean mask selecting the rods to be
+    perturbed, counted over all rods of the geometry in order. If None,
+    all rods are perturbed.
+    :return: the perturbed Geometry, with the rods stored as RodArrays.
+
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    objects = _rods_to_arrays(geometry.objects)
+    basis = geometry.basis
+    arrays = [obj for obj in objects if isinstance(obj, RodArray)]
+    if mask is not None:
+        total = sum(len(a) for a in arrays)
+        selected = np.zeros(total, dtype=bool)
+        selected[mask] = True
+    start = 0
+    for array in arrays:
+        submask = None
+        if mask is not None:
+            submask = selected[start:start + len(array)]
+        start += len(array)
+        array.perturb(
+            position_sigma, radius_sigma, mask=submask,
+            random_state=random_state, basis=basis)
+
+    result = Geometry(
+        width=geometry.width, height=geometry.height, objects=objects,
+        depth=geometry.depth, triangular=geometry.triangular)
+    result.substrate_index = geometry.substrate_index
+    return result
+
+
+class DisorderEnsemble(object):
+    def __init__(
+            self, geometry, num_realizations, seed=0, position_sigma=0,
+            radius_sigma=0, mask=None):
+        """An ensemble of *num_realizations* random realizations of
+        *geometry* (e.g. the geometry of a simulation created by
+        TriHoles2D or TriHoles2D_Waveguide with runmode='', or made from
+        the rods of get_triangular_phc_waveguide_air_rods).
+
+        The realizations are generated on demand (see realization and
+        iteration over the ensemble). Each realization has its own
+        random state derived from *seed* and its index, so a realization
+        is always the same, independent of which other realizations were
+        generated before.
+
+        See perturb_geometry for position_sigma, radius_sigma and mask.
+
+        """
+        self.geometry = geometry
+        self.num_realizations = num_realizations
+        self.seed = seed
+        self.position_sigma = position_sigma
+        self.radius_sigma = radius_sigma
+        self.mask = mask
+
+    def __len__(self):
+        return self.num_realizations
+
+    def realization(self, index):
+        """Return the Geometry of realization number *index*."""
+        if not 0 <= index < self.num_realizations:
+            raise IndexError(
+                'realization index {0} out of range'.format(index))
+        return perturb_geometry(
+            self.geometry,
+            np.random.RandomState([self.seed, index]),
+            position_sigma=self.position_sigma,
+            radius_sigma=self.radius_sigma,
+            mask=self.mask)
+
+    def __iter__(self):
+        for index in range(self.num_realizations):
+            yield self.realization(index)
+
+    def get_jobname(self, jobname, index):
+        return '{0}_dis{1:04d}'.format(jobname, index)
+
+    def run(
+            self, sim, num_processors=2, containing_folder=None,
+            skip_existing=True, mpb_workers=1, post_workers=1):
+        """Simulate all realizations, as jobs of pipeline.run_pipelined.
+
+        :param sim: a Simulation object (e.g. returned by TriHoles2D
+        with runmode=''), which is used as template for all parameters
+        except the geometry. It is not run itself.
+        :param num_processors: number of processors used by MPB for each
+        realization.
+        :param containing_folder: the folder which will contain the
+        subfolders of all realizations. Default: the parent folder of
+        *sim*'s working directory.
+        :param skip_existing: if True, realizations for which csv files
+        with frequencies exist already (e.g. from an earlier, aborted
+        batch) are not simulated again.
+        :param mpb_workers: the number of realizations simulated at the
+        same time (see pipeline.run_pipelined).
+        :param post_workers: the number of realizations post-processed
+        at the same time.
+        :return: a list with the working directories of all
+        realizations, to be used with ensemble_statistics.
+
+        """
+        # only needed for running the ensemble, not for the statistics:
+        from simulation import Simulation
+        if containing_folder is None:
+            containing_folder = path.dirname(sim.workingdir)
+        folders = []
+        jobs = []
+        for index in range(self.num_realizations):
+            jobname = self.get_jobname(sim.jobname, index)
+            folder = path.join(containing_folder, jobname)
+            folders.append(folder)
+            if skip_existing and all(
+                    path.isfile(path.join(
+                        folder, '{0}_{1}freqs.csv'.format(jobname, mode)))
+                    for mode in sim.modes):
+                log.info('disorder ensemble: skipping realization {0}, '
+                         'results exist already.'.format(index))
+                continue
+
+            realization = Simulation(
+                jobname=jobname,
+                geometry=self.realization(index),
+                kspace=sim.kspace,
+                resolution=sim.resolution,
+                mesh_size=sim.meshsize,
+                numbands=sim.numbands,
+                initcode=sim.initcode,
+                runcode=sim.runcode,
+                postcode=sim.postcode,
+                work_in_subfolder=folder,
+                clear_subfolder=True,
+                quiet=sim.quiet)
+            # close the log file of this realization, the workers of the
+            # pipeline continue logging to it:
+            log.reset_logger()
+            jobs.append(_RealizationJob(realization, num_processors))
+
+        log.info('disorder ensemble: running {0} of {1} '
+                 'realizations'.format(len(jobs), self.num_realizations))
+        results = pipeline.run_pipelined(
+            jobs, mpb_workers=mpb_workers, post_workers=post_workers)
+        for job, (retcode, post_processed) in zip(jobs, results):
+            if retcode != 0 or not post_processed:
+                log.error('disorder ensemble: realization {0} '
+                          'failed.'.format(job.jobname))
+        return folders
+
+
+class _RealizationJob(pipeline.Job):
+    """A pipeline.Job for a realization of a DisorderEnsemble, which is
+    only post-processed as far as needed for ensemble_statistics."""
+
+    def post_process(self):
+        self.sim.post_process(convert_field_patterns=False)
+        return True
+
+
+class EnsembleStatistics(object):
+    def __init__(self, threshold=5e-4):
+        """Accumulate statistics of the band edges of many realizations,
+        without keeping the band data of all realizations in memory.
+
+        Gaps smaller than *threshold* count as closed.
+
+        """
+        self.threshold = threshold
+        self.count = 0
+        self._mean = None
+        self._m2 = None
+        self._open = None
+
+    def add(self, banddata):
+        """Add the band data of a realization (array with shape
+        (number_of_k_vecs, number_of_bands))."""
+        # band edges, rows: min, max:
+        edges = np.array([banddata.min(axis=0), banddata.max(axis=0)])
+        gap_open = edges[0, 1:] - edges[1, :-1] > self.threshold
+        if self.count == 0:
+            self._mean = np.zeros_like(edges)
+            self._m2 = np.zeros_like(edges)
+            self._open = np.zeros(gap_open.shape, dtype=int)
+        elif edges.shape != self._mean.shape:
+            log.warning('EnsembleStatistics: number of bands changed, '
+                        'will ignore realization.')
+            return
+        # Welford's algorithm:
+        self.count += 1
+        delta = edges - self._mean
+        self._mean += delta / self.count
+        self._m2 += delta * (edges - self._mean)
+        self._open += gap_open
+
+    def get_mean_band_edges(self):
+        """Return the mean band edges, an array with shape
+        (2, number_of_bands) with the mean minimum and maximum frequency
+        of each band."""
+        return self._mean
+    mean_band_edges = property(get_mean_band_edges)
+
+    def get_band_edge_variance(self):
+        """Return the (sample) variance of the band edges, same shape as
+        mean_band_edges."""
+        if self.count < 2:
+            return np.zeros_like(self._mean)
+        return self._m2 / (self.count - 1)
+    band_edge_variance = property(get_band_edge_variance)
+
+    def get_gap_closure_probability(self):
+        """Return an array with number_of_bands - 1 entries; entry i is
+        the fraction of realizations, in which there is no gap between
+        band i+1 and i+2 (first band is band 1)."""
+        return 1 - self._open / self.count
+    gap_closure_probability = property(get_gap_closure_probability)
+
+
+def ensemble_statistics(folders, mode, threshold=5e-4):
+    """Load the band data of all realizations in *folders* (as returned
+    by DisorderEnsemble.run) for the *mode* and return an
+    EnsembleStatistics object. Missing results are skipped with a
+    warning.
+
+    """
+    stats = EnsembleStatistics(threshold=threshold)
+    for folder in folders:
+        jobname = path.basename(path.normpath(folder))
+        fname = path.join(folder, '{0}_{1}freqs.csv'.format(jobname, mode))
+        if not path.isfile(fname):
+            log.warning('ensemble_statistics: {0} not found, will skip '
+                        'this realization.'.format(fname))
+            continue
+        data = loadtxt(fname, delimiter=',', skiprows=1, ndmin=2)
+        stats.add(data[:, 5:])
+    return stats
@@ -0,0 +1,364 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Gap maps: the band gaps of many simulations versus their parameters.
+
+A GapMap collects the band edges (minimum and maximum frequency of each
+band) of a set of simulations, e.g. of a sweep over radius, material and
+thickness, for one or more modes. The parameters of each simulation are
+parsed from its jobname (see parse_jobname), which is the name of its
+folder. The band edges are cached in a json file, so after adding new
+simulations to a sweep only those new simulations are loaded:
+
+    gmap = GapMap('sweep/gapmap.json')
+    gmap.update(find_simulations('sweep'), modes=['te', 'tm'])
+    draw_gap_map(gmap, 'radius', filename='sweep/gapmap.pdf')
+
+The gaps of all simulations are then computed at once on the stacked
+band edges.
+
+"""
+
+from __future__ import division
+from os import path, listdir
+import re
+import json
+import numpy as np
+import matplotlib.pyplot as plt
+from artifacts import file_signature
+from utility import get_band_edges
+import defaults
+import log
+
+# the parameters encoded in the jobnames of phc_simulations, each a
+# token of the jobname, a letter followed by the value times 1000, e.g.
+# TriHolesSlab_SiN_r300_t200 (see parse_jobname):
+jobname_parameters = {'r': 'radius', 't': 'thickness'}
+
+# colors of the gaps of each mode:
+gap_colors = {'te': 'tab:red', 'tm': 'tab:blue', '': 'tab:gray',
+              'zeven': 'tab:red', 'zodd': 'tab:blue',
+              'yeven': 'tab:orange', 'yodd': 'tab:green'}
+
+
+# a parameter token of a jobname (see jobname_parameters):
+_parameter_token = re.compile(r'^([a-z])(\d+)$')
+
+
+def parse_jobname(jobname):
+    """Return a dictionary with the parameters encoded in the *jobname*
+    of a simulation created with phc_simulations, e.g.
+    {'material': 'SiN', 'radius': 0.3, 'thickness': 0.2} for
+    'TriHolesSlab_SiN_r300_t200'.
+
+    The parameters are the consecutive tokens matching
+    jobname_parameters, starting with the first one; the material is the
+    token before them (not the first token, which is the structure).
+    All other tokens, e.g. W1 or a job_name_suffix, are skipped.
+
+    """
+    tokens = jobname.split('_')
+    params = dict()
+    for i, token in enumerate(tokens):
+        match = _parameter_token.match(token)
+        if match is None or match.group(1) not in jobname_parameters:
+            if params:
+                # end of the parameters, e.g. a job_name_suffix:
+                break
+            continue
+        if not params and i > 1:
+            params['material'] = tokens[i - 1]
+        params[jobname_parameters[match.group(1)]] = (
+            int(match.group(2)) / 1000)
+    return params
+
+
+def _freqs_file(folder, mode):
+    jobname = path.basename(path.normpath(folder))
+    return path.join(folder, '{0}_{1}freqs.csv'.format(jobname, mode))
+
+
+def find_simulations(folder, modes=('te', 'tm', '')):
+    """Return the (sorted) subfolders of *folder* containing the band
+    data of at least one of the *modes*."""
+    found = []
+    for name in sorted(listdir(folder)):
+        sub = path.join(folder, name)
+        if path.isdir(sub) and any(
+                path.isfile(_freqs_file(sub, mode)) for mode in modes):
+            found.append(sub)
+    return found
+
+
+class GapMap(object):
+    def __init__(self, cache_file=None, light_line=False):
+        """The band edges of many simulations.
+
+        :param cache_file: the json file where the band edges are cached
+        (nothing is cached if None).
+        :param light_line: if True, band frequencies above the light line
+        (the kmag column of the band data) are ignored, as for slabs.
+
+        """
+        self.cache_file = cache_file
+        self.light_line = light_line
+        # entries of each simulation (keyed by folder), each a dictionary
+        # with the parameters and, per mode, the csv file signature and
+        # the band edges:
+        self._points = dict()
+        if cache_file is not None and path.isfile(cache_file):
+            try:
+                with open(cache_file, 'r') as f:
+                    cache = json.load(f)
+                if cache.get('light_line') == light_line:
+                    self._points = cache['points']
+            except ValueError:
+                log.warning('could not read gap map cache {0}, will '
+                            'reload all simulations.'.format(cache_file))
+
+    def update(self, folders, modes=('te', 'tm'), parameters=None):
+        """Add the simulations in *folders* for the *modes*. Only new
+        simulations or simulations whose band data changed since the last
+        update are loaded. Simulations not in *folders* are removed.
+
+        :param parameters: a function returning the parameters
+        (dictionary) of a simulation from its jobname. Default:
+        parse_jobname.
+
+        """
+        if parameters is None:
+            parameters = parse_jobname
+        points = dict()
+        loaded = 0
+        for folder in folders:
+            key = path.abspath(folder)
+            old = self._points.get(key, dict(modes=dict()))
+            point = dict(
+                params=parameters(path.basename(path.normpath(folder))),
+                modes=dict())
+            for mode in modes:
+                fname = _freqs_file(folder, mode)
+                sig = file_signature(fname)
+                entry = old['modes'].get(mode)
+                if entry is None or entry['signature'] != sig:
+                    entry = self._load(fname, sig)
+                    loaded += entry is not None
+                if entry is not None:
+                    point['modes'][mode] = entry
+            points[key] = point
+        self._points = points
+        log.info('gap map: loaded band data of {0} simulations, {1} '
+                 'cached.'.format(loaded, len(points) - loaded))
+        self.save()
+
+    def _load(self, fname, signature):
+        if not path.isfile(fname):
+            return None
+        data = np.loadtxt(fname, delimiter=',', skiprows=1, ndmin=2)
+        minfreqs, maxfreqs = get_band_edges(
+            data[:, 5:], light_line=data[:, 4] if self.light_line else None)
+        return dict(signature=signature,
+                    min=minfreqs.tolist(), max=maxfreqs.tolist())
+
+    def save(self):
+        if self.cache_file is None:
+            return
+        with open(self.cache_file, 'w') as f:
+            json.dump(dict(light_line=self.light_line, points=self._points),
+                      f, indent=1, sort_keys=True)
+
+    def __len__(self):
+        return len(self._points)
+
+    def get_folders(self):
+        """Return the folders of all simulations, in the order of all
+        arrays returned by the other methods."""
+        return sorted(self._points)
+    folders = property(get_folders)
+
+    def get_modes(self):
+        """Return the (sorted) modes of which band data was loaded."""
+        modes = set()
+        for point in self._points.values():
+            modes.update(point['modes'])
+        return sorted(modes)
+    modes = property(get_modes)
+
+    def get_parameter_dicts(self):
+        """Return a list with the parameters (dictionary) of each
+        simulation."""
+        return [self._points[key]['params'] for key in self.folders]
+
+    def get_parameters(self, name):
+        """Return an array with the value of parameter *name* of each
+        simulation (NaN or None where the parameter is unknown)."""
+        values = [params.get(name) for params in self.get_parameter_dicts()]
+        try:
+            return np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            return np.array(values, dtype=object)
+
+    def get_band_edges(self, mode):
+        """Return the band edges of *mode*, array with shape
+        (number of simulations, 2, max. number of bands) with the minimum
+        (row 0) and maximum (row 1) frequency of each band. Missing bands
+        and bands above the light line are NaN."""
+        entries = [self._points[key]['modes'].get(mode)
+                   for key in self.folders]
+        numbands = max([len(e['min']) for e in entries if e] + [0])
+        edges = np.full((len(entries), 2, numbands), np.nan)
+        for i, e in enumerate(entries):
+            if e:
+                edges[i, 0, :len(e['min'])] = e['min']
+                edges[i, 1, :len(e['max'])] = e['max']
+        # get_band_edges marks bands above the light line with -1:
+        edges[edges < 0] = np.nan
+        return edges
+
+    def get_gaps(self, mode, threshold=5e-4):
+        """Return the gaps of *mode* between all consecutive bands of all
+        simulations.
+
+        :return: a tuple of arrays with shape (number of simulations,
+        max. number of bands - 1): the lower and upper frequency of the
+        gap above each band and its normalized width
+        (2 * (upper - lower) / (upper + lower)). The width is zero where
+        there is no gap, i.e. where the gap is smaller than *threshold*.
+
+        """
+        edges = self.get_band_edges(mode)
+        lower = edges[:, 1, :-1]
+        upper = edges[:, 0, 1:]
+        with np.errstate(invalid='ignore'):
+            is_gap = upper - lower > threshold
+        width = np.zeros_like(lower)
+        width[is_gap] = (2 * (upper - lower) / (upper + lower))[is_gap]
+        return lower, upper, width
+
+    def get_largest_gap(self, mode, threshold=5e-4):
+        """Return the number of the band below the largest gap (first
+        band is band 1; 0 if there is no gap) and the width of the gap,
+        for each simulation."""
+        width = self.get_gaps(mode, threshold)[2]
+        if not width.shape[1]:
+            return np.zeros(len(width), dtype=int), np.zeros(len(width))
+        index = np.argmax(width, axis=1)
+        largest = width[np.arange(len(width)), index]
+        return np.where(largest > 0, index + 1, 0), largest
+
+
+def draw_gap_map(
+        gapmap, x_param, modes=None, select=None, threshold=5e-4,
+        band_edges=True, crop_y=None, filename=None, show=False):
+    """Draw the classic gap map: the band edges and the filled gaps
+    versus the (numerical) parameter *x_param* of the simulations in
+    *gapmap*. If the simulations differ in other parameters than
+    *x_param*, one diagram (with shared axes) is drawn for each
+    combination of them.
+
+    :param modes: the modes to draw (default: all modes of *gapmap*).
+    The gaps of the modes are drawn semi-transparently in different
+    colors (see gap_colors), so complete gaps are where they overlap.
+    :param select: a dictionary with parameter values; only the
+    simulations with these parameters are drawn.
+    :param band_edges: if True, draw the band edges as thin lines.
+    :param crop_y: the maximum frequency, or a 2-tuple (min, max).
+    :return: the figure.
+
+    """
+    if modes is None:
+        modes = gapmap.modes
+    if select is None:
+        select = dict()
+    x = gapmap.get_parameters(x_param).astype(float)
+    mask = ~np.isnan(x)
+    for name, value in select.items():
+        mask &= gapmap.get_parameters(name) == value
+
+    # group the simulations by the other parameters:
+    all_params = gapmap.get_parameter_dicts()
+    names = set()
+    for params in all_params:
+        names.update(params)
+    names = sorted(names - set([x_param]) - set(select))
+    groups = dict()
+    for i in np.nonzero(mask)[0]:
+        group = tuple((name, all_params[i].get(name)) for name in names)
+        groups.setdefault(group, []).append(i)
+    groups = [(g, groups[g]) for g in sorted(groups, key=str)] or [((), [])]
+
+    ncols = int(np.ceil(np.sqrt(len(groups))))
+    nrows = int(np.ceil(len(groups) / ncols))
+    fig, axes = plt.subplots(
+        nrows, ncols, sharex=True, sharey=True, squeeze=False,
+        figsize=defaults.fig_size if len(groups) == 1 else
+        (4 * ncols, 3 * nrows))
+    data = dict((mode, (gapmap.get_band_edges(mode),
+                        gapmap.get_gaps(mode, threshold)))
+                for mode in modes)
+    for ax, (group, indexes) in zip(axes.flat, groups):
+        indexes = np.array(indexes, dtype=int)
+        indexes = indexes[np.argsort(x[indexes])]
+        xs = x[indexes]
+        for mode in modes:
+            color = gap_colors.get(mode, 'tab:gray')
+            edges, (lower, upper, width) = data[mode]
+            if band_edges:
+                ax.plot(xs, edges[indexes, 0], color=color, lw=0.5)
+                ax.plot(xs, edges[indexes, 1], color=color, lw=0.5)
+            for gap in range(width.shape[1]):
+                is_gap = width[indexes, gap] > 0
+                if not is_gap.any():
+                    continue
+                ax.fill_between(
+                    xs, lower[indexes, gap], upper[indexes, gap],
+                    where=is_gap, color=color, alpha=0.4, lw=0,
+                    label=mode.upper() or None)
+        if group:
+            ax.set_title(', '.join('{0}={1}'.format(*p) for p in group),
+                         size='small')
+        ax.grid(True)
+    for ax in axes.flat[len(groups):]:
+        ax.set_visible(False)
+
+    ax = axes.flat[0]
+    if hasattr(crop_y, '__len__') and len(crop_y) == 2:
+        ax.set_ylim(*crop_y)
+    elif crop_y:
+        ax.set_ylim(top=crop_y)
+    for ax in axes[-1]:
+        ax.set_xlabel(x_param)
+    for ax in axes[:, 0]:
+        ax.set_ylabel(defaults.default_y_axis_label)
+    # one legend entry per mode:
+    handles, labels = axes.flat[0].get_legend_handles_labels()
+    unique = dict(zip(labels, handles))
+    if unique:
+        axes.flat[0].legend(unique.values(), unique.keys(), loc='best')
+
+    if filename:
+        fig.savefig(filename, bbox_inches='tight')
+        log.info('saved gap map to {0}'.format(filename))
+    if show:
+        plt.show(block=show == 'block')
+    elif filename:
+        plt.close(fig)
+    return fig
@@ -13,9 +13,11 @@
     #along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import division
+import numpy as np
 import objects
 import log
 from objects import *
+from scheme import scheme_to_float
 
 class Geometry(object):
     def __init__(
@@ -73,6 +75,37 @@ class Geometry(object):
                 (self.width, self.height, self.depth)
             
     lattice = property(get_lattice)
+
+
+    def get_basis(self):
+        """Return the lattice vectors in cartesian coordinates (rows of a
+        3x3-array), i.e. the basis vectors scaled by the lattice size, as
+        used by MPB. A dimension with 'no-size' is treated like size 1.
+
+        """
+        sizes = np.array([
+            1.0 if s == 'no-size' else scheme_to_float(s)
+            for s in [self.width, self.height, self.depth]])
+        if self.triangular:
+            basis = np.array([
+                (np.sqrt(3) / 2, 0.5, 0),
+                (np.sqrt(3) / 2, -0.5, 0),
+                (0, 0, 1)])
+        else:
+            basis = np.identity(3)
+        return basis * sizes[:, np.newaxis]
+
+    basis = property(get_basis)
+
+
+    def get_reciprocal_basis(self):
+        """Return the reciprocal lattice vectors (in units of 2 pi) in
+        cartesian coordinates (rows of a 3x3-array).
+
+        """
+        return np.linalg.inv(self.get_basis()).transpose()
+
+    reciprocal_basis = property(get_reciprocal_basis)
     
 ##    def get_max_epsilon(self):
 ##        return max(a.material.epsilon for a in self.objects)
@@ -89,8 +122,53 @@ class Geometry(object):
 ##        %a.__dict__ for a in self.objects)+'}]')
 
 
+    def get_objects_ctl(self):
+        """Return the ctl representation of all geometric objects, i.e.
+        the contents of MPB's geometry list.
+
+        ObjectArrays cache their representation, so they are only
+        rendered again if they changed in the meantime.
+
+        """
+        return ''.join([str(a) for a in self.objects])
+
+    objects_ctl = property(get_objects_ctl)
+
+
+    def get_centers(self):
+        """Return the centers of all geometric objects as a numpy array
+        with shape (number_of_objects, 3), in lattice coordinates.
+        Scheme expressions (e.g. '(* 3 (sqrt 3))') are evaluated.
+
+        """
+        centers = [np.zeros((0, 3))]
+        for a in self.objects:
+            if isinstance(a, ObjectArray):
+                centers.append(a.centers)
+            else:
+                centers.append(np.array(
+                    [[scheme_to_float(c) for c in (a.x, a.y, a.z)]]))
+        return np.concatenate(centers)
+
+    centers = property(get_centers)
+
+
+    def get_all_objects(self):
+        """Return a list of all geometric objects, where object arrays
+        (e.g. RodArray) are replaced by their individual objects.
+
+        """
+        result = []
+        for a in self.objects:
+            if isinstance(a, ObjectArray):
+                result.extend(a.to_objects())
+            else:
+                result.append(a)
+        return result
+
+
     def __str__(self):
-        return '(list' + ''.join(str(a) for a in self.objects) + ')'
+        return '(list' + self.get_objects_ctl() + ')'
 
 
     def __repr__(self):
@@ -15,7 +15,6 @@
 from __future__ import division
 import matplotlib.pyplot as plt
 #from pylab import figure,show,linspace,savefig,text,griddata,plot,contour,clf,clabel,colorbar
-from matplotlib.mlab import griddata
 from matplotlib.patches import Ellipse
 from matplotlib.text import Text
 import numpy as np
@@ -26,6 +25,7 @@ from defaults import fig_size, contour_lines, contour_filled, contour_plain,\
     colorbar_style, default_x_axis_hint
 from kspace import KSpace
 from bandplotter import BandPlotter
+import bandtracking
 import axis_formatter
 import objects
 import log
@@ -56,7 +56,7 @@ def draw_geometry(
     
     graphic_objs = (
         [drawing_dict[obj.__class__](index, obj, anisotropic_component) 
-            for index,obj in enumerate(geometry.objects)])
+            for index,obj in enumerate(geometry.get_all_objects())])
     for graph in graphic_objs:
         for elem in graph:
             ax.add_artist(elem)
@@ -96,39 +96,148 @@ def draw_rod(index, rod, anisotropic_component=0):
             va='center',
             family='sans-serif'))
 
+def load_band_surfaces(jobname, mode, kspace):
+    """Load the band data of all bands of *mode* calculated on a
+    KSpaceRectangularGrid *kspace*, without any interpolation.
+
+    :return: a tuple (kx, ky, freqs); the k_x (k_y) values of the grid
+    columns (rows) and an array with shape
+    (number_of_bands, kspace.y_steps, kspace.x_steps) with the
+    frequencies.
+
+    """
+    data = loadtxt(
+        "{0}_{1}freqs.csv".format(jobname, mode),
+        delimiter=',', skiprows=1, ndmin=2)
+    nx, ny = kspace.x_steps, kspace.y_steps
+    if len(data) != nx * ny:
+        raise ValueError(
+            'load_band_surfaces: number of k-vectors ({0}) does not match '
+            'the grid size {1}x{2}.'.format(len(data), nx, ny))
+    # k_x varies fastest (see KSpaceRectangularGrid), so the bands can
+    # just be reshaped to the grid:
+    freqs = data[:, 5:].T.reshape(-1, ny, nx)
+    return data[:nx, 1], data[::nx, 2], freqs
+
+
+def _draw_band_surface(
+        ax, kx, ky, freqs, filled=True, levels=15, lines=False,
+        labeled=False, legend=False):
+    """Draw the contour map of the band *freqs* (shape (len(ky), len(kx)))
+    to the axes *ax*."""
+    if filled:
+        cs = ax.contourf(kx, ky, freqs, levels, **contour_filled)
+        legend and ax.figure.colorbar(cs, ax=ax, **colorbar_style)
+        cs = lines and ax.contour(kx, ky, freqs, levels, **contour_lines)
+        labeled and lines and ax.clabel(cs, fontsize=8, inline=1)
+    else:
+        cs = ax.contour(kx, ky, freqs, levels, **contour_plain)
+        legend and ax.figure.colorbar(cs, ax=ax, **colorbar_style)
+        labeled and ax.clabel(cs, fontsize=8, inline=1)
+    ax.set_xlim(kx[0], kx[-1])
+    ax.set_ylim(ky[0], ky[-1])
+
+
 def draw_bandstructure_2D(
         jobname, mode, kspace, band, ext='.csv', format='pdf', filled=True,
-        levels=15, lines=False, labeled=False, legend=False):
-    """Draw 2D band contour map of one band."""
-    #clf()
+        levels=15, lines=False, labeled=False, legend=False, show=False,
+        block=True):
+    """Draw 2D band contour map of one band.
+
+    The figure is saved to jobname_<mode>band<band>.<format>. Only show
+    it if *show*, otherwise it is closed (e.g. in batch runs).
+    See draw_band_surfaces for drawing all bands at once.
+
+    *ext* is ignored; the band data is always read from the
+    <mode>freqs.csv file written by post_process. It is only kept for
+    calls with positional arguments.
+
+    """
+    if not hasattr(kspace, 'x_steps') or not hasattr(kspace, 'y_steps'):
+        log.error('draw_bandstructure_2D: the k-space must be created by '
+                  'KSpaceRectangularGrid.')
+        return
+    kx, ky, freqs = load_band_surfaces(jobname, mode, kspace)
     fig = plt.figure(figsize=fig_size)
     ax = fig.add_subplot(111, aspect='equal')
-    x, y, z = loadtxt(
-        "{0}_{1}{2}".format(jobname, mode, ext),
-        delimiter=', ',
-        skiprows=1,
-        usecols=(1, 2, 4 + band),
-        unpack=True)
-    if hasattr(kspace, 'x_steps') and hasattr(kspace, 'y_steps'):
-        # KSpace was created by KSpaceRectangularGrid
-        xi = np.linspace(-0.5, 0.5, kspace.x_steps)
-        yi = np.linspace(-0.5, 0.5, kspace.y_steps)
-        zi = griddata(x, y, z, xi, yi, interp='linear')
-        if filled:
-            cs = ax.contourf(xi, yi, zi, levels, **contour_filled)
-            legend and plt.colorbar(cs, **colorbar_style)
-            cs = lines and ax.contour(xi, yi, zi, levels, **contour_lines)
-            labeled and lines and plt.clabel(cs, fontsize=8, inline=1)
-        else:
-            cs = ax.contour(xi, yi, zi, levels, **contour_plain)
-            legend and plt.colorbar(cs, **colorbar_style)
-            labeled and plt.clabel(cs, fontsize=8, inline=1)
-        ax.set_xlim(-0.5, 0.5)
-        ax.set_ylim(-0.5, 0.5)
+    _draw_band_surface(
+        ax, kx, ky, freqs[band - 1], filled=filled, levels=levels,
+        lines=lines, labeled=labeled, legend=legend)
+    fig.savefig('{0}_{1}band{2:02d}.{3}'.format(jobname, mode, band, format),
+                format=format, transparent=True)
+    if show:
+        plt.show(block=block)
     else:
-        plt.plot(x, y, z)
-    plt.savefig(jobname,format=format,transparent=True)
-    plt.show()
+        plt.close(fig)
+
+
+def draw_band_surfaces(
+        jobname, modes, kspace, bands=None, format='pdf', filled=True,
+        levels=15, lines=False, labeled=False, legend=False,
+        stacked=False, show=False, block=True):
+    """Draw the 2D band contour maps of all *bands* (list of band
+    numbers, first band is band 1; default: all bands) of all *modes*
+    in one figure, one row for each mode, and save it to
+    jobname_bandsurfaces.<format>.
+
+    The band data of each mode is loaded only once, and, because the
+    data was calculated on a KSpaceRectangularGrid *kspace*, is reshaped
+    to the grid without interpolation.
+
+    If *stacked*, the bands of each mode are drawn as stacked surfaces
+    in one 3D diagram instead of contour maps.
+    Only show the figure if *show*, otherwise it is closed, so this can
+    be used headless in batch runs.
+
+    """
+    if not hasattr(kspace, 'x_steps') or not hasattr(kspace, 'y_steps'):
+        log.error('draw_band_surfaces: the k-space must be created by '
+                  'KSpaceRectangularGrid.')
+        return
+    data = [load_band_surfaces(jobname, mode, kspace) for mode in modes]
+    if bands is None:
+        bands = range(1, max(d[2].shape[0] for d in data) + 1)
+    bands = list(bands)
+
+    if stacked:
+        from mpl_toolkits.mplot3d import Axes3D
+        fig = plt.figure(figsize=(fig_size[0], fig_size[1] * len(modes)))
+        for i, (mode, (kx, ky, freqs)) in enumerate(zip(modes, data)):
+            ax = fig.add_subplot(len(modes), 1, i + 1, projection='3d')
+            kxi, kyi = np.meshgrid(kx, ky)
+            for band in bands:
+                if band <= len(freqs):
+                    ax.plot_surface(kxi, kyi, freqs[band - 1],
+                                    cmap='viridis', alpha=0.8,
+                                    linewidth=0)
+            ax.set_title(mode.upper())
+            ax.set_xlabel('$k_x$')
+            ax.set_ylabel('$k_y$')
+            ax.set_zlabel(defaults.default_y_axis_label)
+    else:
+        fig, axes = plt.subplots(
+            len(modes), len(bands), sharex=True, sharey=True,
+            squeeze=False, subplot_kw=dict(aspect='equal'),
+            figsize=(3 * len(bands), 3 * len(modes)))
+        for row, (mode, (kx, ky, freqs)) in zip(axes, zip(modes, data)):
+            for ax, band in zip(row, bands):
+                if band > len(freqs):
+                    ax.set_visible(False)
+                    continue
+                _draw_band_surface(
+                    ax, kx, ky, freqs[band - 1], filled=filled,
+                    levels=levels, lines=lines, labeled=labeled,
+                    legend=legend)
+                ax.set_title('{0} band {1}'.format(mode.upper(), band),
+                             size='small')
+
+    fig.savefig('{0}_bandsurfaces.{1}'.format(jobname, format),
+                format=format, transparent=True)
+    if show:
+        plt.show(block=block)
+    else:
+        plt.close(fig)
+    return fig
 
 def draw_bands(
         jobname, modes, x_axis_hint=default_x_axis_hint,
@@ -136,7 +245,7 @@ def draw_bands(
         band_gaps=True, light_cone=False, projected_bands=False,
         mask_proj_bands_above_light_line=False,
         add_epsilon_as_inset=False, color_by_parity=False,
-        interactive_mode=False):
+        interactive_mode=False, track_bands=False, reciprocal_basis=None):
     """Plot dispersion relation of all bands calculated along all k
     vectors.
 
@@ -199,6 +308,16 @@ def draw_bands(
     :param interactive_mode: This is useful if the plot is not intended for
     saving, but for showing on the screen. Then defaults.default_onclick()
     will be called if the user clicks on a graph in the figure.
+    :param track_bands: If True, the bands are disentangled with
+    bandtracking.track_band_data before plotting, i.e. each plotted line
+    follows one band through band crossings (instead of the frequency
+    order returned by MPB). The group velocities (from the
+    <jobname>_<mode>velocity.csv file, if available) and the parity data
+    loaded for *color_by_parity* are used for the tracking.
+    :param reciprocal_basis: the reciprocal lattice vectors (rows of a
+    3x3-array, see Geometry.reciprocal_basis), needed by *track_bands*
+    to use the group velocities. If None, the cartesian unit vectors are
+    used.
     :return: a created BandPlotter instance (if *custom_plotter*) was
     None, or the *custom_plotter*.
 
@@ -211,44 +330,7 @@ def draw_bands(
 
     refr_index = 1 if isinstance(light_cone, bool) else light_cone
 
-    x_axis_formatter = None
-    if isinstance(x_axis_hint, axis_formatter.CustomAxisFormatter):
-        # use the supplied CustomAxisFormatter:
-        x_axis_formatter = x_axis_hint
-    elif isinstance(x_axis_hint, KSpace):
-        # make a KSpaceAxisFormatter instance from kspace object:
-        x_axis_formatter = axis_formatter.KSpaceAxisFormatter(x_axis_hint)
-    elif isinstance(x_axis_hint, int):
-        # make a standard KVectorAxisFormatter with supplied number of ticks:
-        x_axis_formatter = axis_formatter.KVectorAxisFormatter(x_axis_hint)
-    else:
-        num = 0
-        hintlen = 0
-        if hasattr(x_axis_hint, '__len__'):
-            hintlen = len(x_axis_hint)
-        else:
-            # no sequence
-            try:
-                # is this a number?
-                num = int(x_axis_hint)
-            except ValueError:
-                # no number
-                pass
-        if hintlen > 1 and (isinstance(x_axis_hint[0], int) and
-                hasattr(x_axis_hint[1], 'format')):
-            # Supplied a list with at least an int and format_str.
-            # Use all items in list as KVectorAxisFormatter arguments:
-            x_axis_formatter = axis_formatter.KVectorAxisFormatter(
-                *x_axis_hint)
-        elif num > 0:
-            # make a standard KVectorAxisFormatter with supplied number
-            # of ticks:
-            x_axis_formatter = axis_formatter.KVectorAxisFormatter(num)
-    if x_axis_formatter is None:
-        log.warning('draw_bands: Did not understand x_axis_hint, '
-            'using default.')
-        x_axis_formatter = axis_formatter.KVectorAxisFormatter(
-            default_x_axis_hint)
+    x_axis_formatter = axis_formatter.get_axis_formatter(x_axis_hint)
 
     for i, mode in enumerate(modes):
         fname = '{0}_{1}freqs.csv'.format(jobname, mode)
@@ -269,8 +351,16 @@ def draw_bands(
             except IOError:
                 parities = None
 
+        banddata = data[:, 5:]
+        if track_bands:
+            banddata, tracked_parities = bandtracking.track_band_data(
+                jobname, mode, data, parities=parities,
+                reciprocal_basis=reciprocal_basis)
+            if parities is not None:
+                parities = tracked_parities
+
         plotter.plot_bands(
-            data[:, 5:], data[:, 1:5],
+            banddata, data[:, 1:5],
             formatstr=defaults.draw_bands_formatstr,
             x_axis_formatter=x_axis_formatter,
             label=mode.upper(),
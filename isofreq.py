@@ -0,0 +1,281 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Isofrequency contours and group velocity fields in k-space.
+
+For self-collimation or superprism designs, the band data must be
+calculated on a KSpaceRectangularGrid. load_band_grid loads the bands
+(and the group velocities, if they were exported) of a simulation once
+and keeps them cached as a BandGrid. Its get_contours method extracts
+the isofrequency contours of a band for many frequencies in one pass
+(with marching squares, vectorized over all grid cells and
+frequencies), get_group_velocities returns the group velocity field of
+a band:
+
+    grid = load_band_grid(jobname, 'te', kspace)
+    contours = grid.get_contours(1, np.linspace(0.1, 0.3, 21))
+    vg = grid.get_group_velocities(1)
+
+"""
+
+from __future__ import division
+from os import path
+from collections import OrderedDict
+import numpy as np
+from artifacts import file_signature
+from utility import load_velocity_data
+import log
+
+# the BandGrids loaded recently, keyed by the file signatures of their
+# band data (see load_band_grid):
+_grid_cache = OrderedDict()
+_grid_cache_size = 16
+
+# The line segments in a grid cell for each of the 16 marching squares
+# cases, each segment given by the two cell edges it connects (0: bottom,
+# 1: right, 2: top, 3: left). The case is the sum of 1 (bottom left), 2
+# (bottom right), 4 (top right) and 8 (top left) for each corner above
+# the frequency. The saddle cases 5 and 10 are listed twice, first for
+# the center of the cell below, then above the frequency:
+_segments = {
+    1: [(3, 0)], 2: [(0, 1)], 3: [(3, 1)], 4: [(1, 2)],
+    6: [(0, 2)], 7: [(3, 2)], 8: [(2, 3)], 9: [(0, 2)],
+    11: [(1, 2)], 12: [(3, 1)], 13: [(0, 1)], 14: [(3, 0)]}
+_saddle_segments = {
+    5: ([(3, 0), (1, 2)], [(0, 1), (2, 3)]),
+    10: ([(0, 1), (2, 3)], [(3, 0), (1, 2)])}
+
+
+def _crossings(kx, ky, z, levels):
+    """Return the points where the *levels* cross the edges of the grid,
+    an array with shape (len(levels), number of edges, 2) with the (kx,
+    ky) position on each edge (not meaningful if not crossed). The
+    horizontal edges come first, row by row, then the vertical edges."""
+    ny, nx = z.shape
+    lv = levels[:, np.newaxis, np.newaxis]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # horizontal edges, shape (levels, ny, nx - 1):
+        t = (lv - z[:, :-1]) / (z[:, 1:] - z[:, :-1])
+        hx = kx[:-1] + t * np.diff(kx)
+        hy = np.broadcast_to(ky[:, np.newaxis], hx.shape)
+        # vertical edges, shape (levels, ny - 1, nx):
+        t = (lv - z[:-1]) / (z[1:] - z[:-1])
+        vy = ky[:-1, np.newaxis] + t * np.diff(ky)[:, np.newaxis]
+        vx = np.broadcast_to(kx, vy.shape)
+    nlevels = len(levels)
+    points = np.concatenate([
+        np.stack([hx, hy], axis=-1).reshape(nlevels, -1, 2),
+        np.stack([vx, vy], axis=-1).reshape(nlevels, -1, 2)], axis=1)
+    return points
+
+
+def _chain_segments(segments):
+    """Join *segments* (list of pairs of point ids) to polylines.
+    Return a list of lists of point ids; the first and last id of
+    closed contours are the same."""
+    neighbors = dict()
+    for a, b in segments:
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+    lines = []
+    # start at the open ends first, so open contours are not split:
+    starts = [p for p, n in neighbors.items() if len(n) == 1]
+    starts.extend(p for p, n in neighbors.items() if len(n) > 1)
+    for start in starts:
+        if not neighbors[start]:
+            continue
+        line = [start]
+        current = start
+        while neighbors[current]:
+            nxt = neighbors[current].pop()
+            neighbors[nxt].remove(current)
+            line.append(nxt)
+            current = nxt
+        lines.append(line)
+    return lines
+
+
+def isofrequency_contours(kx, ky, freqs, frequencies):
+    """Extract the isofrequency contours of one band with marching
+    squares.
+
+    :param kx: the k_x values of the grid columns.
+    :param ky: the k_y values of the grid rows.
+    :param freqs: the frequencies of the band, array with shape
+    (len(ky), len(kx)).
+    :param frequencies: the frequencies of the contours (a number or a
+    sequence).
+    :return: a list with the contours of each of the *frequencies*,
+    each a list of polylines (arrays with shape (n, 2) with the (k_x,
+    k_y) points). Closed contours end with their first point.
+
+    """
+    kx = np.asarray(kx, dtype=float)
+    ky = np.asarray(ky, dtype=float)
+    z = np.asarray(freqs, dtype=float)
+    levels = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    ny, nx = z.shape
+    points = _crossings(kx, ky, z, levels)
+
+    lv = levels[:, np.newaxis, np.newaxis]
+    above = z > lv
+    cases = (above[:, :-1, :-1] * 1 + above[:, :-1, 1:] * 2 +
+             above[:, 1:, 1:] * 4 + above[:, 1:, :-1] * 8)
+    center_above = (z[:-1, :-1] + z[:-1, 1:] + z[1:, 1:] + z[1:, :-1]) / 4 > lv
+
+    # the point ids of the edges of each cell (bottom, right, top,
+    # left), shape (4, ny - 1, nx - 1):
+    numh = ny * (nx - 1)
+    j, i = np.mgrid[0:ny - 1, 0:nx - 1]
+    edge_ids = np.array([
+        j * (nx - 1) + i, numh + j * nx + i + 1,
+        (j + 1) * (nx - 1) + i, numh + j * nx + i])
+
+    segments = [[] for l in levels]
+    def add(mask, pairs):
+        lvl, jj, ii = np.nonzero(mask)
+        for e1, e2 in pairs:
+            for l, a, b in zip(lvl.tolist(), edge_ids[e1, jj, ii].tolist(),
+                               edge_ids[e2, jj, ii].tolist()):
+                segments[l].append((a, b))
+    for case, pairs in _segments.items():
+        add(cases == case, pairs)
+    for case, (below_pairs, above_pairs) in _saddle_segments.items():
+        add((cases == case) & ~center_above, below_pairs)
+        add((cases == case) & center_above, above_pairs)
+
+    return [[points[l, line] for line in _chain_segments(segments[l])]
+            for l in range(len(levels))]
+
+
+class BandGrid(object):
+    def __init__(self, kx, ky, freqs, velocities=None):
+        """The band data of a simulation on a KSpaceRectangularGrid.
+
+        :param kx: the k_x values of the grid columns.
+        :param ky: the k_y values of the grid rows.
+        :param freqs: array with shape (number_of_bands, len(ky),
+        len(kx)) with the frequencies.
+        :param velocities: array with shape (number_of_bands, len(ky),
+        len(kx), 3) with the group velocities exported from MPB, or None.
+
+        """
+        self.kx = kx
+        self.ky = ky
+        self.freqs = freqs
+        self.velocities = velocities
+
+    def get_numbands(self):
+        return self.freqs.shape[0]
+    numbands = property(get_numbands)
+
+    def get_contours(self, band, frequencies):
+        """Return the isofrequency contours of *band* (first band is band
+        1) for all *frequencies*, see isofrequency_contours."""
+        return isofrequency_contours(
+            self.kx, self.ky, self.freqs[band - 1], frequencies)
+
+    def get_group_velocities(self, band):
+        """Return the group velocity field of *band* (first band is band
+        1), an array with shape (len(ky), len(kx), 2) with the k_x and k_y
+        components (in units of c).
+
+        If no group velocities were exported from MPB, they are
+        calculated with finite differences of the frequencies on the grid.
+        These are in the units of the reciprocal basis, i.e. only in units
+        of c for lattices with orthonormal reciprocal basis (e.g. the
+        square lattice).
+
+        """
+        if self.velocities is not None:
+            return self.velocities[band - 1, :, :, :2]
+        dfdy, dfdx = np.gradient(self.freqs[band - 1], self.ky, self.kx)
+        return np.stack([dfdx, dfdy], axis=-1)
+
+
+def load_band_grid(jobname, mode, kspace):
+    """Load the band data of *mode* calculated on a KSpaceRectangularGrid
+    *kspace* (from jobname_<mode>freqs.csv and, if it exists,
+    jobname_<mode>velocity.csv) and return a BandGrid.
+
+    The BandGrid is cached, so later calls for the same simulation don't
+    load the files again, unless they changed.
+
+    """
+    freqsfile = '{0}_{1}freqs.csv'.format(jobname, mode)
+    velfile = '{0}_{1}velocity.csv'.format(jobname, mode)
+    key = (path.abspath(freqsfile), kspace.x_steps, kspace.y_steps,
+           file_signature(freqsfile), file_signature(velfile))
+    if key in _grid_cache:
+        # mark as recently used:
+        grid = _grid_cache.pop(key)
+    else:
+        # imported here, because graphics needs a complete matplotlib:
+        from graphics import load_band_surfaces
+        kx, ky, freqs = load_band_surfaces(jobname, mode, kspace)
+        velocities = None
+        if path.isfile(velfile):
+            vel = load_velocity_data(velfile)
+            if vel.shape[:2] == (freqs.shape[1] * freqs.shape[2],
+                                 freqs.shape[0]):
+                velocities = vel.transpose(1, 0, 2).reshape(
+                    freqs.shape + (3,))
+            else:
+                log.warning('load_band_grid: {0} does not match the band '
+                            'data, will ignore it.'.format(velfile))
+        grid = BandGrid(kx, ky, freqs, velocities)
+    _grid_cache[key] = grid
+    while len(_grid_cache) > _grid_cache_size:
+        _grid_cache.popitem(last=False)
+    return grid
+
+
+def draw_isofrequency_contours(
+        grid, band, frequencies, velocities=True, filename=None,
+        show=False, ax=None):
+    """Draw the isofrequency contours of *band* of *grid* (a BandGrid)
+    for the *frequencies*, and, if *velocities*, the group velocity
+    field as arrows. Return the matplotlib Axes."""
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
+    if ax is None:
+        fig = plt.figure()
+        ax = fig.add_subplot(111, aspect='equal')
+    frequencies = np.atleast_1d(frequencies)
+    cmap = plt.get_cmap('viridis')
+    norm = plt.Normalize(frequencies.min(), frequencies.max())
+    for freq, lines in zip(frequencies, grid.get_contours(band, frequencies)):
+        ax.add_collection(LineCollection(lines, colors=[cmap(norm(freq))]))
+    if velocities:
+        vg = grid.get_group_velocities(band)
+        ax.quiver(grid.kx, grid.ky, vg[:, :, 0], vg[:, :, 1],
+                  color='0.4', width=0.002)
+    ax.set_xlim(grid.kx[0], grid.kx[-1])
+    ax.set_ylim(grid.ky[0], grid.ky[-1])
+    ax.set_xlabel('$k_x$')
+    ax.set_ylabel('$k_y$')
+    if filename:
+        ax.figure.savefig(filename, bbox_inches='tight')
+    if show:
+        plt.show(block=show == 'block')
+    elif filename:
+        plt.close(ax.figure)
+    return ax
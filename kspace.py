@@ -19,7 +19,10 @@
 # ----------------------------------------------------------------------
 
 from __future__ import division
+from math import sqrt
+import numpy as np
 from numpy import linspace
+from scheme import scheme_to_float
 import defaults
 import log
 
@@ -55,7 +58,10 @@ class KSpace(object):
             point (0, 0, 0). These labels will be added as comments to
             the point definitions in the ctl file and more importantly
             can be used as labels on the k-vector axis
-        :param kwargs: only used internally
+        :param kwargs: only used internally, e.g. lattice_basis: the
+            real space basis vectors of the lattice (rows of a
+            3x3-array), used for uniform interpolation in cartesian
+            k-space (default: cartesian unit vectors).
 
         """
         # build list of 3-tuples:
@@ -137,8 +143,95 @@ class KSpace(object):
 
     def count_interpolated(self):
         """Return total number of k-vecs after interpolation."""
+        if self._interpolation_is_uniform():
+            return len(self.interpolated_points())
         return (len(self.points()) - 1) * (self.k_interpolation + 1) + 1
 
+    def _interpolation_is_uniform(self):
+        """Will the k-points be distributed uniformly in k-space, i.e.
+        is the Scheme function written to the ctl file a uniform
+        interpolation function?
+
+        """
+        return (
+            self.use_uniform_interpolation and self.k_interpolation and
+            defaults.k_uniform_interpolation_function !=
+            defaults.k_interpolation_function)
+
+    def _segment_interpolation_counts(self, points):
+        """Return a list with the number of k-points which will be added
+        between each consecutive pair of *points* (an (N, 3)-array in the
+        reciprocal lattice basis).
+
+        """
+        numseg = len(points) - 1
+        if not self._interpolation_is_uniform():
+            return [self.k_interpolation] * numseg
+        # Same as MPB's kinterpolate-uniform: the number of points in each
+        # segment is proportional to the segment's length in cartesian
+        # reciprocal space, with (approximately) the same total number of
+        # points as with the simple interpolation:
+        cartesian = points.dot(self.reciprocal_basis())
+        dists = np.sqrt(np.sum(np.square(np.diff(cartesian, axis=0)), axis=1))
+        total = dists.sum()
+        if total == 0:
+            return [self.k_interpolation] * numseg
+        mindist = total / (self.k_interpolation * numseg + numseg)
+        return [max(0, int(np.round(d / mindist)) - 1) for d in dists]
+
+    def reciprocal_basis(self):
+        """Return the basis vectors of the reciprocal lattice (in units
+        of 2 pi, as rows of a 3x3-array), in cartesian coordinates.
+
+        The reciprocal basis is calculated from the real space basis
+        vectors given as lattice_basis on creation. If no lattice_basis
+        was given, the cartesian unit vectors will be used.
+
+        """
+        basis = np.array(
+            getattr(self, 'lattice_basis', np.identity(3)), dtype=float)
+        return np.linalg.inv(basis).transpose()
+
+    def _numeric_points(self):
+        """Return points() as (N, 3)-array of floats, with all Scheme
+        expressions evaluated."""
+        return np.array(
+            [[scheme_to_float(c) for c in xyz] for xyz in self.points()],
+            dtype=float).reshape((-1, 3))
+
+    def interpolated_points(self):
+        """Return all k-points which will be simulated, i.e. the k-points
+        after k_interpolation is applied, as (N, 3)-array.
+
+        The interpolation is done here in Python exactly like it will be
+        done in MPB, so the k-vectors are known before the simulation is
+        run. The k-vectors are given in the basis of the reciprocal
+        lattice, same as the points in points().
+
+        """
+        points = self._numeric_points()
+        if len(points) < 2 or not self.k_interpolation:
+            return points
+        segments = []
+        for i, num in enumerate(self._segment_interpolation_counts(points)):
+            # all points from start to (excluding) end of this segment:
+            frac = np.arange(num + 1) / (num + 1)
+            segments.append(
+                points[i] + frac[:, np.newaxis] * (points[i + 1] - points[i]))
+        segments.append(points[-1:])
+        return np.concatenate(segments)
+
+    def point_indices(self):
+        """Return the indices of the points in points(), i.e. of the
+        points before interpolation, in interpolated_points().
+
+        """
+        numpoints = len(self.points())
+        if numpoints < 2 or not self.k_interpolation:
+            return np.arange(numpoints)
+        counts = self._segment_interpolation_counts(self._numeric_points())
+        return np.cumsum([0] + [num + 1 for num in counts])
+
     def points(self):
         """Return the bare list of k-points, before any k_interpolation is
         applied.
@@ -179,7 +272,11 @@ class KSpaceTriangular(KSpace):
                          (0, 0, 0)],
             k_interpolation=k_interpolation,
             use_uniform_interpolation=use_uniform_interpolation,
-            point_labels=['Gamma', 'M', 'K', 'Gamma'])
+            point_labels=['Gamma', 'M', 'K', 'Gamma'],
+            # the basis of the triangular lattice (see Geometry.lattice),
+            # needed for uniform interpolation in cartesian k-space:
+            lattice_basis=[(sqrt(3) / 2, 0.5, 0), (sqrt(3) / 2, -0.5, 0),
+                           (0, 0, 1)])
 
 
 class KSpaceRectangular(KSpace):
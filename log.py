@@ -1,11 +1,20 @@
 import logging
 import sys
+import json
+import time
+from contextlib import contextmanager
 from defaults import log_format, log_datefmt
 
 logbuffer = []
 logger = None
 errlogger = None
 original_stderr = sys.stderr
+# The structured event stream (see setup_event_log). As long as there
+# are no event handlers, emitting events does nothing:
+event_handlers = []
+event_stream = None
+# added to all events, e.g. the jobname:
+event_context = dict()
 
 def setup_logger(name, filename, quiet=False, redirect_stderr=False):
     """Set up and return a logger with a StreamHandler that prints to stdout 
@@ -75,6 +84,7 @@ def reset_logger():
         sys.stderr = original_stderr
     logger = None
     errlogger = None
+    close_event_log()
 
 def check_initialized(level=logging.NOTSET, msg='', ):
     if logger is None:
@@ -96,9 +106,16 @@ def push_buffered():
     logbuffer = []
 
 def log(level, msg, *args, **kwargs):
-    """Send a log message to the logger, specify the level."""
-    if check_initialized(level, msg):
-        logger.log(level, msg, *args, **kwargs)
+    """Send a log message to the logger, specify the level. Warnings and
+    errors are also emitted as 'log' events, if events are enabled, when
+    they reach the logger (i.e. buffered messages only once, when they
+    are pushed)."""
+    if not check_initialized(level, msg):
+        return
+    logger.log(level, msg, *args, **kwargs)
+    if event_handlers and level >= logging.WARNING:
+        event('log', level=logging.getLevelName(level),
+              message=msg % args if args else msg)
 
 def debug(msg, *args, **kwargs):
     """Send a debug message to the logger."""
@@ -161,4 +178,75 @@ class StreamToLogger(object):
             self.logger.log(self.log_level, self.linebuf)
         self.linebuf = ''
         for h in self.logger.handlers:
-            h.flush()
\ No newline at end of file
+            h.flush()
+
+
+def setup_event_log(filename, **context):
+    """Write all events (see event) as JSON lines to *filename* (opened
+    in append mode, so several jobs can write to the same file). The
+    keyword arguments *context* (e.g. job='jobname') are added to all
+    events.
+
+    """
+    global event_stream
+    close_event_log()
+    event_stream = open(filename, 'a')
+    event_handlers.append(_write_event)
+    event_context.clear()
+    event_context.update(context)
+
+def close_event_log():
+    global event_stream
+    if event_stream is not None:
+        event_handlers.remove(_write_event)
+        event_stream.close()
+        event_stream = None
+
+def _write_event(record):
+    event_stream.write(json.dumps(record, default=str) + '\n')
+    event_stream.flush()
+
+def event(kind, **fields):
+    """Emit a structured event of type *kind* with the data *fields* to
+    all event_handlers (functions accepting the event dictionary).
+
+    Used event types and their fields:
+        job_start:  ncpu, ctl_file, out_file
+        job_finish: returncode, duration
+        subprocess: command, returncode, duration
+        stage:      name, duration
+        cache:      key, hit
+        log:        level, message
+
+    Does nothing (apart from the check) if there are no handlers.
+
+    """
+    if not event_handlers:
+        return
+    record = dict(event_context)
+    record.update(fields)
+    record['event'] = kind
+    record['time'] = time.time()
+    for handler in event_handlers:
+        handler(record)
+
+@contextmanager
+def timed(kind, **fields):
+    """Context manager emitting the event *kind* with *fields* and the
+    duration (seconds) of the with-block. Fields set in the dictionary
+    yielded by the context manager will be added to the event, e.g.:
+
+        with log.timed('subprocess', command=cmd) as ev:
+            ev['returncode'] = sp.call(cmd)
+
+    """
+    if not event_handlers:
+        yield dict()
+        return
+    extra = dict()
+    start = time.time()
+    try:
+        yield extra
+    finally:
+        fields.update(extra)
+        event(kind, duration=time.time() - start, **fields)
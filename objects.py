@@ -14,7 +14,9 @@
 
 from __future__ import division
 import math
+import numpy as np
 import data
+from scheme import scheme_to_float
 class Object(object):
     template_str = (
          "\n    (make %(shape)s\n"
@@ -30,10 +32,9 @@ class Object(object):
         self.shape = shape
         
     def __str__(self):
-        self.other = '\n        '.join(
+        other = '\n        '.join(
             '(%s %s)'%(a,self.others[a]) for a in self.others)
-        return Object.template_str % self.__dict__
-        del self.other
+        return Object.template_str % dict(self.__dict__, other=other)
 
 
 class Rod(Object):
@@ -52,6 +53,265 @@ class Block(Object):
             size=' '.join([str(s) for s in size]))
 
 
+class ObjectArray(object):
+    """Base class for collections of many geometric objects of the same
+    shape, e.g. all holes of a big supercell. Instead of individual
+    Python objects, the centers, materials and shape parameters are
+    stored in numpy arrays, which allows fast, vectorized
+    transformations and fast rendering to ctl.
+
+    An ObjectArray can be put in the objects list of a Geometry like any
+    other Object.
+
+    """
+    shape = ''
+    # the ctl of a single object; all %s, in the order of _ctl_columns:
+    template_str = ''
+
+    def __init__(self, centers, materials, material_indices=None):
+        """
+        :param centers: array-like with shape (number_of_objects, 3)
+        (or (number_of_objects, 2), then z is set to zero), in lattice
+        coordinates.
+        :param materials: a single material (Dielectric object or name
+        of a material defined in the ctl, e.g. 'air') used for all
+        objects, or a list of materials indexed by material_indices.
+        :param material_indices: integer array with one entry for each
+        object, the index in materials. If None, all objects use the
+        first material.
+
+        """
+        centers = np.array(centers, dtype=float, ndmin=2)
+        if centers.shape[1] == 2:
+            centers = np.column_stack([centers, np.zeros(len(centers))])
+        self.centers = centers
+        if not isinstance(materials, (list, tuple)):
+            materials = [materials]
+        self.materials = list(materials)
+        if material_indices is None:
+            material_indices = np.zeros(len(centers), dtype=int)
+        self.material_indices = np.array(material_indices, dtype=int)
+        self._ctl_cache = None
+
+    def __len__(self):
+        return len(self.centers)
+
+    def get_x(self):
+        return self.centers[:, 0]
+    x = property(get_x)
+
+    def get_y(self):
+        return self.centers[:, 1]
+    y = property(get_y)
+
+    def get_z(self):
+        return self.centers[:, 2]
+    z = property(get_z)
+
+    def _shape_parameters(self):
+        """Return a list of 1D-arrays with the shape parameters inserted
+        after the center in template_str."""
+        return []
+
+    def _subset_kwargs(self, index):
+        """Return the keyword arguments (shape parameters) to create a
+        new array of the objects selected by *index*."""
+        return dict()
+
+    def __getitem__(self, index):
+        """Return a new array with the objects selected by *index* (an
+        integer, slice, index array or boolean mask)."""
+        index = np.atleast_1d(np.arange(len(self))[index])
+        return self.__class__(
+            centers=self.centers[index], materials=self.materials,
+            material_indices=self.material_indices[index],
+            **self._subset_kwargs(index))
+
+    def copy(self):
+        return self[:]
+
+    def shift(self, dx=0, dy=0, dz=0, mask=None):
+        """Shift the objects selected by *mask* (index array or boolean
+        mask, all objects if None) by (dx, dy, dz). dx, dy and dz can
+        also be arrays with one entry for each selected object.
+
+        """
+        if mask is None:
+            mask = slice(None)
+        self.centers[mask, 0] += dx
+        self.centers[mask, 1] += dy
+        self.centers[mask, 2] += dz
+        return self
+
+    def perturb(self, position_sigma=0, mask=None, random_state=None,
+                dimensions=2, basis=None):
+        """Randomly shift the objects selected by *mask* (all objects if
+        None). The shifts are normally distributed with standard
+        deviation *position_sigma* in each of the first *dimensions*
+        directions.
+
+        :param random_state: None, an integer seed or a
+        numpy.random.RandomState object, to make the disorder
+        reproducible.
+        :param basis: the lattice vectors in cartesian coordinates (rows
+        of a 3x3-array, see Geometry.basis). If given, the shifts are
+        drawn in cartesian coordinates and converted to lattice
+        coordinates. Otherwise, they are drawn in lattice coordinates.
+
+        """
+        rnd = _get_random_state(random_state)
+        if mask is None:
+            mask = slice(None)
+        num = len(self.centers[mask])
+        shifts = rnd.normal(0, position_sigma, (num, dimensions))
+        if basis is None:
+            self.centers[mask, :dimensions] += shifts
+        else:
+            cartesian = np.zeros((num, 3))
+            cartesian[:, :dimensions] = shifts
+            self.centers[mask] += cartesian.dot(np.linalg.inv(basis))
+        return self
+
+    def _ctl_key(self):
+        return [self.centers.tobytes(), self.material_indices.tobytes(),
+                [str(m) for m in self.materials]] + [
+                    p.tobytes() for p in self._shape_parameters()]
+
+    def __str__(self):
+        key = self._ctl_key()
+        if self._ctl_cache is not None and self._ctl_cache[0] == key:
+            return self._ctl_cache[1]
+        matstrs = [str(m) for m in self.materials]
+        columns = (
+            [self.centers[:, i].tolist() for i in range(3)] +
+            [p.tolist() for p in self._shape_parameters()] +
+            [[matstrs[i] for i in self.material_indices.tolist()]])
+        template = self.template_str
+        result = ''.join([template % row for row in zip(*columns)])
+        self._ctl_cache = (key, result)
+        return result
+
+    def to_objects(self):
+        """Return a list of individual Objects, e.g. for drawing."""
+        return []
+
+    def __repr__(self):
+        return '<objects.{0} with {1} objects>'.format(
+            self.__class__.__name__, len(self))
+
+
+class RodArray(ObjectArray):
+    shape = 'cylinder'
+    template_str = (
+         "\n    (make cylinder\n"
+         "        (center %s %s %s)\n"
+         "        (height infinity)\n"
+         "        (radius %s)\n"
+         "        (material %s) )")
+
+    def __init__(self, centers, materials, radii, material_indices=None):
+        """An array of infinitely high rods (see Rod and ObjectArray).
+
+        :param radii: a single radius for all rods or an array with one
+        radius for each rod.
+
+        """
+        super(RodArray, self).__init__(centers, materials, material_indices)
+        self.radii = np.array(
+            np.broadcast_to(np.asarray(radii, dtype=float), (len(self),)))
+
+    @classmethod
+    def from_rods(cls, rods):
+        """Create a RodArray from a list of Rod objects. Coordinates
+        given as Scheme expressions are evaluated."""
+        materials = []
+        indices = []
+        for rod in rods:
+            for i, mat in enumerate(materials):
+                if mat is rod.material:
+                    break
+            else:
+                i = len(materials)
+                materials.append(rod.material)
+            indices.append(i)
+        return cls(
+            centers=[[scheme_to_float(c) for c in (rod.x, rod.y, rod.z)]
+                     for rod in rods] or np.zeros((0, 3)),
+            materials=materials,
+            radii=[scheme_to_float(rod.radius) for rod in rods],
+            material_indices=indices)
+
+    def _shape_parameters(self):
+        return [self.radii]
+
+    def _subset_kwargs(self, index):
+        return dict(radii=self.radii[index])
+
+    def perturb(self, position_sigma=0, radius_sigma=0, mask=None,
+                random_state=None, dimensions=2, basis=None):
+        """Randomly shift the rods and change their radii. See
+        ObjectArray.perturb; *radius_sigma* is the standard deviation
+        of the normally distributed change of the radii.
+
+        """
+        rnd = _get_random_state(random_state)
+        super(RodArray, self).perturb(
+            position_sigma, mask=mask, random_state=rnd,
+            dimensions=dimensions, basis=basis)
+        if radius_sigma:
+            if mask is None:
+                mask = slice(None)
+            num = len(self.radii[mask])
+            self.radii[mask] = np.maximum(
+                self.radii[mask] + rnd.normal(0, radius_sigma, num), 0)
+        return self
+
+    def to_objects(self):
+        return [
+            Rod(x, y, self.materials[i], r) for x, y, i, r in zip(
+                self.x.tolist(), self.y.tolist(),
+                self.material_indices.tolist(), self.radii.tolist())]
+
+
+class BlockArray(ObjectArray):
+    shape = 'block'
+    template_str = (
+         "\n    (make block\n"
+         "        (center %s %s %s)\n"
+         "        (size %s %s %s)\n"
+         "        (material %s) )")
+
+    def __init__(self, centers, materials, sizes, material_indices=None):
+        """An array of blocks (see Block and ObjectArray).
+
+        :param sizes: a single size (sequence of 3 numbers) for all
+        blocks or an array with shape (number_of_blocks, 3).
+
+        """
+        super(BlockArray, self).__init__(
+            centers, materials, material_indices)
+        self.sizes = np.array(
+            np.broadcast_to(np.asarray(sizes, dtype=float), (len(self), 3)))
+
+    def _shape_parameters(self):
+        return [self.sizes[:, i] for i in range(3)]
+
+    def _subset_kwargs(self, index):
+        return dict(sizes=self.sizes[index])
+
+    def to_objects(self):
+        return [
+            Block(x, y, z, self.materials[i], size) for (x, y, z), i, size
+            in zip(self.centers.tolist(), self.material_indices.tolist(),
+                   self.sizes.tolist())]
+
+
+def _get_random_state(random_state):
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
 class Dielectric(object):
     
     def __init__(self,dielectric):
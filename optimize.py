@@ -0,0 +1,369 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Gradient-free optimization of simulation parameters.
+
+Optimizer searches the parameters of a simulation (e.g. the row shifts
+and radii of TriHoles2D_Waveguide) minimizing a user-defined objective
+with CMA-ES. CMA-ES proposes a whole generation of candidates at once,
+which are simulated in parallel with pipeline.run_pipelined. Candidates
+whose folder already holds a finished .out file are not simulated again,
+and the optimizer state is saved to a checkpoint file after every
+generation, so an interrupted search resumes where it stopped:
+
+    def make_job(job_name_suffix, runmode, **params):
+        return TriHoles2D_Waveguide(
+            'SiN', 0.3, runmode=runmode, job_name_suffix=job_name_suffix,
+            **params)
+
+    opt = Optimizer(
+        dict(first_row_longitudinal_shift=(-0.2, 0.2),
+             first_row_radius=(0.2, 0.35)),
+        make_job, ndbp_objective('te'), 'opt_checkpoint.json',
+        mpb_workers=2)
+    best_params, best_value = opt.run(generations=20)
+
+"""
+
+from __future__ import division
+from os import path, listdir, remove, rmdir
+from glob import glob
+import json
+import numpy as np
+import pipeline
+import log
+
+
+class CMAES(object):
+    def __init__(self, x0, sigma, popsize=None):
+        """Covariance matrix adaptation evolution strategy, minimizing a
+        function of len(*x0*) variables (see Hansen, The CMA Evolution
+        Strategy: A Tutorial, arXiv:1604.00772).
+
+        :param x0: the initial mean.
+        :param sigma: the initial step size.
+        :param popsize: the number of candidates per generation
+        (default: 4 + 3 ln(n)).
+
+        """
+        n = len(x0)
+        self.mean = np.array(x0, dtype=float)
+        self.sigma = sigma
+        self.popsize = popsize or 4 + int(3 * np.log(n))
+        self.cov = np.eye(n)
+        self.path_c = np.zeros(n)
+        self.path_s = np.zeros(n)
+        self.generation = 0
+        # strategy parameters:
+        mu = self.popsize // 2
+        weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1 / np.sum(self.weights ** 2)
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) /
+                       ((n + 2) ** 2 + self.mueff))
+        self.damps = (1 + 2 * max(0, np.sqrt((self.mueff - 1) / (n + 1)) - 1) +
+                      self.cs)
+        self.chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    def _eigen(self):
+        eigvals, eigvecs = np.linalg.eigh(self.cov)
+        return eigvecs, np.sqrt(np.maximum(eigvals, 1e-20))
+
+    def ask(self, seed=None):
+        """Return the candidates of the next generation, an array with
+        shape (popsize, n). The same *seed* gives the same candidates."""
+        eigvecs, d = self._eigen()
+        z = np.random.RandomState(seed).standard_normal(
+            (self.popsize, len(self.mean)))
+        return self.mean + self.sigma * (z * d).dot(eigvecs.T)
+
+    def tell(self, candidates, values):
+        """Update the distribution with the *values* of the objective
+        of the *candidates* (as returned by ask, possibly repaired)."""
+        n = len(self.mean)
+        order = np.argsort(values)[:len(self.weights)]
+        best = np.asarray(candidates)[order]
+        old_mean = self.mean
+        self.mean = self.weights.dot(best)
+        y = (self.mean - old_mean) / self.sigma
+        eigvecs, d = self._eigen()
+        inv_sqrt_cov = eigvecs.dot(np.diag(1 / d)).dot(eigvecs.T)
+        self.path_s = ((1 - self.cs) * self.path_s +
+                       np.sqrt(self.cs * (2 - self.cs) * self.mueff) *
+                       inv_sqrt_cov.dot(y))
+        norm_s = np.linalg.norm(self.path_s)
+        hsig = (norm_s / np.sqrt(
+                    1 - (1 - self.cs) ** (2 * (self.generation + 1))) /
+                self.chi_n < 1.4 + 2 / (n + 1))
+        self.path_c = ((1 - self.cc) * self.path_c + hsig *
+                       np.sqrt(self.cc * (2 - self.cc) * self.mueff) * y)
+        steps = (best - old_mean) / self.sigma
+        self.cov = (
+            (1 - self.c1 - self.cmu) * self.cov +
+            self.c1 * (np.outer(self.path_c, self.path_c) +
+                       (1 - hsig) * self.cc * (2 - self.cc) * self.cov) +
+            self.cmu * (steps.T * self.weights).dot(steps))
+        self.sigma *= np.exp(self.cs / self.damps * (norm_s / self.chi_n - 1))
+        self.generation += 1
+
+    def get_state(self):
+        """Return the state as dictionary (json serializable)."""
+        return dict(
+            mean=self.mean.tolist(), sigma=self.sigma,
+            popsize=self.popsize, cov=self.cov.tolist(),
+            path_c=self.path_c.tolist(), path_s=self.path_s.tolist(),
+            generation=self.generation)
+
+    def set_state(self, state):
+        """Restore the *state* returned by get_state."""
+        self.mean = np.array(state['mean'])
+        self.sigma = state['sigma']
+        self.cov = np.array(state['cov'])
+        self.path_c = np.array(state['path_c'])
+        self.path_s = np.array(state['path_s'])
+        self.generation = state['generation']
+
+
+def has_finished_out_file(folder, jobname):
+    """Return True if *folder* holds a .out file of *jobname* of a
+    simulation that finished successfully (returncode 0)."""
+    for fname in glob(path.join(folder, jobname + '*.out')):
+        with open(fname, 'rb') as f:
+            # the footer is at the end of the file:
+            f.seek(0, 2)
+            f.seek(max(0, f.tell() - 200))
+            if f.read().rstrip().endswith(b'returncode: 0'):
+                return True
+    return False
+
+
+def _remove_new_folder(sim):
+    """Remove the working directory of the Simulation *sim*, if it only
+    holds the log file of *sim*, i.e. was created when *sim* was made
+    (otherwise, it would be renamed to a backup folder when the job of
+    the same simulation is made)."""
+    log_file = path.basename(sim.log_file)
+    if set(listdir(sim.workingdir)) <= set([log_file]):
+        # close the log file:
+        log.reset_logger()
+        if path.isfile(sim.log_file):
+            remove(sim.log_file)
+        rmdir(sim.workingdir)
+
+
+def _abbreviation(name):
+    # e.g. first_row_longitudinal_shift -> frls:
+    return ''.join(word[:1] for word in name.split('_'))
+
+
+class Optimizer(object):
+    def __init__(
+            self, parameters, make_job, objective, checkpoint_file=None,
+            popsize=None, sigma=0.3, x0=None, seed=0, resolution=1e-4,
+            mpb_workers=1, post_workers=1):
+        """Optimize simulation parameters with CMA-ES.
+
+        :param parameters: a dictionary with the name of each parameter
+        as key and a tuple (lower bound, upper bound) as value.
+        :param make_job: a function called with the keyword arguments
+        job_name_suffix (unique for every candidate), runmode and the
+        parameters, e.g. a function of phc_simulations. With
+        runmode='' it must return the Simulation object without
+        clearing its folder (which might hold the results of an earlier
+        search), with runmode='queue' a pipeline.Job.
+        :param objective: a function called with the pipeline.Job of a
+        finished and post-processed candidate, returning the value to be
+        minimized (or None if it can't be evaluated).
+        :param checkpoint_file: the json file where the state of the
+        optimizer and all evaluations are saved after each generation.
+        If it exists, the search resumes from it.
+        :param popsize: the number of candidates per generation,
+        simulated in parallel.
+        :param sigma: the initial step size, relative to the ranges of
+        the parameters.
+        :param x0: a dictionary with the initial parameters (default:
+        centers of the ranges).
+        :param seed: the random seed.
+        :param resolution: the parameters are rounded to multiples of
+        *resolution*, so a candidate evaluated before is found again.
+        :param mpb_workers, post_workers: see pipeline.run_pipelined.
+
+        """
+        self.names = sorted(parameters)
+        self.lower = np.array([parameters[n][0] for n in self.names], float)
+        self.upper = np.array([parameters[n][1] for n in self.names], float)
+        self.make_job = make_job
+        self.objective = objective
+        self.checkpoint_file = checkpoint_file
+        self.seed = seed
+        self.resolution = resolution
+        self.mpb_workers = mpb_workers
+        self.post_workers = post_workers
+        # all evaluated candidates, dictionaries with params, value and
+        # jobname:
+        self.history = []
+        # the optimization is done on the parameters scaled to [0, 1]:
+        if x0 is None:
+            start = np.full(len(self.names), 0.5)
+        else:
+            start = self._scale(np.array([x0[n] for n in self.names]))
+        self.strategy = CMAES(start, sigma, popsize)
+        if checkpoint_file is not None and path.isfile(checkpoint_file):
+            with open(checkpoint_file, 'r') as f:
+                state = json.load(f)
+            if state['names'] != self.names:
+                raise ValueError(
+                    'Optimizer: checkpoint {0} is for different '
+                    'parameters.'.format(checkpoint_file))
+            self.strategy.set_state(state['strategy'])
+            self.history = [
+                dict(h, value=np.inf if h['value'] is None else h['value'])
+                for h in state['history']]
+            log.info('Optimizer: resuming from {0} at generation {1}'.format(
+                checkpoint_file, self.strategy.generation))
+
+    def _scale(self, params):
+        return (params - self.lower) / (self.upper - self.lower)
+
+    def _unscale(self, x):
+        params = self.lower + np.clip(x, 0, 1) * (self.upper - self.lower)
+        return np.round(params / self.resolution) * self.resolution
+
+    def job_name_suffix(self, params):
+        """Return the job_name_suffix of the candidate with *params*
+        (dictionary)."""
+        digits = max(0, int(np.ceil(-np.log10(self.resolution))))
+        return '_opt' + ''.join(
+            '_{0}{1:+.{2}f}'.format(_abbreviation(name), params[name], digits)
+            for name in self.names)
+
+    def evaluate(self, candidates):
+        """Simulate the *candidates* (list of parameter dictionaries) in
+        parallel, skipping those simulated before, and return the values
+        of the objective (inf where the simulation or the objective
+        failed)."""
+        jobs = []
+        to_run = []
+        for params in candidates:
+            suffix = self.job_name_suffix(params)
+            # first only find the folder of the candidate; a queued job
+            # would clear it:
+            sim = self.make_job(job_name_suffix=suffix, runmode='', **params)
+            if has_finished_out_file(sim.workingdir, sim.jobname):
+                jobs.append(pipeline.Job(sim))
+            else:
+                _remove_new_folder(sim)
+                to_run.append(len(jobs))
+                jobs.append(self.make_job(
+                    job_name_suffix=suffix, runmode='queue', **params))
+        log.info('Optimizer: simulating {0} of {1} candidates, the others '
+                 'were finished before.'.format(len(to_run), len(jobs)))
+        ok = [True] * len(jobs)
+        if to_run:
+            results = pipeline.run_pipelined(
+                [jobs[i] for i in to_run], mpb_workers=self.mpb_workers,
+                post_workers=self.post_workers)
+            for i, (retcode, post_processed) in zip(to_run, results):
+                ok[i] = retcode == 0 and post_processed
+        values = []
+        for job, success in zip(jobs, ok):
+            value = None
+            if success:
+                try:
+                    value = self.objective(job)
+                except Exception:
+                    log.exception('Optimizer: objective of {0} failed:'.format(
+                        job.jobname))
+            values.append(np.inf if value is None else float(value))
+        return values
+
+    def step(self):
+        """Simulate one generation of candidates and update the
+        optimizer. Return the values of the candidates."""
+        gen = self.strategy.generation
+        # seeded by generation, so a resumed search proposes the same
+        # candidates (and finds their finished simulations):
+        xs = self.strategy.ask(seed=self.seed + gen)
+        params = [self._unscale(x) for x in xs]
+        candidates = [dict(zip(self.names, p.tolist())) for p in params]
+        values = self.evaluate(candidates)
+        # tell the repaired (clipped, rounded) candidates:
+        self.strategy.tell([self._scale(p) for p in params], values)
+        for cand, value in zip(candidates, values):
+            self.history.append(dict(
+                generation=gen, params=cand, value=value,
+                jobname_suffix=self.job_name_suffix(cand)))
+        self.save_checkpoint()
+        best = self.get_best()
+        log.info('Optimizer: generation {0} done, best value so far: {1} '
+                 'at {2}'.format(gen, best[1], best[0]))
+        return values
+
+    def run(self, generations):
+        """Run the optimization until *generations* generations are done
+        (including those done before resuming). Return the best
+        parameters (dictionary) and value found."""
+        while self.strategy.generation < generations:
+            self.step()
+        return self.get_best()
+
+    def get_best(self):
+        """Return the best parameters (dictionary) and value evaluated so
+        far, or (None, inf)."""
+        finite = [h for h in self.history if np.isfinite(h['value'])]
+        if not finite:
+            return None, np.inf
+        best = min(finite, key=lambda h: h['value'])
+        return best['params'], best['value']
+
+    def save_checkpoint(self):
+        if self.checkpoint_file is None:
+            return
+        # inf is not valid json:
+        history = [
+            dict(h, value=h['value'] if np.isfinite(h['value']) else None)
+            for h in self.history]
+        state = dict(names=self.names, strategy=self.strategy.get_state(),
+                     history=history)
+        with open(self.checkpoint_file, 'w') as f:
+            json.dump(state, f, indent=1)
+
+
+def ndbp_objective(mode, band=None, **analysis_args):
+    """Return an objective for Optimizer maximizing the normalized
+    delay-bandwidth product of the slow light window of *band* (default:
+    the best band) of a waveguide simulation. *analysis_args* are passed
+    to slowlight.analyze_sweep."""
+    def objective(job):
+        # imported here, because slowlight needs matplotlib:
+        import slowlight
+        analysis = slowlight.analyze_sweep(
+            [job.sim.workingdir], mode, cache_file=False, **analysis_args)
+        ndbp = analysis.windows['ndbp'][0]
+        if band is not None:
+            ndbp = ndbp[band - 1:band]
+        if np.all(np.isnan(ndbp)):
+            return None
+        return -np.nanmax(ndbp)
+    return objective
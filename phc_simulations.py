@@ -25,11 +25,65 @@ from kspace import KSpaceTriangular, KSpace
 from objects import Dielectric, Rod, Block
 import defaults
 import log
+import pipeline
 from utility import do_runmode, get_triangular_phc_waveguide_air_rods
 from os import path, makedirs
 import numpy as np
 
 
+# the jobs of the simulations of unperturbed structures queued for the
+# projected bands of waveguides, keyed by their folder. The waveguides of
+# a sweep queued with runmode='queue' require the same job, instead of
+# each one making its own Simulation, clearing the folder again:
+_queued_prerequisites = dict()
+
+
+def _queue_prerequisite(folder, job):
+    """Remember the queued *job* of the unperturbed structure simulated
+    in *folder* and return it."""
+    _queued_prerequisites[folder] = job
+    return job
+
+
+def _correct_band_gap_ranges(range_file_name):
+    """Correct the _ranges.csv file of a simulation of the band gap
+    (only at the M and K points) of an unperturbed structure."""
+    # The _ranges.csv file is wrong, because we did not simulate the
+    # full K-Space, especially Gamma is missing. Correct the ranges so
+    # the first band starts at 0 and the second band is the last band
+    # and goes to a very high value. This way, there is only the band
+    # gap left between the first and second continuum bands.
+
+    # Load the _ranges.csv file to get the band gap:
+    ranges = np.loadtxt(range_file_name, delimiter=',', ndmin=2)
+    # tinker:
+    ranges[0, 1] = 0
+    ranges[1, 2] = ranges[1, 2] * 100
+    # save file again, drop higher bands:
+    np.savetxt(
+        range_file_name,
+        ranges[:2, :],
+        header='bandnum, min, max',
+        fmt=['%.0f', '%.6f', '%.6f'],
+        delimiter=', ')
+
+
+class _BandGapJob(pipeline.Job):
+    def __init__(self, job, range_file_name):
+        """The pipeline.Job *job* of a band gap simulation of an
+        unperturbed structure, which corrects the _ranges.csv file after
+        post-processing (see _correct_band_gap_ranges)."""
+        super(_BandGapJob, self).__init__(
+            job.sim, job.num_processors, **job.postpc_args)
+        self.range_file_name = range_file_name
+
+    def post_process(self):
+        success = super(_BandGapJob, self).post_process()
+        if success:
+            _correct_band_gap_ranges(self.range_file_name)
+        return success
+
+
 def TriHoles2D(
         material, radius, numbands=8, k_interpolation=11, 
         resolution=32, mesh_size=7,
@@ -55,6 +109,8 @@ def TriHoles2D(
         ''       : just create and return the simulation object
         'ctl'    : create the sim object and save the ctl file
         'sim' (default): run the simulation and do all postprocessing
+        'queue'  : create and return a pipeline.Job, which can be run
+                   together with others with pipeline.run_pipelined
         'postpc' : do all postprocessing; simulation should have run
                    before!
         'display': display all pngs done during postprocessing. This is
@@ -76,7 +132,7 @@ def TriHoles2D(
     object here to customize this. k_interpolation will then be ignored.
     :param modes: a list of modes to run. Possible are 'te' and 'tm'.
     Default: both
-    :return: the Simulation object
+    :return: the Simulation object (a pipeline.Job if runmode is 'queue')
 
     """
     mat = Dielectric(material)    
@@ -133,7 +189,7 @@ def TriHoles2D(
         runcode=runcode,
         work_in_subfolder=path.join(
             containing_folder, jobname + job_name_suffix),
-        clear_subfolder=runmode.startswith('s') or runmode.startswith('c'))
+        clear_subfolder=runmode.startswith(('s', 'c', 'q')))
 
     draw_bands_title = ('2D hex. PhC; {0}, radius={1:0.3f}'.format(
                             mat.name, geom.objects[0].radius) + 
@@ -179,6 +235,8 @@ def TriHolesSlab3D(
         ''       : just create and return the simulation object
         'ctl'    : create the sim object and save the ctl file
         'sim' (default): run the simulation and do all postprocessing
+        'queue'  : create and return a pipeline.Job, which can be run
+                   together with others with pipeline.run_pipelined
         'postpc' : do all postprocessing; simulation should have run
                    before!
         'display': display all pngs done during postprocessing. This is
@@ -203,7 +261,7 @@ def TriHolesSlab3D(
     :param substrate_material: the material of an optional substrate,
     see param material. Holes will not be extended into the substrate.
     Default: None, i.e. the substrate is air.
-    :return: the Simulation object
+    :return: the Simulation object (a pipeline.Job if runmode is 'queue')
 
     """
     mat = Dielectric(material)
@@ -278,7 +336,7 @@ def TriHolesSlab3D(
         runcode=runcode,
         work_in_subfolder=path.join(
             containing_folder, jobname + job_name_suffix),
-        clear_subfolder=runmode.startswith('s') or runmode.startswith('c'))
+        clear_subfolder=runmode.startswith(('s', 'c', 'q')))
 
     draw_bands_title = ('Hex. PhC slab; '
                         '{0}, thickness={1:0.3f}, radius={2:0.3f}'.format(
@@ -359,6 +417,11 @@ def TriHoles2D_Waveguide(
         ''       : just create and return the simulation object
         'ctl'    : create the sim object and save the ctl file
         'sim' (default): run the simulation and do all postprocessing
+        'queue'  : create and return a pipeline.Job, which can be run
+                   together with others with pipeline.run_pipelined.
+                   Missing simulations of the unperturbed structure
+                   (for the projected bands) are not run now, but
+                   added as jobs required by the returned job.
         'postpc' : do all postprocessing; simulation should have run
                    before!
         'display': display all pngs done during postprocessing. This is
@@ -391,7 +454,7 @@ def TriHoles2D_Waveguide(
     the band diagrams are automatically cropped before the last band
     if plot_crop_y is True, alternatively use plot_crop_y to specify
     the max. y-value where the plot will be cropped.
-    :return: the Simulation object
+    :return: the Simulation object (a pipeline.Job if runmode is 'queue')
 
     """
     mat = Dielectric(material)
@@ -425,6 +488,10 @@ def TriHoles2D_Waveguide(
     # simulations for each k-vec of this simulation (or only one simulation,
     # if the plotted band gap does not change from k-vec to k-vec):
     project_bands_list = []
+    # In queue mode, the simulations of the unperturbed structure are
+    # not run now, but returned as pipeline.Jobs required by this job:
+    prerequisite_runmode = {'s': 'sim', 'q': 'queue'}.get(runmode[:1], '')
+    prerequisites = []
 
     if plot_complete_band_gap:
         if mode == 'te':
@@ -437,7 +504,13 @@ def TriHoles2D_Waveguide(
             project_bands_list.append(path.join(repo, jobname))
             range_file_name = path.join(
                 repo, jobname, jobname + '_' + mode + '_ranges.csv')
-            if not path.isfile(range_file_name):
+            if (prerequisite_runmode == 'queue' and
+                    path.join(repo, jobname) in _queued_prerequisites and
+                    not path.isfile(range_file_name)):
+                # queued before for another waveguide, e.g. of a sweep:
+                prerequisites.append(
+                    _queued_prerequisites[path.join(repo, jobname)])
+            elif not path.isfile(range_file_name):
                 # does not exist, so start simulation:
                 log.info('unperturbed structure not yet simulated for '
                          'band gap. Running now...')
@@ -453,7 +526,7 @@ def TriHoles2D_Waveguide(
                     numbands=3, # 3 so the band plot looks better ;)
                     resolution=resolution,
                     mesh_size=mesh_size,
-                    runmode='sim' if runmode.startswith('s') else '',
+                    runmode=prerequisite_runmode,
                     num_processors=num_processors,
                     containing_folder=repo,
                     save_field_patterns=False,
@@ -473,25 +546,12 @@ def TriHoles2D_Waveguide(
                     )
                     return
 
-                # Now, the _ranges.csv file is wrong, because we did not
-                # simulate the full K-Space, especially Gamma is
-                # missing. Correct the ranges so the first band starts
-                # at 0 and the second band is the last band and goes to
-                # a very high value. This way, there is only the band
-                # gap left between the first and second continuum bands.
-
-                # Load the _ranges.csv file to get the band gap:
-                ranges = np.loadtxt(range_file_name, delimiter=',', ndmin=2)
-                # tinker:
-                ranges[0, 1] = 0
-                ranges[1, 2] = ranges[1, 2] * 100
-                # save file again, drop higher bands:
-                np.savetxt(
-                    range_file_name,
-                    ranges[:2, :],
-                    header='bandnum, min, max',
-                    fmt=['%.0f', '%.6f', '%.6f'],
-                    delimiter=', ')
+                if prerequisite_runmode == 'queue':
+                    prerequisites.append(_queue_prerequisite(
+                        path.join(repo, jobname),
+                        _BandGapJob(sim, range_file_name)))
+                else:
+                    _correct_band_gap_ranges(range_file_name)
         else:
             # For high refractive indices and big radius, there are some small
             # gaps for TM modes. But we need to simulate more bands and
@@ -529,7 +589,13 @@ def TriHoles2D_Waveguide(
             project_bands_list.append(path.join(repo, jobname))
             range_file_name = path.join(
                 repo, jobname, jobname + '_' + mode + '_ranges.csv')
-            if not path.isfile(range_file_name):
+            if (prerequisite_runmode == 'queue' and
+                    path.join(repo, jobname) in _queued_prerequisites and
+                    not path.isfile(range_file_name)):
+                # queued before for another waveguide, e.g. of a sweep:
+                prerequisites.append(
+                    _queued_prerequisites[path.join(repo, jobname)])
+            elif not path.isfile(range_file_name):
                 # does not exist, so start simulation:
                 log.info('unperturbed structure not yet simulated at '
                          'k_wg={0}. Running now...'.format(ky))
@@ -547,7 +613,7 @@ def TriHoles2D_Waveguide(
                     numbands=defaults.num_projected_bands,
                     resolution=resolution,
                     mesh_size=mesh_size,
-                    runmode='sim' if runmode.startswith('s') else '',
+                    runmode=prerequisite_runmode,
                     num_processors=num_processors,
                     containing_folder=repo,
                     save_field_patterns=False,
@@ -566,6 +632,9 @@ def TriHoles2D_Waveguide(
                             ))
                     )
                     return
+                if prerequisite_runmode == 'queue':
+                    prerequisites.append(_queue_prerequisite(
+                        path.join(repo, jobname), sim))
 
     # If a shift is used, inversion symmetry is broken:
     if ((first_row_longitudinal_shift or second_row_longitudinal_shift) and
@@ -676,14 +745,14 @@ def TriHoles2D_Waveguide(
                  '(set! default-material {0})'.format(str(mat)),
         postcode='',
         runcode=runcode,
-        clear_subfolder=runmode.startswith('s') or runmode.startswith('c'))
+        clear_subfolder=runmode.startswith(('s', 'c', 'q')))
 
     draw_bands_title = (
         '2D hex. PhC W1; {0}, radius={1:0.3f}'.format(
             mat.name, radius) +
         bands_title_appendix)
 
-    return do_runmode(
+    result = do_runmode(
         sim, runmode, num_processors, draw_bands_title,
         plot_crop_y=plot_crop_y,
         convert_field_patterns=convert_field_patterns,
@@ -693,6 +762,9 @@ def TriHoles2D_Waveguide(
         project_bands_list=project_bands_list,
         color_by_parity='y'
     )
+    if runmode.startswith('q'):
+        result.requires.extend(prerequisites)
+    return result
 
 
 def TriHolesSlab3D_Waveguide(
@@ -762,6 +834,11 @@ def TriHolesSlab3D_Waveguide(
         ''       : just create and return the simulation object
         'ctl'    : create the sim object and save the ctl file
         'sim' (default): run the simulation and do all postprocessing
+        'queue'  : create and return a pipeline.Job, which can be run
+                   together with others with pipeline.run_pipelined.
+                   Missing simulations of the unperturbed structure
+                   (for the projected bands) are not run now, but
+                   added as jobs required by the returned job.
         'postpc' : do all postprocessing; simulation should have run
                    before!
         'display': display all pngs done during postprocessing. This is
@@ -794,7 +871,7 @@ def TriHolesSlab3D_Waveguide(
     the band diagrams are automatically cropped before the last band
     if plot_crop_y is True, alternatively use plot_crop_y to specify
     the max. y-value where the plot will be cropped.
-    :return: the Simulation object
+    :return: the Simulation object (a pipeline.Job if runmode is 'queue')
 
     """
     mat = Dielectric(material)
@@ -828,6 +905,10 @@ def TriHolesSlab3D_Waveguide(
     # simulations for each k-vec of this simulation (or only one simulation,
     # if the plotted band gap does not change from k-vec to k-vec):
     project_bands_list = []
+    # In queue mode, the simulations of the unperturbed structure are
+    # not run now, but returned as pipeline.Jobs required by this job:
+    prerequisite_runmode = {'s': 'sim', 'q': 'queue'}.get(runmode[:1], '')
+    prerequisites = []
 
     if plot_complete_band_gap:
         if mode == 'zeven':
@@ -840,7 +921,13 @@ def TriHolesSlab3D_Waveguide(
             project_bands_list.append(path.join(repo, jobname))
             range_file_name = path.join(
                 repo, jobname, jobname + '_' + mode + '_ranges.csv')
-            if not path.isfile(range_file_name):
+            if (prerequisite_runmode == 'queue' and
+                    path.join(repo, jobname) in _queued_prerequisites and
+                    not path.isfile(range_file_name)):
+                # queued before for another waveguide, e.g. of a sweep:
+                prerequisites.append(
+                    _queued_prerequisites[path.join(repo, jobname)])
+            elif not path.isfile(range_file_name):
                 # does not exist, so start simulation:
                 log.info('unperturbed structure not yet simulated for '
                          'band gap. Running now...')
@@ -858,7 +945,7 @@ def TriHolesSlab3D_Waveguide(
                     resolution=resolution,
                     mesh_size=mesh_size,
                     supercell_z=supercell_z,
-                    runmode='sim' if runmode.startswith('s') else '',
+                    runmode=prerequisite_runmode,
                     num_processors=num_processors,
                     containing_folder=repo,
                     save_field_patterns=False,
@@ -878,25 +965,12 @@ def TriHolesSlab3D_Waveguide(
                     )
                     return
 
-                # Now, the _ranges.csv file is wrong, because we did not
-                # simulate the full K-Space, especially Gamma is
-                # missing. Correct the ranges so the first band starts
-                # at 0 and the second band is the last band and goes to
-                # a very high value. This way, there is only the band
-                # gap left between the first and second continuum bands.
-
-                # Load the _ranges.csv file to get the band gap:
-                ranges = np.loadtxt(range_file_name, delimiter=',', ndmin=2)
-                # tinker:
-                ranges[0, 1] = 0
-                ranges[1, 2] = ranges[1, 2] * 100
-                # save file again, drop higher bands:
-                np.savetxt(
-                    range_file_name,
-                    ranges[:2, :],
-                    header='bandnum, min, max',
-                    fmt=['%.0f', '%.6f', '%.6f'],
-                    delimiter=', ')
+                if prerequisite_runmode == 'queue':
+                    prerequisites.append(_queue_prerequisite(
+                        path.join(repo, jobname),
+                        _BandGapJob(sim, range_file_name)))
+                else:
+                    _correct_band_gap_ranges(range_file_name)
         else:
             # For high refractive indices and big radius, there are some
             # small gaps for TM modes. But we need to simulate more
@@ -936,7 +1010,13 @@ def TriHolesSlab3D_Waveguide(
             project_bands_list.append(path.join(repo, jobname))
             range_file_name = path.join(
                 repo, jobname, jobname + '_' + mode + '_ranges.csv')
-            if not path.isfile(range_file_name):
+            if (prerequisite_runmode == 'queue' and
+                    path.join(repo, jobname) in _queued_prerequisites and
+                    not path.isfile(range_file_name)):
+                # queued before for another waveguide, e.g. of a sweep:
+                prerequisites.append(
+                    _queued_prerequisites[path.join(repo, jobname)])
+            elif not path.isfile(range_file_name):
                 # does not exist, so start simulation:
                 log.info('unperturbed structure not yet simulated at '
                          'k_wg={0}. Running now...'.format(ky))
@@ -956,7 +1036,7 @@ def TriHolesSlab3D_Waveguide(
                     resolution=resolution,
                     supercell_z=supercell_z,
                     mesh_size=mesh_size,
-                    runmode='sim' if runmode.startswith('s') else '',
+                    runmode=prerequisite_runmode,
                     num_processors=num_processors,
                     containing_folder=repo,
                     save_field_patterns=False,
@@ -975,6 +1055,9 @@ def TriHolesSlab3D_Waveguide(
                             ))
                     )
                     return
+                if prerequisite_runmode == 'queue':
+                    prerequisites.append(_queue_prerequisite(
+                        path.join(repo, jobname), sim))
 
     # If a shift is used, inversion symmetry is broken:
     if ((first_row_longitudinal_shift or second_row_longitudinal_shift) and
@@ -1108,7 +1191,7 @@ def TriHolesSlab3D_Waveguide(
         initcode=defaults.default_initcode,
         postcode='',
         runcode=runcode,
-        clear_subfolder=runmode.startswith('s') or runmode.startswith('c'))
+        clear_subfolder=runmode.startswith(('s', 'c', 'q')))
 
     draw_bands_title = (
         'Hex. PhC slab W1; {0}, thickness={1:0.3f}, radius={2:0.3f}'.format(
@@ -1117,7 +1200,7 @@ def TriHolesSlab3D_Waveguide(
             radius) +
         bands_title_appendix)
 
-    return do_runmode(
+    result = do_runmode(
         sim, runmode, num_processors, draw_bands_title,
         plot_crop_y=plot_crop_y,
         convert_field_patterns=convert_field_patterns,
@@ -1127,4 +1210,7 @@ def TriHolesSlab3D_Waveguide(
         project_bands_list=project_bands_list,
         color_by_parity='y'
     )
+    if runmode.startswith('q'):
+        result.requires.extend(prerequisites)
+    return result
 
@@ -0,0 +1,240 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Pipelined sweeps: post-process job N while MPB runs job N+1.
+
+In a sweep run with do_runmode (e.g. TriHoles2D with runmode='sim' in a
+loop), the processors are idle while a job is post-processed (csv
+export, png conversion, plotting) and vice versa. run_pipelined
+overlaps the stages instead: MPB runs in one pool of worker processes,
+the post-processing in another one, and each job is handed to the
+post-processing pool as soon as its simulation finished. The throughput
+of the sweep is then limited by the slower stage, not by the sum of
+both.
+
+The jobs are created with runmode='queue' instead of 'sim', e.g.:
+
+    jobs = [TriHoles2D(radius=r, runmode='queue', num_processors=2)
+            for r in radii]
+    results = pipeline.run_pipelined(jobs, mpb_workers=1, post_workers=1)
+
+The workers use separate processes, because pyplot is not thread safe.
+Each job logs to its own log file, as with runmode='sim'.
+
+A job can require other jobs to be finished (simulated and
+post-processed) before its simulation starts, e.g. the waveguide
+functions in phc_simulations.py with runmode='queue' return jobs that
+require the simulations of the unperturbed structures used for the
+projected bands. These prerequisites are run by run_pipelined as well;
+jobs with the same working directory are only run once.
+
+"""
+
+from multiprocessing import Pool
+try:
+    from queue import Queue
+except ImportError:
+    # Python 2:
+    from Queue import Queue
+import log
+
+
+class Job(object):
+    def __init__(self, sim, num_processors=2, **postpc_args):
+        """A simulation queued for run_pipelined.
+
+        :param sim: the Simulation object.
+        :param num_processors: the number of processors used by MPB.
+        :param postpc_args: the keyword arguments of do_runmode used for
+        post-processing (bands_plot_title, plot_crop_y, x_axis_hint
+        etc.).
+
+        """
+        self.sim = sim
+        self.num_processors = num_processors
+        self.postpc_args = postpc_args
+        # Jobs, which must be finished before this job is run:
+        self.requires = []
+
+    def get_jobname(self):
+        return self.sim.jobname
+    jobname = property(get_jobname)
+
+    def get_key(self):
+        """Return the working directory of the simulation, which
+        identifies the job: jobs with the same key are only run once by
+        run_pipelined."""
+        return self.sim.workingdir
+    key = property(get_key)
+
+    def setup_logger(self):
+        """Continue logging to the log file of the simulation (called in
+        the worker processes)."""
+        log.reset_logger()
+        log.setup_logger(
+            'root.' + self.sim.jobname, self.sim.log_file, self.sim.quiet,
+            redirect_stderr=True)
+
+    def run_mpb(self):
+        """Run the simulation and return MPB's return code."""
+        return self.sim.run_simulation(num_processors=self.num_processors)
+
+    def post_process(self):
+        """Do all post-processing of do_runmode (csv files, pngs, band
+        diagram and field pattern plots). Return True on success."""
+        # imported here, because utility imports this module:
+        from utility import do_runmode
+        return bool(do_runmode(
+            self.sim, 'postpc', self.num_processors, **self.postpc_args))
+
+
+def _run_stage(args):
+    """Run *stage* (name of a method) of *job* in a worker process and
+    return (index, result), with result None if an exception occurred."""
+    index, job, stage = args
+    job.setup_logger()
+    try:
+        result = getattr(job, stage)()
+    except Exception:
+        log.exception('{0} of job {1} failed:'.format(stage, job.jobname))
+        result = None
+    finally:
+        log.reset_logger()
+    return index, result
+
+
+def _submit(pool, done, index, job, stage):
+    """Run *stage* of *job* in *pool* and put (stage, index, result) in
+    the queue *done* when it finished. The result is None, if the stage
+    failed outside of _run_stage, e.g. if the job could not be pickled.
+
+    """
+    def on_error(error):
+        log.error('{0} of job {1} failed: {2!r}'.format(
+            stage, job.jobname, error))
+        done.put((stage, index, None))
+
+    pool.apply_async(
+        _run_stage, ((index, job, stage),),
+        callback=lambda result: done.put((stage,) + result),
+        error_callback=on_error)
+
+
+def _collect_jobs(jobs):
+    """Return a list with all *jobs* and their prerequisites (see
+    Job.requires), each job only once and the prerequisites before the
+    jobs requiring them, a list with the indices of the prerequisites
+    of each job in this list and a list with the index of each of
+    *jobs* in this list."""
+    all_jobs = []
+    requires = []
+    indices = dict()
+
+    def add(job):
+        required = [add(other) for other in getattr(job, 'requires', [])]
+        # other job-like objects without key are identified by themselves:
+        key = getattr(job, 'key', job)
+        if key not in indices:
+            indices[key] = len(all_jobs)
+            all_jobs.append(job)
+            requires.append(required)
+        return indices[key]
+
+    return all_jobs, requires, [add(job) for job in jobs]
+
+
+def run_pipelined(jobs, mpb_workers=1, post_workers=1):
+    """Run the simulations of all *jobs* (and of the jobs they require)
+    and post-process them, with the post-processing of finished
+    simulations overlapping the simulations still running. A job is
+    only started when all jobs it requires finished successfully.
+
+    :param jobs: a list of Job objects, e.g. returned by the functions in
+    phc_simulations.py with runmode='queue'.
+    :param mpb_workers: the number of simulations running at the same
+    time. Each one uses the number of processors given to its job, so
+    choose mpb_workers * num_processors + post_workers not larger than
+    the number of processors available.
+    :param post_workers: the number of jobs post-processed at the same
+    time.
+    :return: a list with a tuple (returncode, post_processed) for each
+    job, in the order of *jobs*: the return code of MPB (None if the
+    simulation raised an exception or was not started, because a job it
+    requires failed) and whether the post-processing succeeded.
+
+    """
+    all_jobs, requires, job_indices = _collect_jobs(jobs)
+    results = [(None, False)] * len(all_jobs)
+    # indices of jobs not started yet, and of successfully finished jobs:
+    waiting = list(range(len(all_jobs)))
+    succeeded = set()
+    finished = set()
+    # (stage, index, result) of all finished stages, put there by the
+    # result handler threads of the pools:
+    done = Queue()
+    mpb_pool = Pool(mpb_workers)
+    post_pool = Pool(post_workers)
+    try:
+        while len(finished) < len(all_jobs):
+            # start all jobs whose prerequisites are finished:
+            for index in list(waiting):
+                if not all(i in finished for i in requires[index]):
+                    continue
+                waiting.remove(index)
+                if not all(i in succeeded for i in requires[index]):
+                    log.error('pipelined sweep: a job required by {0} '
+                              'failed, will skip it'.format(
+                                all_jobs[index].jobname))
+                    finished.add(index)
+                    continue
+                _submit(mpb_pool, done, index, all_jobs[index], 'run_mpb')
+            if len(finished) == len(all_jobs):
+                # the last jobs were skipped
+                break
+            # wait for the next stage to finish:
+            stage, index, result = done.get()
+            job = all_jobs[index]
+            if stage == 'run_mpb':
+                results[index] = (result, False)
+                if result == 0:
+                    log.info('pipelined sweep: simulation {0} finished, '
+                             'queued for post-processing'.format(
+                                job.jobname))
+                    _submit(post_pool, done, index, job, 'post_process')
+                else:
+                    log.error('pipelined sweep: simulation {0} failed, '
+                              'returncode: {1}'.format(job.jobname, result))
+                    finished.add(index)
+            else:
+                results[index] = (results[index][0], bool(result))
+                if result:
+                    succeeded.add(index)
+                finished.add(index)
+    except BaseException:
+        # e.g. KeyboardInterrupt: don't wait for the running jobs:
+        mpb_pool.terminate()
+        post_pool.terminate()
+        raise
+    mpb_pool.close()
+    post_pool.close()
+    mpb_pool.join()
+    post_pool.join()
+    return [results[index] for index in job_indices]
@@ -0,0 +1,259 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Opt-in profiling of the stages of the simulation pipeline.
+
+The pipeline (do_runmode, Simulation.post_process,
+Simulation.fieldpatterns_to_png, draw_bands etc.) is divided into
+stages with the stage context manager of this module. As long as
+profiling is not enabled, the stages cost (almost) nothing. After
+
+    prof = profiler.enable()
+
+every stage records its wall time, CPU time of Python and of the called
+external programs, and the number and duration of the external program
+calls (per program, e.g. mpb-data and h5topng, counted with the
+'subprocess' events of log.event). do_runmode saves a timing report for
+every job (jobname_timing.json in the simulation folder), and
+prof.report() returns a report aggregated over all jobs, e.g. of a
+sweep. Reports saved earlier can be aggregated with aggregate_reports.
+
+"""
+
+from __future__ import division
+from os import path
+import os
+import time
+import json
+from contextlib import contextmanager
+from functools import wraps
+import log
+
+try:
+    _process_time = time.process_time
+except AttributeError:
+    # Python 2
+    _process_time = time.clock
+
+# the active Profiler, or None if profiling is disabled:
+_active = None
+
+
+def _children_cpu_time():
+    times = os.times()
+    return times[2] + times[3]
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+_null_context = _NullContext()
+
+
+class Profiler(object):
+    def __init__(self):
+        """Records the timing of stages. Don't create it directly, use
+        enable()."""
+        # finished stages, each a dictionary:
+        self.records = []
+        # currently running stages:
+        self._stack = []
+        self.job = ''
+
+    def _on_event(self, record):
+        """Event handler (see log.event) counting external program calls
+        in all running stages."""
+        if not self._stack:
+            return
+        kind = record['event']
+        if kind == 'subprocess':
+            command = record.get('command', '').split()
+            program = path.basename(command[0]) if command else '?'
+        elif kind == 'job_finish':
+            program = 'mpb'
+        else:
+            return
+        duration = record.get('duration', 0)
+        for entry in self._stack:
+            entry['subprocesses'] += 1
+            entry['subprocess_time'] += duration
+            count, total = entry['programs'].get(program, (0, 0))
+            entry['programs'][program] = (count + 1, total + duration)
+
+    @contextmanager
+    def stage(self, name):
+        entry = dict(
+            job=self.job,
+            stage='/'.join([e['name'] for e in self._stack] + [name]),
+            name=name, subprocesses=0, subprocess_time=0.0, programs={})
+        self._stack.append(entry)
+        wall = time.time()
+        cpu = _process_time()
+        child_cpu = _children_cpu_time()
+        try:
+            yield entry
+        finally:
+            entry['wall_time'] = time.time() - wall
+            entry['cpu_time'] = _process_time() - cpu
+            entry['child_cpu_time'] = _children_cpu_time() - child_cpu
+            self._stack.remove(entry)
+            self.records.append(entry)
+
+    def get_records(self, job=None):
+        """Return the records of all stages of *job* (all jobs if None)."""
+        return [rec for rec in self.records
+                if job is None or rec['job'] == job]
+
+    def report(self, job=None):
+        """Return a report (string) with the timing of each stage,
+        aggregated over all jobs (or only for *job*)."""
+        return format_report(self.get_records(job))
+
+    def save_job_report(self, job, filename):
+        """Save the records of *job* to the json file *filename*."""
+        with open(filename, 'w') as f:
+            json.dump(self.get_records(job), f, indent=1)
+
+
+def enable():
+    """Enable profiling and return the new active Profiler."""
+    global _active
+    disable()
+    _active = Profiler()
+    log.event_handlers.append(_active._on_event)
+    return _active
+
+
+def disable():
+    """Disable profiling and return the Profiler used until now (or None).
+    """
+    global _active
+    prof = _active
+    if prof is not None:
+        log.event_handlers.remove(prof._on_event)
+    _active = None
+    return prof
+
+
+def get_active():
+    """Return the active Profiler, or None if profiling is disabled."""
+    return _active
+
+
+def stage(name):
+    """Return a context manager timing the enclosed code as stage *name*
+    (nested in the currently running stage), if profiling is enabled.
+
+    """
+    if _active is None:
+        return _null_context
+    return _active.stage(name)
+
+
+def profiled(name):
+    """Decorator timing every call of the decorated function as stage
+    *name*."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def job(jobname, folder=None):
+    """Context manager for the stages of a job. All stages in the
+    with-block belong to *jobname*. At the end, the timing report of the
+    job is logged and saved to folder/jobname_timing.json (if *folder*
+    is given). Does nothing if profiling is disabled.
+
+    """
+    prof = _active
+    if prof is None:
+        yield
+        return
+    previous = prof.job
+    prof.job = jobname
+    try:
+        with prof.stage('job'):
+            yield
+    finally:
+        prof.job = previous
+        log.info('timing report of job {0}:\n{1}'.format(
+            jobname, prof.report(jobname)))
+        if folder is not None and path.isdir(folder):
+            prof.save_job_report(
+                jobname, path.join(folder, jobname + '_timing.json'))
+
+
+def format_report(records):
+    """Return a table (string) with the timing of the stages in
+    *records*, aggregated by stage."""
+    stages = []
+    totals = dict()
+    for rec in records:
+        if rec['stage'] not in totals:
+            stages.append(rec['stage'])
+            totals[rec['stage']] = dict(
+                calls=0, wall_time=0.0, cpu_time=0.0, child_cpu_time=0.0,
+                subprocesses=0, programs={})
+        tot = totals[rec['stage']]
+        tot['calls'] += 1
+        for key in ['wall_time', 'cpu_time', 'child_cpu_time',
+                    'subprocesses']:
+            tot[key] += rec[key]
+        for program, (count, duration) in rec['programs'].items():
+            c, d = tot['programs'].get(program, (0, 0))
+            tot['programs'][program] = (c + count, d + duration)
+
+    # show parents before their children:
+    stages.sort(key=lambda s: s.split('/'))
+    lines = ['{0:<40} {1:>6} {2:>10} {3:>10} {4:>10} {5:>6}'.format(
+        'stage', 'calls', 'wall [s]', 'cpu [s]', 'child [s]', 'procs')]
+    for name in stages:
+        tot = totals[name]
+        depth = name.count('/')
+        lines.append(
+            '{0:<40} {1:>6} {2:>10.2f} {3:>10.2f} {4:>10.2f} {5:>6}'.format(
+                '  ' * depth + name.split('/')[-1], tot['calls'],
+                tot['wall_time'], tot['cpu_time'], tot['child_cpu_time'],
+                tot['subprocesses']))
+        for program in sorted(tot['programs']):
+            count, duration = tot['programs'][program]
+            lines.append('{0:<40} {1:>6} {2:>10.2f}'.format(
+                '  ' * (depth + 1) + '[' + program + ']', count, duration))
+    return '\n'.join(lines)
+
+
+def aggregate_reports(filenames):
+    """Load the job reports saved in *filenames* (jobname_timing.json
+    files, e.g. of all simulations of a sweep) and return a report
+    aggregated over all of them."""
+    records = []
+    for fname in filenames:
+        with open(fname, 'r') as f:
+            records.extend(json.load(f))
+    return format_report(records)
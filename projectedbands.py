@@ -0,0 +1,175 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""A consolidated table of the band ranges used for projected bands.
+
+The post-processing of a waveguide simulation needs the band ranges of
+the unperturbed structure at every k-vector of the waveguide (the
+_ranges.csv files of the simulations in project_bands_list, usually one
+folder per k-vector). Instead of parsing all these small csv files every
+time, they are collected in one binary table (see
+defaults.projected_bands_table_file) in the folder containing the
+simulation folders. The table covers all k-vectors and modes. It is
+brought up to date when it is used: only csv files that are new or
+changed since (compared by size and modification time) are parsed
+again, so the table grows as the simulations of the unperturbed
+structure finish.
+
+"""
+
+from __future__ import division
+from os import path, rename, getpid
+import numpy as np
+from artifacts import file_signature
+import defaults
+import log
+
+# tables loaded in this process, by file name: (file signature, table)
+_loaded = dict()
+
+
+def table_file(range_file):
+    """Return the name of the table containing *range_file* (the
+    _ranges.csv file in a simulation folder)."""
+    simfolder = path.dirname(path.abspath(range_file))
+    return path.join(
+        path.dirname(simfolder), defaults.projected_bands_table_file)
+
+
+def _read_entries(filename):
+    """Return the entries of the table saved in *filename* (an empty
+    dictionary if it does not exist or is not readable), keyed like in
+    ProjectedBandsTable."""
+    entries = dict()
+    if not path.isfile(filename):
+        return entries
+    try:
+        with np.load(filename) as data:
+            offsets = data['offsets']
+            for i, (key, sig, shape) in enumerate(zip(
+                    data['keys'], data['signatures'], data['shapes'])):
+                entries[str(key)] = (
+                    str(sig),
+                    data['data'][offsets[i]:offsets[i + 1]].reshape(shape))
+    except (IOError, ValueError, KeyError):
+        log.warning('could not read projected bands table {0}, will '
+                    'rebuild it.'.format(filename))
+        return dict()
+    return entries
+
+
+class ProjectedBandsTable(object):
+    def __init__(self, filename):
+        """The band ranges of many simulations, saved in *filename*.
+
+        The entries are keyed by the name of the _ranges.csv file
+        relative to the folder of the table (i.e. simulation folder and
+        file name), so the table stays valid if the whole folder is
+        moved.
+
+        """
+        self.filename = filename
+        # key: (signature of the csv file, array):
+        self._entries = _read_entries(filename)
+        self._changed = False
+
+    def _key(self, range_file):
+        return path.relpath(path.abspath(range_file),
+                            path.dirname(path.abspath(self.filename)))
+
+    def get(self, range_file):
+        """Return the band ranges of *range_file* (array as loaded from the
+        csv file), loading the file only if it is not in the table or
+        changed since. Return None if the file does not exist."""
+        key = self._key(range_file)
+        sig = file_signature(range_file)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == sig:
+            return entry[1]
+        try:
+            rng = np.loadtxt(range_file, delimiter=',', ndmin=2)
+        except IOError:
+            # file not found
+            return None
+        self._entries[key] = (sig, rng)
+        self._changed = True
+        return rng
+
+    def save(self):
+        """Save the table, if it changed since it was loaded."""
+        if not self._changed:
+            return
+        # Other processes (e.g. post-processing other simulations of a
+        # pipelined sweep) might have saved entries since this table was
+        # loaded; keep them:
+        for key, entry in _read_entries(self.filename).items():
+            if key not in self._entries:
+                self._entries[key] = entry
+        keys = sorted(self._entries)
+        arrays = [self._entries[k][1] for k in keys]
+        tmpfile = '{0}.{1}.tmp.npz'.format(self.filename, getpid())
+        np.savez(
+            tmpfile,
+            keys=np.array(keys, dtype=str),
+            signatures=np.array([self._entries[k][0] for k in keys],
+                                dtype=str),
+            shapes=np.array([a.shape for a in arrays], dtype=int).reshape(
+                -1, 2),
+            offsets=np.cumsum([0] + [a.size for a in arrays]),
+            data=np.concatenate([a.ravel() for a in arrays] + [[]]))
+        # replace atomically, the table might be read by other processes
+        # post-processing at the same time:
+        rename(tmpfile, self.filename)
+        self._changed = False
+
+
+def _get_table(filename):
+    """Return the ProjectedBandsTable saved in *filename*, reusing the one
+    loaded before in this process if the file did not change."""
+    sig = file_signature(filename)
+    if filename in _loaded and _loaded[filename][0] == sig:
+        return _loaded[filename][1]
+    table = ProjectedBandsTable(filename)
+    _loaded[filename] = (sig, table)
+    return table
+
+
+def load_ranges(range_files):
+    """Return a list with the band ranges of each of the *range_files*
+    (None for files that don't exist), taken from the consolidated
+    tables; the tables are updated with new or changed files."""
+    tables = dict()
+    result = []
+    for fname in range_files:
+        tfile = table_file(fname)
+        if tfile not in tables:
+            tables[tfile] = _get_table(tfile)
+        result.append(tables[tfile].get(fname))
+    for tfile, table in tables.items():
+        if table._changed:
+            try:
+                table.save()
+            except (IOError, OSError):
+                log.warning('could not save projected bands table '
+                            '{0}.'.format(tfile))
+            else:
+                _loaded[tfile] = (file_signature(tfile), table)
+    return result
@@ -0,0 +1,299 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Compute the dielectric function of a Geometry on MPB's grid in Python.
+
+This gives a quick preview of a geometry (e.g. to find misplaced objects)
+without running MPB and h5topng. Like MPB, the grid is spanned by the
+lattice vectors, i.e. for triangular lattices the grid is not
+rectangular in cartesian coordinates (same as MPB's epsilon.h5 before
+it is transformed with mpb-data). Objects overlapping the cell boundary
+are continued periodically, and later objects take precedence over
+earlier ones.
+
+"""
+
+from __future__ import division
+import numpy as np
+import matplotlib.pyplot as plt
+from objects import Dielectric, ObjectArray, RodArray, BlockArray
+from scheme import scheme_to_float
+import data
+import log
+
+
+def material_epsilon(material, anisotropic_component=0):
+    """Return the (isotropic) epsilon of *material*, which can be a
+    Dielectric object or the name of a material, e.g. 'air'. For
+    anisotropic materials, only *anisotropic_component* is returned.
+
+    """
+    if isinstance(material, Dielectric):
+        eps = material.epsilon
+    elif material in ('air', 'vacuum'):
+        eps = 1.0
+    elif material in data.dielectrics:
+        eps = data.dielectrics[material]
+    else:
+        log.warning('rasterize: unknown material {0!r}, will use '
+                    'epsilon=1.'.format(material))
+        eps = 1.0
+    if isinstance(eps, (list, tuple)):
+        eps = eps[anisotropic_component]
+    return float(eps)
+
+
+def _cell_sizes(geometry):
+    """Return the lattice sizes (0 for 'no-size')."""
+    return np.array([
+        0.0 if s == 'no-size' else scheme_to_float(s)
+        for s in [geometry.width, geometry.height, geometry.depth]])
+
+
+def grid_shape(geometry, resolution):
+    """Return the number of grid points in each lattice direction."""
+    return tuple(
+        max(int(round(s * resolution)), 1) for s in _cell_sizes(geometry))
+
+
+class _Painter(object):
+    """Paints objects on the grid of a geometry. Many objects of the
+    same shape are painted at once, each in a window of grid points
+    around its center; all windows have the same shape, so that the
+    inside tests can be done with broadcasting.
+
+    """
+    # maximum number of grid points handled at once (limits the memory
+    # used for many objects):
+    chunk_points = 2 ** 20
+
+    def __init__(self, geometry, resolution, eps, z=None):
+        self.eps = eps
+        self.sizes = _cell_sizes(geometry)
+        self.shape = grid_shape(geometry, resolution)
+        # unit lattice vectors (rows) and their reciprocal vectors:
+        self.units = geometry.basis / np.where(
+            self.sizes > 0, self.sizes, 1)[:, np.newaxis]
+        self.recips = np.linalg.inv(self.units).transpose()
+        # only paint the plane z (lattice coordinates), if given:
+        self.z = z
+
+    def _window(self, dim, centers, halfwidth):
+        """Return the grid indices (wrapped into the cell) and the
+        lattice coordinates (of the periodic images closest to the
+        centers) of the grid points in dimension *dim* with a distance up
+        to *halfwidth* from *centers*. Both are arrays with shape
+        (len(centers), number_of_points); a few more points than needed
+        may be returned for some centers.
+
+        """
+        size = self.sizes[dim]
+        num = self.shape[dim]
+        count = len(centers)
+        if size == 0:
+            # no extent in this direction, only the plane 0:
+            return np.zeros((count, 1), dtype=int), np.zeros((count, 1))
+        if dim == 2 and self.z is not None:
+            index = int(round((self.z / size + 0.5) * num)) % num
+            return (np.full((count, 1), index, dtype=int),
+                    np.full((count, 1), self.z, dtype=float))
+        step = size / num
+        if 2 * halfwidth >= size:
+            # the objects cover the whole cell in this direction:
+            indices = np.arange(num)
+            coords = indices * step - size / 2
+            # use the periodic images closest to the centers:
+            coords = coords + size * np.round(
+                (centers[:, np.newaxis] - coords) / size)
+            return np.broadcast_to(indices, (count, num)), coords
+        jmin = np.ceil((centers - halfwidth + size / 2) / step).astype(int)
+        jmax = np.floor((centers + halfwidth + size / 2) / step).astype(int)
+        width = max(int(np.max(jmax - jmin)) + 1, 0) if count else 0
+        indices = jmin[:, np.newaxis] + np.arange(width)
+        return indices % num, indices * step - size / 2
+
+    def _window_size(self, halfwidths):
+        """Return (an upper bound of) the number of grid points in a
+        window with *halfwidths*."""
+        points = 1
+        for dim in range(3):
+            size = self.sizes[dim]
+            if size == 0 or (dim == 2 and self.z is not None):
+                continue
+            num = self.shape[dim]
+            points *= min(num, int(2 * halfwidths[dim] * num / size) + 2)
+        return points
+
+    def _chunks(self, count, halfwidths):
+        """Yield slices splitting *count* objects into chunks with not
+        more than chunk_points grid points in all windows."""
+        step = max(self.chunk_points // self._window_size(halfwidths), 1)
+        for start in range(0, count, step):
+            yield slice(start, start + step)
+
+    def _windows(self, centers, halfwidths):
+        """Return the flat indices in eps and the lattice coordinates
+        relative to the centers (shape (len(centers), a, b, c, 3)) of
+        the grid points in the windows around *centers*."""
+        idx, rel = zip(*[
+            self._window(i, centers[:, i], halfwidths[i]) for i in range(3)])
+        rel = [coords - centers[:, i:i + 1] for i, coords in enumerate(rel)]
+        shape = (len(centers),) + tuple(r.shape[1] for r in rel)
+        rel = np.stack([
+            np.broadcast_to(rel[0][:, :, None, None], shape),
+            np.broadcast_to(rel[1][:, None, :, None], shape),
+            np.broadcast_to(rel[2][:, None, None, :], shape)], axis=-1)
+        if self.eps.ndim == 2:
+            flat = (idx[0][:, :, None, None] * self.eps.shape[1] +
+                    idx[1][:, None, :, None])
+        else:
+            flat = ((idx[0][:, :, None, None] * self.eps.shape[1] +
+                     idx[1][:, None, :, None]) * self.eps.shape[2] +
+                    idx[2][:, None, None, :])
+        return flat, rel
+
+    def paint(self, flat, inside, values):
+        """Set eps to *values* (one for each object) at the grid points
+        *inside* the objects. Where objects overlap, the later object
+        takes precedence."""
+        if self.eps.ndim == 2:
+            # only paint the first plane of the window:
+            flat = flat[:, :, :, :1]
+            inside = inside[:, :, :, :1]
+        flat = np.broadcast_to(flat, inside.shape)[inside]
+        values = np.broadcast_to(
+            values[:, None, None, None], inside.shape)[inside]
+        # the last (i.e. latest object's) occurrence of each grid point:
+        last = len(flat) - 1 - np.unique(flat[::-1], return_index=True)[1]
+        self.eps.flat[flat[last]] = values[last]
+
+    def rods(self, centers, radii, heights, values):
+        """Paint rods (cylinders along z) with arrays of *centers*
+        (lattice coordinates), *radii*, *heights* and *values*."""
+        if not len(centers):
+            return
+        height = np.max(heights)
+        halfwidths = [
+            np.max(radii) * np.linalg.norm(self.recips[i][:2])
+            for i in range(2)]
+        halfwidths.append(height / 2 if np.isfinite(height) else np.inf)
+        for part in self._chunks(len(centers), halfwidths):
+            flat, rel = self._windows(centers[part], halfwidths)
+            cart = rel.dot(self.units)
+            shape = (-1, 1, 1, 1)
+            inside = np.square(cart[..., 0]) + np.square(cart[..., 1]) <= (
+                np.square(radii[part]).reshape(shape))
+            inside &= np.abs(cart[..., 2]) <= (
+                heights[part].reshape(shape) / 2)
+            self.paint(flat, inside, values[part])
+
+    def blocks(self, centers, sizes, values):
+        """Paint blocks (with edges along the cartesian axes) with arrays
+        of *centers* (lattice coordinates), *sizes* (shape
+        (number_of_blocks, 3)) and *values*."""
+        if not len(centers):
+            return
+        half = np.max(sizes, axis=0) / 2
+        # extent of the blocks along the lattice vectors; ignore
+        # infinite sizes perpendicular to a lattice vector:
+        with np.errstate(invalid='ignore'):
+            halfwidths = np.nansum(np.abs(self.recips) * half, axis=1)
+        for part in self._chunks(len(centers), halfwidths):
+            flat, rel = self._windows(centers[part], halfwidths)
+            cart = rel.dot(self.units)
+            inside = np.all(
+                np.abs(cart) <= sizes[part, None, None, None, :] / 2,
+                axis=-1)
+            self.paint(flat, inside, values[part])
+
+
+def _value(expression):
+    if expression == 'infinity':
+        return np.inf
+    return scheme_to_float(expression)
+
+
+def rasterize_epsilon(
+        geometry, resolution, default_epsilon=1.0, z=0,
+        anisotropic_component=0):
+    """Return the dielectric function of *geometry* on MPB's grid.
+
+    :param geometry: the Geometry object.
+    :param resolution: the number of grid points per lattice constant
+    (same as Simulation.resolution).
+    :param default_epsilon: epsilon of the background (default-material).
+    :param z: the z-coordinate (lattice coordinates) of the plane to be
+    computed for 3D geometries. If None, the full 3D grid is returned.
+    :param anisotropic_component: the component used for anisotropic
+    materials.
+    :return: numpy array with shape (n1, n2) (or (n1, n2, n3) if z is
+    None and the geometry is 3D), where n1, n2 and n3 are the numbers of
+    grid points along the lattice vectors.
+
+    """
+    shape = grid_shape(geometry, resolution)
+    if z is not None or shape[2] == 1:
+        eps = np.empty(shape[:2])
+    else:
+        eps = np.empty(shape)
+    eps.fill(default_epsilon)
+    painter = _Painter(geometry, resolution, eps, z)
+
+    for obj in geometry.objects:
+        if isinstance(obj, ObjectArray):
+            values = np.array([
+                material_epsilon(m, anisotropic_component)
+                for m in obj.materials])[obj.material_indices]
+            if isinstance(obj, RodArray):
+                painter.rods(
+                    obj.centers, obj.radii, np.full(len(obj), np.inf),
+                    values)
+            elif isinstance(obj, BlockArray):
+                painter.blocks(obj.centers, obj.sizes, values)
+            continue
+        center = np.array([[_value(c) for c in (obj.x, obj.y, obj.z)]])
+        value = np.array(
+            [material_epsilon(obj.material, anisotropic_component)])
+        if obj.shape == 'cylinder':
+            painter.rods(
+                center, np.array([_value(obj.others['radius'])]),
+                np.array([_value(obj.others.get('height', 'infinity'))]),
+                value)
+        elif obj.shape == 'block':
+            painter.blocks(
+                center,
+                np.array([[_value(s) for s in obj.others['size'].split()]]),
+                value)
+        else:
+            log.warning('rasterize: cannot handle shape {0!r}, will skip '
+                        'object.'.format(obj.shape))
+    return eps
+
+
+def save_epsilon_png(eps, filename, cmap='gray_r'):
+    """Save the 2D epsilon array *eps* (e.g. from rasterize_epsilon) to
+    the png file *filename*, with the first lattice direction
+    vertical, like epsilon.png made by h5topng.
+
+    """
+    if eps.ndim == 3:
+        # only save the central plane:
+        eps = eps[:, :, eps.shape[2] // 2]
+    plt.imsave(filename, eps, cmap=cmap, origin='lower')
@@ -0,0 +1,103 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Evaluation of the simple Scheme expressions used in pyMPB.
+
+This module has no dependencies on the rest of pyMPB (or matplotlib), so
+it can be imported by the small data modules (kspace, geometry, objects,
+rasterize) without pulling in utility.
+
+"""
+
+from __future__ import division
+from math import sqrt
+
+
+def scheme_to_float(expression):
+    """Evaluate a simple numeric Scheme expression and return it as float.
+
+    Coordinates and sizes in pyMPB are often given as Scheme code, which
+    is evaluated by MPB only, e.g. '(/ -3)' or '(* (sqrt 3) 5)'. This
+    function evaluates these expressions in Python, so they can be used
+    before running MPB.
+
+    :param expression:
+        a number, a string with a number or a string with a Scheme
+        expression, which may contain nested calls of +, -, *, / and
+        sqrt.
+    :return: the value as float
+    :raises ValueError: if the expression could not be evaluated.
+
+    """
+    if not hasattr(expression, 'isalnum'):
+        # not a string, hopefully a number:
+        return float(expression)
+
+    tokens = expression.replace('(', ' ( ').replace(')', ' ) ').split()
+    if not tokens:
+        raise ValueError('cannot evaluate empty Scheme expression')
+
+    def evaluate(pos):
+        """Evaluate the expression starting at tokens[pos]; return the
+        value and the position after the expression."""
+        token = tokens[pos]
+        if token != '(':
+            if token == ')':
+                raise ValueError(
+                    'unbalanced parentheses in: {0}'.format(expression))
+            return float(token), pos + 1
+        func = tokens[pos + 1]
+        args = []
+        pos += 2
+        while pos < len(tokens) and tokens[pos] != ')':
+            val, pos = evaluate(pos)
+            args.append(val)
+        if pos >= len(tokens):
+            raise ValueError(
+                'unbalanced parentheses in: {0}'.format(expression))
+        if func == '+':
+            result = sum(args)
+        elif func == '*':
+            result = 1.0
+            for arg in args:
+                result *= arg
+        elif func == '-' and args:
+            result = -args[0] if len(args) == 1 else args[0] - sum(args[1:])
+        elif func == '/' and args:
+            if len(args) == 1:
+                result = 1.0 / args[0]
+            else:
+                result = args[0]
+                for arg in args[1:]:
+                    result /= arg
+        elif func == 'sqrt' and len(args) == 1:
+            result = sqrt(args[0])
+        else:
+            raise ValueError(
+                'unknown Scheme function "{0}" in: {1}'.format(
+                    func, expression))
+        return result, pos + 1
+
+    value, pos = evaluate(0)
+    if pos != len(tokens):
+        raise ValueError(
+            'could not evaluate Scheme expression: {0}'.format(expression))
+    return value
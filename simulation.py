@@ -13,20 +13,124 @@
     #along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 from __future__ import division, print_function
+import os
 from os import path, environ, remove, rename, mkdir
 import sys
 from shutil import rmtree
 import subprocess as sp
 import re
+import hashlib
+from types import GeneratorType
 import numpy as np
 import defaults
 import graphics
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
 from glob import glob1
-from utility import distribute_pattern_images
+from utility import distribute_pattern_images, scheme_to_float
 from kspace import KSpaceRectangular
 import log
+import artifacts
+import rasterize
+import costmodel
+import solverstats
+import profiler
+import projectedbands
+
+
+def _call(args, cwd):
+    """Call the external program *args* (list of program and arguments)
+    in the folder *cwd* and return its return code. Emits a 'subprocess'
+    event (see log.event).
+
+    """
+    with log.timed('subprocess', command=' '.join(args)) as ev:
+        ev['returncode'] = retcode = sp.call(args, cwd=cwd)
+    return retcode
+
+
+class _Return(object):
+    """Yielded last by the step generators (see _run_steps) with their
+    result *value*."""
+    def __init__(self, value):
+        self.value = value
+
+
+def _run_steps(steps, cwd):
+    """Run the generator *steps* and return its result.
+
+    The step generators (e.g. Simulation._epsilon_to_png_steps) contain
+    the logic of post-processing tasks that call external programs, but
+    do not call them themselves: they yield the programs to call (lists
+    of program and arguments), are sent the return codes, and finally
+    yield _Return(result). An OSError raised when calling a program is
+    thrown into the generator. This way, the same logic is used by the
+    blocking methods (with _call) and by the asyncio methods (see
+    asyncsim.run_steps). A step generator can also yield another step
+    generator, which is then run and its result sent back.
+
+    """
+    send = steps.send
+    value = None
+    while True:
+        try:
+            request = send(value)
+        except StopIteration:
+            return None
+        if isinstance(request, _Return):
+            steps.close()
+            return request.value
+        try:
+            if isinstance(request, GeneratorType):
+                value = _run_steps(request, cwd)
+            else:
+                value = _call(request, cwd)
+            send = steps.send
+        except OSError as err:
+            value = err
+            send = steps.throw
+
+
+def _md5(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+
+def _abbreviated_repr(value, note=''):
+    """Return repr(value), or only its length and md5 hash (and the
+    *note*) if it is longer than defaults.max_logged_ctl_size, e.g. for
+    geometries with thousands of objects.
+
+    """
+    text = repr(value)
+    if len(text) <= defaults.max_logged_ctl_size:
+        return text
+    return '<{0} with {1} characters, md5: {2}{3}>'.format(
+        type(value).__name__, len(text), _md5(text),
+        ', ' + note if note else '')
+
+def _wait_with_max_rss(process):
+    """Wait for the subprocess.Popen *process* to finish and return its
+    return code and the maximum resident memory (in kB) of the process
+    and its (finished) child processes, e.g. all MPB processes started
+    by mpirun. The memory is None where os.wait4 is not available.
+
+    """
+    if not hasattr(os, 'wait4'):
+        # e.g. Windows:
+        return process.wait(), None
+    pid, status, rusage = os.wait4(process.pid, 0)
+    if os.WIFSIGNALED(status):
+        retcode = -os.WTERMSIG(status)
+    else:
+        retcode = os.WEXITSTATUS(status)
+    # let the Popen object know that the process finished:
+    process.returncode = retcode
+    max_rss = rusage.ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS, kB on Linux and BSD:
+        max_rss //= 1024
+    return retcode, max_rss
+
 
 class Simulation(object): 
     def __init__(
@@ -162,6 +266,12 @@ class Simulation(object):
                     'root.' + self.jobname, self.log_file, self.quiet,
                     redirect_stderr=True)
 
+        if defaults.event_log_file:
+            # structured event stream (JSON lines) for monitoring:
+            log.setup_event_log(
+                path.join(self.workingdir, defaults.event_log_file),
+                job=self.jobname)
+
         # now we can log the stuff from before:
         if to_log:
             log.info('\n' + '\n'.join(to_log))
@@ -198,78 +308,149 @@ class Simulation(object):
 
         log.info(
             'pyMPB Simulation created with following properties:' + 
-            ''.join(['\npyMPBprop: {0}={1!r}'.format(key, val) for key, val in
-                self.__dict__.items()]) + '\n\n')
+            ''.join(['\npyMPBprop: {0}={1}'.format(
+                        key, _abbreviated_repr(
+                            val, 'will be written to ' +
+                                 path.join(self.workingdir, self.ctl_file)))
+                     for key, val in self.__dict__.items()]) + '\n\n')
         # TODO log all parameters of Simulation object in such a way
         # that it can be recreated exactly.
         # Maybe even add relevant parts of data.py and defaults.py
 
     def __str__(self):
         temp_dict = self.__dict__.copy()
-        temp_dict['geometry'] = ''.join(str(a) for \
-         a in self.geometry.objects)
+        temp_dict['geometry'] = self.geometry.objects_ctl
         temp_dict['lattice'] = self.geometry.lattice
         return (defaults.template%temp_dict)
 
     def write_ctl_file(self, where='./'):
+        """Write the ctl file to the folder *where* and return its
+        contents.
+
+        """
         filename = path.join(where, self.ctl_file)
+        ctl = str(self)
         log.info("writing ctl file to %s" % filename)
-        log.info("### ctl file for reference: ###\n" + 
-            str(self) + '\n### end of ctl file ###\n\n')
+        if len(ctl) > defaults.max_logged_ctl_size:
+            log.info("ctl file not logged, because it is too big "
+                     "({0} characters, md5: {1}), see {2}".format(
+                        len(ctl), _md5(ctl), filename))
+        else:
+            log.info("### ctl file for reference: ###\n" +
+                ctl + '\n### end of ctl file ###\n\n')
         with open(filename,'w') as input_file:
-            input_file.write(str(self))
+            input_file.write(ctl)
+        return ctl
 
     def run_simulation(self, num_processors=2):
-        self.write_ctl_file(self.workingdir)
-
-        mpb_call_str = defaults.mpb_call % dict(num_procs=num_processors)
+        ctl = self.write_ctl_file(self.workingdir)
+        args = self._get_mpb_args(num_processors)
 
         with open(self.out_file, 'w') as outputFile:
-            log.info("Using MPB " + defaults.mpbversion)
-            log.info("Running the MPB-computation using the following "
-                     "call:\n" +
-                " ".join([mpb_call_str, self.ctl_file]))
-            log.info("Writing MPB output to %s" % self.out_file)
-            # write Time and ctl as reference:     
-            outputFile.write("This is a simulation started by pyMPB\n")
-            starttime = datetime.now()
-            outputFile.write("Date: " + str(starttime) + "\n")
-            outputFile.write(
-                ["2D-Simulation\n", "3D-Simulation\n"]
-                [int(self.geometry.is3D)])
-            outputFile.write("\n=================================\n")
-            outputFile.write("=========== CTL INPUT ===========\n")
-            outputFile.write("=================================\n\n")
-            outputFile.write(str(self))
-            outputFile.write("\n\n==================================\n")
-            outputFile.write("=========== MPB OUTPUT ===========\n")
-            outputFile.write("==================================\n\n")
-            outputFile.flush()
-            log.info('MPB simulation is running... To see progress, please '
-                'check the output file %s' % self.out_file)
+            starttime = self._start_out_file(outputFile, ctl, num_processors)
             # run MPB, write output to outputFile:
             # TODO can we also pipe MPB output to stdout, so the user can
             # see progress?
-            p = sp.Popen(mpb_call_str.split() + [self.ctl_file], 
+            p = sp.Popen(args,
                                stdout=outputFile,
                                stderr=sp.STDOUT,
                                cwd=self.workingdir)
-            retcode = p.wait()
-            endtime = datetime.now()
-            outputFile.write("finished on: %s (duration: %s)\n" % 
-                             (str(endtime), str(endtime - starttime)))
-            outputFile.write("returncode: " + str(retcode))
-            log.info("Simulation finished, returncode: " + str(retcode))
+            retcode, max_rss = _wait_with_max_rss(p)
+            self._finish_out_file(outputFile, starttime, retcode, max_rss)
 
         return retcode
 
+    def _get_mpb_args(self, num_processors):
+        """Return the call of MPB (list of program and arguments)."""
+        mpb_call_str = defaults.mpb_call % dict(num_procs=num_processors)
+        log.info("Using MPB " + defaults.mpbversion)
+        log.info("Running the MPB-computation using the following "
+                 "call:\n" +
+            " ".join([mpb_call_str, self.ctl_file]))
+        return mpb_call_str.split() + [self.ctl_file]
+
+    def _start_out_file(self, outputFile, ctl, num_processors):
+        """Write the header (time and ctl as reference) to the opened
+        output file before MPB is started. Return the start time."""
+        log.info("Writing MPB output to %s" % self.out_file)
+        # write Time and ctl as reference:     
+        outputFile.write("This is a simulation started by pyMPB\n")
+        starttime = datetime.now()
+        outputFile.write("Date: " + str(starttime) + "\n")
+        outputFile.write(
+            "Number of processors: {0}\n".format(num_processors))
+        outputFile.write(
+            ["2D-Simulation\n", "3D-Simulation\n"]
+            [int(self.geometry.is3D)])
+        outputFile.write("\n=================================\n")
+        outputFile.write("=========== CTL INPUT ===========\n")
+        outputFile.write("=================================\n\n")
+        outputFile.write(ctl)
+        outputFile.write("\n\n==================================\n")
+        outputFile.write("=========== MPB OUTPUT ===========\n")
+        outputFile.write("==================================\n\n")
+        outputFile.flush()
+        log.info('MPB simulation is running... To see progress, please '
+            'check the output file %s' % self.out_file)
+        log.event('job_start', ncpu=num_processors,
+                  ctl_file=path.join(self.workingdir, self.ctl_file),
+                  out_file=self.out_file)
+        return starttime
+
+    def _finish_out_file(self, outputFile, starttime, retcode, max_rss=None):
+        """Write the footer (duration, memory, return code) to the
+        output file after MPB finished. *max_rss* is the maximum
+        resident memory of MPB in kB, or None if it is not known."""
+        endtime = datetime.now()
+        outputFile.write("finished on: %s (duration: %s)\n" % 
+                         (str(endtime), str(endtime - starttime)))
+        log.event('job_finish', returncode=retcode,
+                  duration=(endtime - starttime).total_seconds())
+        if max_rss is not None:
+            outputFile.write("max memory (RSS): %i kB\n" % max_rss)
+        outputFile.write("returncode: " + str(retcode))
+        log.info("Simulation finished, returncode: " + str(retcode))
+
+    def arun(self, num_processors=2, limit=None):
+        """Asynchronous version of run_simulation, to be awaited in an
+        asyncio event loop, e.g.:
+
+            retcode = await sim.arun(num_processors=2)
+
+        :param limit: an asyncio.Semaphore limiting the number of
+        concurrently running external programs (shared by all
+        simulations driven by the event loop), or None.
+
+        See asyncsim.py (Python 3 only).
+
+        """
+        import asyncsim
+        return asyncsim.run_simulation(self, num_processors, limit)
+
+    def apost_process(
+            self, convert_field_patterns=True, project_bands_list=None,
+            force=False, limit=None):
+        """Asynchronous version of post_process, to be awaited in an
+        asyncio event loop. The external programs (mpb-data, h5topng)
+        are run with asyncio subprocesses, so that other simulations can
+        proceed in the meantime; see arun for *limit*.
+
+        """
+        import asyncsim
+        return asyncsim.post_process(
+            self, convert_field_patterns, project_bands_list, force, limit)
+
+    @profiler.profiled('epsilon_png')
     def epsilon_to_png(self):
         """Convert epsilon.h5 to epsilon.png. """
+        return _run_steps(self._epsilon_to_png_steps(), self.workingdir)
 
+    def _epsilon_to_png_steps(self):
+        """Step generator (see _run_steps) of epsilon_to_png."""
         if not path.isfile(self.eps_file):
             log.info('epsilon file {0} does not exist, '
                 'will not create epsilon PNG.'.format(self.eps_file))
-            return
+            yield _Return(None)
 
         # make rectangular cell etc:
         callstr = defaults.mpbdata_call % dict(
@@ -279,12 +460,12 @@ class Simulation(object):
         log.info("calling: {0}".format(callstr))
         
         try:
-            sp.call(callstr.split(), cwd=self.workingdir)
+            yield callstr.split()
         except OSError as err:
             log.warning('Command could not be executed. Will continue ' +
                         'without converting epsilon.h5 to png.'
                         '\n\tOSError message: {}\n'.format(err))
-            return 1
+            yield _Return(1)
         
         # no error, continue:
         dct = dict(self.__dict__, h5_file=defaults.temporary_epsh5)
@@ -298,26 +479,37 @@ class Simulation(object):
         for s in callstr:
             if not retcode:
                 log.info("calling: {0}".format(s))
-                retcode = retcode or sp.call(s.split(), 
-                                             cwd=self.workingdir)
+                retcode = retcode or (yield s.split())
 
-        return retcode
+        yield _Return(retcode)
 
-    def fieldpatterns_to_png(self):
-        """Convert all field patterns (saved during simulation in h5-files)
-        to png-files. Move them to subdirectories. Move the h5-files to the
-        subdirectory 'patterns_h5~'. epsilon_to_png must be called before!
+    def _get_field_pattern_h5_files(self):
+        """Return a list of all field pattern h5 files (saved during
+        simulation) in the working directory.
 
         """
-        # make list of all field pattern h5 files:
         filenames = glob1(self.workingdir, "*.h5")
         for exclude in ["epsilon.h5", defaults.temporary_epsh5, 'foo']:
             d, f = path.split(path.join(self.workingdir, exclude))
             to_remove = glob1(d, f)
             for fname in to_remove:
                 filenames.remove(fname)
+        return filenames
+
+    @profiler.profiled('fieldpatterns_to_png')
+    def fieldpatterns_to_png(self):
+        """Convert all field patterns (saved during simulation in h5-files)
+        to png-files. Move them to subdirectories. Move the h5-files to the
+        subdirectory 'patterns_h5~'. epsilon_to_png must be called before!
+
+        """
+        return _run_steps(self._fieldpatterns_to_png_steps(), self.workingdir)
+
+    def _fieldpatterns_to_png_steps(self):
+        """Step generator (see _run_steps) of fieldpatterns_to_png."""
+        filenames = self._get_field_pattern_h5_files()
         if not filenames:
-            return 0
+            yield _Return(0)
 
         if not defaults.delete_h5_after_postprocessing:
             # prepare temporary folder:
@@ -432,7 +624,7 @@ class Simulation(object):
             # properly apply the exponential phase shift
             # if multiple tiles are exported.
             log.debug("calling: {0}".format(callstr))
-            if not sp.call(callstr.split(), cwd=self.workingdir):
+            if not (yield callstr.split()):
                 #log.debug("success")
                 # no error, continue:
                 # show some progress:
@@ -466,14 +658,12 @@ class Simulation(object):
                     for s in callstr:
                         if not retcode:
                             log.debug("calling: {0}".format(s))
-                            retcode = retcode or sp.call(
-                                s.split(),
-                                cwd=self.workingdir)
+                            retcode = retcode or (yield s.split())
                             if retcode:
                                 log.error('error calling {0}'.format(s))
             else:
                 log.error('error calling {0}'.format(callstr))
-                return 1
+                yield _Return(1)
 
             if not retcode:
                 if defaults.delete_h5_after_postprocessing:
@@ -486,9 +676,10 @@ class Simulation(object):
                                self.workingdir,
                                defaults.temporary_h5_folder,
                                fname))
-        return 0
+        yield _Return(0)
 
 
+    @profiler.profiled('export_csv')
     def _export_data_helper(self, output_buffer, dataname):
         """grep for *dataname* in  *output_buffer* and save the data following
         it to a .csv file.
@@ -502,6 +693,9 @@ class Simulation(object):
         the line starts with *dataname*, is followed by ':' and the data to be
         exported in the same line.
 
+        Returns the name of the written .csv file, or None if no data was
+        found.
+
         """
         pp_file_name = '{0}_{1}.csv'.format(self.jobname, dataname)
         pattern = r'^{0}:, (.+)'.format(dataname.lower())
@@ -513,12 +707,14 @@ class Simulation(object):
                     path.join(
                         self.workingdir, pp_file_name), 'w') as pp_file:
                 pp_file.writelines(output_lines)
+            return path.join(self.workingdir, pp_file_name)
         else:
             log.info("No {0} data found in output".format(dataname))
 
 
     def post_process(
-            self, convert_field_patterns=True, project_bands_list=None):
+            self, convert_field_patterns=True, project_bands_list=None,
+            force=False):
         """Make csv files for all band information. Make png of epsilon
         file.
         :param convert_field_patterns: If True, also make pngs of all
@@ -538,14 +734,24 @@ class Simulation(object):
         jobname_projected.csv file will be created (in this case the
         bands plot made in draw_bands will contain automatically found
         band gaps.
+        :param force: By default, only artifacts (csv files, epsilon
+        png) are rebuilt whose inputs (e.g. the MPB output file or
+        epsilon.h5) or recipes changed since the last post-processing
+        (see artifacts.ArtifactRegistry). Set force to True to rebuild
+        everything.
 
         :return: None
         """
-        #
-        try:
-            output_file = open(self.out_file,'r')
-        except IOError:
-            # Could not open output file. This is normal if the
+        return _run_steps(
+            self._post_process_steps(
+                convert_field_patterns, project_bands_list, force),
+            self.workingdir)
+
+    def _post_process_steps(
+            self, convert_field_patterns, project_bands_list, force):
+        """Step generator (see _run_steps) of post_process."""
+        if not path.isfile(self.out_file):
+            # Could not find output file. This is normal if the
             # simulation was run earlier and now only the
             # postprocessing needs to be done, in which case
             # self.out_file has a different timestamp in the filename
@@ -559,13 +765,17 @@ class Simulation(object):
                 self.out_file = path.join(self.workingdir, canditates[0])
                 log.info('Post-processing output file from previous '
                          'simulation run: {0}'.format(self.out_file))
-                output_file=open(self.out_file, 'r')
             else:
                 log.exception('Cannot post-process, no simulation output '
                               'file found!')
-                return
-        output_buffer = output_file.read()
-        output_file.close()
+                yield _Return(None)
+
+        registry = artifacts.ArtifactRegistry(
+            path.join(self.workingdir, defaults.artifact_registry_file),
+            force=force or not defaults.incremental_post_processing)
+        # only read the (possibly big) output file if needed:
+        output_buffer = None
+
         for mode in self.modes:
             if mode:
                 log.info("post-processing mode: {0}".format(mode))
@@ -577,8 +787,17 @@ class Simulation(object):
             # export frequencies: (for band diagrams)
             # try to export all possible data:
             datanames = ['freqs', 'velocity', 'dos', 'yparity', 'zparity']
-            for dataname in datanames:
-                self._export_data_helper(output_buffer, mode + dataname)
+            key = 'export_csv_' + mode
+            if not registry.is_up_to_date(key, [self.out_file], datanames):
+                if output_buffer is None:
+                    with open(self.out_file, 'r') as output_file:
+                        output_buffer = output_file.read()
+                exported = [
+                    self._export_data_helper(output_buffer, mode + dataname)
+                    for dataname in datanames]
+                registry.update(
+                    key, [self.out_file],
+                    [fname for fname in exported if fname], datanames)
 
             # Save band frequency ranges to csv, from the just generated
             # freqs.csv. Needed e.g. if these bands are going to be
@@ -586,22 +805,29 @@ class Simulation(object):
             fnamebase = path.join(
                 self.workingdir,
                 '{0}_{1}{{0}}.csv'.format(self.jobname, mode))
-            data = np.loadtxt(
-                fnamebase.format('freqs'), delimiter=',', skiprows=1)
-            assert (self.numbands == data.shape[1] - 5)
-            bandsmax = np.amax(data[:, 5:], axis=0)
-            bandsmin = np.amin(data[:, 5:], axis=0)
-            # format is %.6f, because MPB only outputs so many digits:
-            np.savetxt(
-                fnamebase.format('_ranges'),
-                np.array(
-                    [np.arange(1, self.numbands + 1),
-                     bandsmin,
-                     bandsmax
-                     ]).transpose(),
-                header='bandnum, min, max',
-                fmt=['%.0f', '%.6f', '%.6f'],
-                delimiter=', ')
+            key = 'ranges_' + mode
+            if not registry.is_up_to_date(
+                    key, [fnamebase.format('freqs')], self.numbands):
+                with profiler.stage('band_ranges'):
+                    data = np.loadtxt(
+                        fnamebase.format('freqs'), delimiter=',', skiprows=1)
+                    assert (self.numbands == data.shape[1] - 5)
+                    bandsmax = np.amax(data[:, 5:], axis=0)
+                    bandsmin = np.amin(data[:, 5:], axis=0)
+                    # format is %.6f, because MPB only outputs so many digits:
+                    np.savetxt(
+                        fnamebase.format('_ranges'),
+                        np.array(
+                            [np.arange(1, self.numbands + 1),
+                             bandsmin,
+                             bandsmax
+                             ]).transpose(),
+                        header='bandnum, min, max',
+                        fmt=['%.0f', '%.6f', '%.6f'],
+                        delimiter=', ')
+                    registry.update(
+                        key, [fnamebase.format('freqs')],
+                        [fnamebase.format('_ranges')], self.numbands)
 
             # if project_bands_list is supplied, a csv with the continuum
             # band ranges is created:
@@ -614,74 +840,40 @@ class Simulation(object):
                          'Simulation.postprocess does not have the same '
                          'amount of entries than there are k-vectors in '
                          'this simulation.')
-                else:
-                    # load all ranges files:
-                    ranges = []
-                    # minimum amount of bands all simulations share:
-                    numbands = float('inf')
-                    for folder in project_bands_list:
-                        jobname = path.basename(path.normpath(folder))
-                        filename = path.join(
-                            folder,
-                            jobname + '_' + mode + '_ranges.csv')
-                        try:
-                            rng = np.loadtxt(filename, delimiter=',', ndmin=2)
-                            if rng.shape[1] == 3:
-                                # drop band numbers:
-                                rng = rng[:, 1:]
-                            if rng.shape[1] != 2:
-                                log.warning(
-                                    'file "{0}" is malformed.'.format(
-                                        filename) +
-                                    'Will not handle projected bands.'
-                                )
-                                break
-                            ranges.append(rng)
-                            numbands = min(rng.shape[0], numbands)
-                        except IOError:
-                            # file not found
-                            log.warning(
-                                'entry "{0}" in project_bands_list supplied '
-                                'to Simulation.postprocess does not exist. '
-                                'Will not handle projected bands.'.format(
-                                    filename
-                                )
-                            )
-                            break
-
-                    # only continue if we did not abort because we could
-                    # not load a file:
-                    if len(ranges) == len(project_bands_list):
-                        # make all the same size and flat (alternating
-                        # min/max):
-                        for i in range(len(ranges)):
-                            ranges[i] = (ranges[i][:numbands]).flatten()
-                        if len(ranges) == 0:
-                            # No projected bands supplied. This is OK if we
-                            # don't want to plot any band gaps or projected
-                            # continuum bands. In this case, we write an
-                            # empty _projected file:
-                            np.savetxt(
-                                fnamebase.format('_projected'),
-                                [],
-                                header='no projected bands')
-                        else:
-                            contibands = np.empty(
-                                (len(ranges), 1 + 2 * numbands))
-                            contibands[:, 0] = np.arange(1, len(ranges) + 1)
-                            contibands[:, 1:] = np.array(ranges)
-                            # format is %.6f, because MPB only outputs so
-                            # many digits:
-                            np.savetxt(
-                                fnamebase.format('_projected'),
-                                contibands,
-                                header=', '.join(
-                                    ['knum'] +
-                                    ['band{0} {1}'.format(i, m)
-                                     for i in range(1, numbands + 1)
-                                     for m in ['min', 'max']]),
-                                fmt=['%.0f'] + ['%.6f'] * 2 * numbands,
-                                delimiter=', ')
+                    continue
+                filenames = []
+                for folder in project_bands_list:
+                    jobname = path.basename(path.normpath(folder))
+                    filenames.append(path.join(
+                        folder,
+                        jobname + '_' + mode + '_ranges.csv'))
+                key = 'projected_' + mode
+                if registry.is_up_to_date(key, filenames, filenames):
+                    continue
+                if self._save_projected_bands(
+                        filenames, fnamebase.format('_projected')):
+                    registry.update(
+                        key, filenames, [fnamebase.format('_projected')],
+                        filenames)
+
+        # save eigensolver statistics and timing of each k-vector:
+        fnamebase = path.join(
+            self.workingdir, self.jobname + '_{0}solverstats.csv')
+        if not registry.is_up_to_date(
+                'solver_stats', [self.out_file], self.modes):
+            with profiler.stage('solver_stats'):
+                if output_buffer is None:
+                    with open(self.out_file, 'r') as output_file:
+                        output_buffer = output_file.read()
+                stats, summary = solverstats.parse_solver_stats(output_buffer)
+                for mode, st in stats.items():
+                    solverstats.save_solver_stats(st, fnamebase.format(mode))
+                if stats:
+                    log.info('eigensolver statistics:\n' +
+                             solverstats.summarize(stats, summary))
+                registry.update(
+                    'solver_stats', [self.out_file],
+                    [fnamebase.format(mode) for mode in stats], self.modes)
 
         if not path.exists(self.eps_file) and path.isfile(self.eps_file + '~'):
             # The epsilon.h5 file was renamed before to mark it as temporary.
@@ -690,10 +882,33 @@ class Simulation(object):
             log.info("renamed {0} to {1}".format(
                         self.eps_file + '~', self.eps_file)) 
 
-        if not self.epsilon_to_png() == 1:
+        # epsilon_to_png also prepares the temporary epsilon file needed
+        # for the field pattern conversion, so it can only be skipped if
+        # there are no field patterns to convert:
+        eps_outputs = [path.join(self.workingdir, 'epsilon.png')]
+        if self.geometry.is3D:
+            eps_outputs.append(path.join(self.workingdir, 'epsilonslab.png'))
+        eps_recipe = [
+            defaults.mpbdata_call, defaults.epsh5topng_call_2D,
+            defaults.epsh5topng_call_3D, defaults.epsh5topng_call_3D_cross_sect,
+            self.resolution, self.number_of_tiles_to_output]
+        if ((not convert_field_patterns or
+                not self._get_field_pattern_h5_files()) and
+                registry.is_up_to_date(
+                    'epsilon_png', [self.eps_file], eps_recipe)):
+            eps_retcode = 0
+        else:
+            with profiler.stage('epsilon_png'):
+                eps_retcode = yield self._epsilon_to_png_steps()
+            if eps_retcode == 0:
+                registry.update(
+                    'epsilon_png', [self.eps_file], eps_outputs, eps_recipe)
+
+        if not eps_retcode == 1:
             if convert_field_patterns:
-                self.fieldpatterns_to_png()
-    
+                with profiler.stage('fieldpatterns_to_png'):
+                    yield self._fieldpatterns_to_png_steps()
+
             # delete temporary files:
             if path.isfile(path.join(self.workingdir, 
                                      defaults.temporary_epsh5)):
@@ -715,7 +930,139 @@ class Simulation(object):
                 if path.isfile(self.eps_file):
                     remove(self.eps_file)
                     log.info("deleted {0}".format(self.eps_file))
-        return
+        yield _Return(None)
+
+    @profiler.profiled('projected_bands')
+    def _save_projected_bands(self, range_files, projected_file):
+        """Load the band ranges from all *range_files* (_ranges.csv files of
+        previously run simulations) and save them to *projected_file*,
+        which will be read when the bands are plotted in draw_bands.
+
+        Return True on success, False if a file could not be loaded.
+
+        """
+        # load all ranges files (from the consolidated tables, see
+        # projectedbands.py):
+        ranges = []
+        # minimum amount of bands all simulations share:
+        numbands = float('inf')
+        for filename, rng in zip(
+                range_files, projectedbands.load_ranges(range_files)):
+            if rng is None:
+                # file not found
+                log.warning(
+                    'entry "{0}" in project_bands_list supplied '
+                    'to Simulation.postprocess does not exist. '
+                    'Will not handle projected bands.'.format(
+                        filename
+                    )
+                )
+                return False
+            if rng.shape[1] == 3:
+                # drop band numbers:
+                rng = rng[:, 1:]
+            if rng.shape[1] != 2:
+                log.warning(
+                    'file "{0}" is malformed.'.format(
+                        filename) +
+                    'Will not handle projected bands.'
+                )
+                return False
+            ranges.append(rng)
+            numbands = min(rng.shape[0], numbands)
+
+        # make all the same size and flat (alternating
+        # min/max):
+        for i in range(len(ranges)):
+            ranges[i] = (ranges[i][:numbands]).flatten()
+        if len(ranges) == 0:
+            # No projected bands supplied. This is OK if we
+            # don't want to plot any band gaps or projected
+            # continuum bands. In this case, we write an
+            # empty _projected file:
+            np.savetxt(
+                projected_file,
+                [],
+                header='no projected bands')
+        else:
+            contibands = np.empty(
+                (len(ranges), 1 + 2 * numbands))
+            contibands[:, 0] = np.arange(1, len(ranges) + 1)
+            contibands[:, 1:] = np.array(ranges)
+            # format is %.6f, because MPB only outputs so
+            # many digits:
+            np.savetxt(
+                projected_file,
+                contibands,
+                header=', '.join(
+                    ['knum'] +
+                    ['band{0} {1}'.format(i, m)
+                     for i in range(1, numbands + 1)
+                     for m in ['min', 'max']]),
+                fmt=['%.0f'] + ['%.6f'] * 2 * numbands,
+                delimiter=', ')
+        return True
+
+    def get_solver_stats(self):
+        """Return the eigensolver statistics of each mode (dictionary
+        with the modes as keys and numpy arrays as values, see
+        solverstats.stats_dtype), as saved during post-processing."""
+        jobname = path.join(self.workingdir, self.jobname)
+        return dict(
+            (mode, solverstats.load_solver_stats(jobname, mode))
+            for mode in self.modes
+            if path.isfile('{0}_{1}solverstats.csv'.format(jobname, mode)))
+
+    def estimate_cost(self, num_processors=2, model=None):
+        """Estimate wall time and memory of this simulation before
+        running it, see costmodel.CostModel.estimate.
+
+        :param model: a (possibly calibrated) costmodel.CostModel. If
+        None, a model with the parameters from defaults is used.
+        :return: dictionary with wall_time (seconds) and memory (bytes)
+        and more, see costmodel.CostModel.estimate.
+
+        """
+        if model is None:
+            model = costmodel.CostModel()
+        est = model.estimate(self, num_processors)
+        log.info(
+            'estimated cost on {0} processors: wall time {1}, memory '
+            '{2:.0f} MB ({3:.0f} MB per process)'.format(
+                num_processors, timedelta(seconds=int(est['wall_time'])),
+                est['memory'] / 1e6, est['memory_per_process'] / 1e6))
+        return est
+
+    def get_default_epsilon(self):
+        """Return epsilon of the default material set in the initcode
+        (1 if not set)."""
+        match = re.search(
+            r'\(set! default-material\s*\(make dielectric\s*'
+            r'\(epsilon\s+([^()]+|\(.*?\))\)', self.initcode)
+        if match is None:
+            return 1.0
+        return scheme_to_float(match.group(1))
+
+    def preview_epsilon(self, filename='epsilon_preview.png', z=0):
+        """Compute the dielectric function of the geometry in Python
+        (see rasterize.rasterize_epsilon), without running MPB, and save
+        it to *filename* in the working directory. This is much faster
+        than running MPB and shows the geometry on the simulation grid
+        (i.e. along the lattice vectors, not in cartesian coordinates).
+
+        :param filename: the png file name. If None, no file is saved.
+        :param z: the z-plane shown in 3D (lattice coordinates).
+        :return: the epsilon array.
+
+        """
+        eps = rasterize.rasterize_epsilon(
+            self.geometry, self.resolution,
+            default_epsilon=self.get_default_epsilon(), z=z)
+        if filename:
+            fname = path.join(self.workingdir, filename)
+            rasterize.save_epsilon_png(eps, fname)
+            log.info('saved epsilon preview to {0}'.format(fname))
+        return eps
 
     def display_epsilon(self):
         if not path.isfile(path.join(self.workingdir, 'epsilon.png')):
@@ -729,7 +1076,7 @@ class Simulation(object):
 
     def draw_bandstructure_2D(
             self, band, mode=None, filled=True, levels=15, lines=False,
-            labeled=False, legend=False):
+            labeled=False, legend=False, show=False, block=True):
         """Draw 2D band contour map of one band"""
         jobname = path.join(self.workingdir, self.jobname)
         if mode is None:
@@ -742,7 +1089,28 @@ class Simulation(object):
         for mode in modes:
             graphics.draw_bandstructure_2D(
                 jobname, mode, self.kspace, band, filled=filled, levels=levels,
-                lines=lines, labeled=labeled, legend=legend)
+                lines=lines, labeled=labeled, legend=legend, show=show,
+                block=block)
+
+    def draw_band_surfaces(
+            self, bands=None, mode=None, filled=True, levels=15,
+            lines=False, labeled=False, legend=False, stacked=False,
+            show=False, block=True):
+        """Draw the 2D band contour maps of all *bands* (default: all) of
+        all modes (or only *mode*) in one figure. The simulation's kspace
+        must be a KSpaceRectangularGrid. See
+        graphics.draw_band_surfaces."""
+        jobname = path.join(self.workingdir, self.jobname)
+        if mode is None:
+            modes = self.modes
+        elif isinstance(mode, (tuple, list)):
+            modes = mode
+        else:
+            modes = [mode]
+        return graphics.draw_band_surfaces(
+            jobname, modes, self.kspace, bands=bands, filled=filled,
+            levels=levels, lines=lines, labeled=labeled, legend=legend,
+            stacked=stacked, show=show, block=block)
 
 
     def draw_bands(
@@ -750,7 +1118,7 @@ class Simulation(object):
             x_axis_hint=defaults.default_x_axis_hint,
             show=False, block=True, save=True,
             add_epsilon_as_inset=False,
-            color_by_parity=False):
+            color_by_parity=False, track_bands=False, formats=None):
         """Plot dispersion relation of all bands calculated along all
         k vectors.
 
@@ -788,7 +1156,10 @@ class Simulation(object):
         to True if the script should wait, otherwise the script might end
         and close the figure. Set *block* to False if you want to display
         other figures.
-        If *save* the figure is saved to 'png' and 'pdf' files.
+        If *save* the figure is saved to files in the *formats* (list of
+        file extensions, default: defaults.draw_bands_formats, i.e. 'pdf'
+        and 'png'). For fast rendering of many band diagrams, see
+        batchrender.py.
 
         The band data is loaded from previously saved .csv files, usually
         done in post_process().
@@ -801,8 +1172,11 @@ class Simulation(object):
         :param color_by_parity: Specify 'y' or 'z' to color the plot
         lines with the data taken from the parity files
         <jobname>_<mode>[z/y]parity.csv.
+        :param track_bands: If True, disentangle crossing bands before
+        plotting, so each line follows one band (see bandtracking.py).
 
-        TODO: add subplots for each file in argument 'comparison_files=[]'
+        To compare the bands of several simulations (e.g. of a sweep),
+        see sweepplot.py.
 
         """
         jobname = path.join(self.workingdir, self.jobname)
@@ -811,35 +1185,38 @@ class Simulation(object):
             path.isfile(jobname + '_{0}_projected.csv'.format(mode)) for
             mode in self.modes]
         # draw data with matplotlib in one subplot:
-        plotter = graphics.draw_bands(
-            jobname,
-            self.modes,
-            x_axis_hint=x_axis_hint,
-            title=title,
-            crop_y=crop_y,
-            band_gaps=not projected and not defaults.hide_band_gap,
-            light_cone=(
-                self.geometry.substrate_index if self.geometry.is3D
-                else False),
-            projected_bands=projected,
-            add_epsilon_as_inset=add_epsilon_as_inset,
-            color_by_parity=color_by_parity,
-            interactive_mode=show
-        )
+        with profiler.stage('plot'):
+            plotter = graphics.draw_bands(
+                jobname,
+                self.modes,
+                x_axis_hint=x_axis_hint,
+                title=title,
+                crop_y=crop_y,
+                band_gaps=not projected and not defaults.hide_band_gap,
+                light_cone=(
+                    self.geometry.substrate_index if self.geometry.is3D
+                    else False),
+                projected_bands=projected,
+                add_epsilon_as_inset=add_epsilon_as_inset,
+                color_by_parity=color_by_parity,
+                interactive_mode=show,
+                track_bands=track_bands,
+                reciprocal_basis=(
+                    self.geometry.reciprocal_basis if track_bands else None)
+            )
         # use returned plotter to add to figure:
         #graphics.draw_dos(jobname, self.modes, custom_plotter=plotter)
 
         if save:
-            filename = jobname + '_bands.pdf'
-            log.info('saving band diagram to file %s' % filename)
-            plotter.savefig(
-                filename, transparent=True,
-                bbox_inches='tight', pad_inches=0)
-            filename = jobname + '_bands.png'
-            log.info('saving band diagram to file %s' % filename)
-            plotter.savefig(
-                filename, transparent=False,
-                bbox_inches='tight', pad_inches=0)
+            if formats is None:
+                formats = defaults.draw_bands_formats
+            with profiler.stage('save'):
+                for fmt in formats:
+                    filename = jobname + '_bands.' + fmt
+                    log.info('saving band diagram to file %s' % filename)
+                    plotter.savefig(
+                        filename, transparent=(fmt == 'pdf'),
+                        bbox_inches='tight', pad_inches=0)
 
         if show:
             plotter.show(block=block)
@@ -849,7 +1226,7 @@ class Simulation(object):
 
     def draw_field_patterns(
             self, title='', only_k=None, show=False,
-            filetype='pdf'):
+            filetype='pdf', raw=False):
         """ Place all field pattern pngs in one diagram and save it to file.
         If only_k is None (default) all found images at all k-vec
         numbers will be added. Specify a tuple (from, to) to only
@@ -858,6 +1235,8 @@ class Simulation(object):
         k-vectors, not all k-vectors simulated!)
         Specify show to also show the figure (script will not block) or
         show='block' to show and block.
+        If raw is True, only the composed pngs are saved, without axis
+        labels (use filetype 'png' then).
 
         """
         for mode in self.modes:
@@ -877,4 +1256,5 @@ class Simulation(object):
                     field_dist_vertical_cmplx_comps,
                 only_k=only_k,
                 title=title,
-                show=show)
+                show=show,
+                raw=raw)
@@ -0,0 +1,277 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Slow light analysis of waveguide simulations.
+
+The waveguide simulations (e.g. TriHoles2D_Waveguide,
+TriHolesSlab3D_Waveguide) export the group velocities of all bands
+(jobname_<mode>velocity.csv). analyze_sweep loads them together with the
+band data of all simulations of a sweep and computes, for all
+simulations and bands at once:
+
+    - the group index n_g = c / v_g,
+    - the group velocity dispersion, as d n_g / d omega (omega in
+      units of 2 pi c / a; multiply by a / (2 pi c^2) for beta_2),
+    - the slow light window: the widest range of guided k-vectors
+      around a k-vector, where n_g deviates less than *tolerance* from
+      its value there, and its normalized delay-bandwidth product
+      NDBP = <n_g> * delta omega / omega_0.
+
+Only guided modes, i.e. frequencies below the light line, are included.
+The results can be saved as a table (one row per simulation and band),
+e.g. to rank many designs of a row-shift optimization:
+
+    analysis = analyze_sweep(folders, 'zeven')
+    table = analysis.get_table()
+    save_table(rank(table, 'ndbp'), 'slowlight.csv')
+
+"""
+
+from __future__ import division
+from os import path
+import numpy as np
+from sweepplot import load_sweep_bands
+from utility import load_velocity_data
+import log
+
+# the columns of the table returned by SlowLightAnalysis.get_table:
+table_columns = [
+    ('jobname', object), ('band', int), ('guided_points', int),
+    ('min_freq', float), ('max_freq', float),
+    ('max_group_index', float), ('mean_group_index', float),
+    ('center_freq', float), ('bandwidth', float), ('ndbp', float),
+    ('max_gvd', float)]
+
+
+def _derivative(y, x):
+    """Return dy/dx along axis 1 of *y* (shape (sims, k, bands)) for the
+    coordinates *x* (shape (sims, k)), with second order central
+    differences (like numpy.gradient, but with different coordinates
+    for each simulation)."""
+    x = x[:, :, np.newaxis]
+    dy = np.full(y.shape, np.nan)
+    if y.shape[1] < 2:
+        return dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        h0 = x[:, 1:-1] - x[:, :-2]
+        h1 = x[:, 2:] - x[:, 1:-1]
+        dy[:, 1:-1] = (
+            (y[:, 2:] - y[:, 1:-1]) * h0 / h1 +
+            (y[:, 1:-1] - y[:, :-2]) * h1 / h0) / (h0 + h1)
+        dy[:, 0] = (y[:, 1] - y[:, 0]) / (x[:, 1] - x[:, 0])
+        dy[:, -1] = (y[:, -1] - y[:, -2]) / (x[:, -1] - x[:, -2])
+    return dy
+
+
+class SlowLightAnalysis(object):
+    def __init__(
+            self, jobnames, kdata, freqs, velocities=None, light_line=True,
+            cladding_index=1.0, tolerance=0.1, min_group_index=1.0):
+        """Slow light analysis of the bands of many waveguide simulations.
+        Usually created with analyze_sweep.
+
+        :param jobnames: the jobnames of the simulations.
+        :param kdata: array with shape (sims, k, 4) with the k-vectors
+        (3 components and magnitude, NaN-padded).
+        :param freqs: array with shape (sims, k, bands) with the
+        frequencies (NaN-padded).
+        :param velocities: array with shape (sims, k, bands, 3) with the
+        group velocities, or None to calculate them by finite differences
+        of the frequencies.
+        :param light_line: if True, only frequencies below the light line
+        of the cladding with refractive index *cladding_index* count as
+        guided (for slabs). If False, all frequencies count as guided.
+        :param tolerance: the maximum relative deviation of n_g in the
+        slow light window.
+        :param min_group_index: only look for slow light windows around
+        k-vectors with at least this group index.
+
+        """
+        self.jobnames = list(jobnames)
+        self.kdata = np.asarray(kdata, dtype=float)
+        self.freqs = np.asarray(freqs, dtype=float)
+        self.tolerance = tolerance
+        self.min_group_index = min_group_index
+
+        # the k-vectors' positions along the waveguide:
+        kpos = self.kdata[:, :, 3]
+        if velocities is None:
+            vg = _derivative(self.freqs, kpos)
+        else:
+            # the component along the waveguide, i.e. along the
+            # direction in which the k-vectors change most:
+            span = np.abs(np.nan_to_num(
+                np.nanmax(self.kdata[:, :, :3], axis=1) -
+                np.nanmin(self.kdata[:, :, :3], axis=1)))
+            axis = np.argmax(span, axis=1)
+            vg = np.asarray(velocities, dtype=float)[
+                np.arange(len(axis)), :, :, axis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.group_index = 1 / np.abs(vg)
+        # d n_g / d omega = n_g * d n_g / dk:
+        self.gvd = self.group_index * _derivative(self.group_index, kpos)
+
+        with np.errstate(invalid='ignore'):
+            self.guided = ~np.isnan(self.freqs) & np.isfinite(
+                self.group_index)
+            if light_line:
+                self.guided &= (
+                    self.freqs < kpos[:, :, np.newaxis] / cladding_index)
+        self._windows = None
+
+    def _find_windows(self):
+        """Find the slow light window of every k-vector (of all
+        simulations and bands at once) and return the one with the
+        maximum NDBP for each simulation and band."""
+        # move the k axis last: (sims, bands, k)
+        ng = np.moveaxis(self.group_index, 1, 2)
+        freq = np.moveaxis(self.freqs, 1, 2)
+        guided = np.moveaxis(self.guided, 1, 2)
+        numk = ng.shape[-1]
+        # ok[..., i, j]: k-vector j belongs to the window around i:
+        with np.errstate(invalid='ignore'):
+            ok = (guided[..., np.newaxis, :] &
+                  (np.abs(ng[..., np.newaxis, :] - ng[..., :, np.newaxis]) <=
+                   self.tolerance * ng[..., :, np.newaxis]))
+        j = np.arange(numk)
+        # the window is the contiguous run of ok around j == i:
+        left = np.maximum.accumulate(np.where(ok, -1, j), axis=-1)
+        right = np.minimum.accumulate(
+            np.where(ok, numk, j)[..., ::-1], axis=-1)[..., ::-1]
+        diag = np.arange(numk)
+        lo = left[..., diag, diag] + 1
+        hi = right[..., diag, diag] - 1
+        inwin = (j >= lo[..., np.newaxis]) & (j <= hi[..., np.newaxis])
+        wfreq = np.where(inwin, freq[..., np.newaxis, :], np.nan)
+        wng = np.where(inwin, ng[..., np.newaxis, :], np.nan)
+        valid = (ok[..., diag, diag] & (ng >= self.min_group_index) &
+                 (hi > lo))
+        with np.errstate(invalid='ignore'):
+            fmin = np.nanmin(np.where(valid[..., np.newaxis], wfreq, 0),
+                             axis=-1)
+            fmax = np.nanmax(np.where(valid[..., np.newaxis], wfreq, 0),
+                             axis=-1)
+            mean_ng = np.nanmean(np.where(valid[..., np.newaxis], wng, 0),
+                                 axis=-1)
+            center = (fmin + fmax) / 2
+            bandwidth = np.where(valid, (fmax - fmin) / center, np.nan)
+            ndbp = mean_ng * bandwidth
+        # the best window of each band (NaN if there is none):
+        best = np.argmax(np.nan_to_num(ndbp, nan=-1), axis=-1)[..., np.newaxis]
+        pick = lambda a: np.take_along_axis(a, best, axis=-1)[..., 0]
+        found = pick(valid)
+        gvd = np.moveaxis(self.gvd, 1, 2)
+        best_inwin = np.take_along_axis(
+            inwin, best[..., np.newaxis], axis=-2)[..., 0, :]
+        with np.errstate(invalid='ignore'):
+            max_gvd = np.nanmax(
+                np.where(best_inwin, np.abs(gvd), -np.inf), axis=-1)
+        nan = lambda a: np.where(found, a, np.nan)
+        return dict(
+            mean_group_index=nan(pick(mean_ng)),
+            center_freq=nan(pick(center)), bandwidth=nan(pick(bandwidth)),
+            ndbp=nan(pick(ndbp)), max_gvd=nan(max_gvd))
+
+    def get_windows(self):
+        """Return a dictionary with arrays with shape (sims, bands) with
+        the mean group index, center frequency, relative bandwidth, NDBP
+        and maximum absolute GVD of the slow light window with the
+        maximum NDBP of each band (NaN if there is none)."""
+        if self._windows is None:
+            self._windows = self._find_windows()
+        return self._windows
+    windows = property(get_windows)
+
+    def get_table(self):
+        """Return the results as structured array (see table_columns),
+        one row for each simulation and band (first band is band 1)."""
+        numsims, numk, numbands = self.freqs.shape
+        win = self.windows
+        table = np.zeros(numsims * numbands, dtype=table_columns)
+        table['jobname'] = np.repeat(self.jobnames, numbands)
+        table['band'] = np.tile(np.arange(1, numbands + 1), numsims)
+        table['guided_points'] = self.guided.sum(axis=1).ravel()
+        with np.errstate(invalid='ignore'):
+            for name, values in [
+                    ('min_freq', np.nanmin(
+                        np.where(self.guided, self.freqs, np.inf), axis=1)),
+                    ('max_freq', np.nanmax(
+                        np.where(self.guided, self.freqs, -np.inf), axis=1)),
+                    ('max_group_index', np.nanmax(
+                        np.where(self.guided, self.group_index, -np.inf),
+                        axis=1))]:
+                table[name] = np.where(
+                    np.isfinite(values), values, np.nan).ravel()
+        for name in ['mean_group_index', 'center_freq', 'bandwidth', 'ndbp',
+                     'max_gvd']:
+            table[name] = win[name].ravel()
+        return table
+
+
+def analyze_sweep(folders, mode, light_line=True, cladding_index=1.0,
+                  tolerance=0.1, min_group_index=1.0, cache_file=None):
+    """Load the band data and group velocities of *mode* of all
+    waveguide simulations in *folders* and return a SlowLightAnalysis.
+
+    If a simulation has no velocity data (or it does not match the band
+    data), the group velocities of all simulations are calculated by
+    finite differences of the frequencies.
+    *cache_file* is passed to sweepplot.load_sweep_bands. See
+    SlowLightAnalysis for the other parameters.
+
+    """
+    sweep = load_sweep_bands(folders, mode, cache_file=cache_file)
+    velocities = np.full(sweep.bands.shape + (3,), np.nan)
+    for i, folder in enumerate(sweep.folders):
+        jobname = path.basename(path.normpath(folder))
+        fname = path.join(folder, '{0}_{1}velocity.csv'.format(jobname, mode))
+        vel = load_velocity_data(fname) if path.isfile(fname) else None
+        nk = np.sum(~np.isnan(sweep.kdata[i, :, 0]))
+        if vel is None or vel.ndim != 3 or vel.shape[0] != nk:
+            log.warning('analyze_sweep: no matching velocity data in {0}, '
+                        'will use finite differences.'.format(folder))
+            velocities = None
+            break
+        velocities[i, :nk, :vel.shape[1]] = vel
+    return SlowLightAnalysis(
+        [path.basename(path.normpath(f)) for f in sweep.folders],
+        sweep.kdata, sweep.bands, velocities, light_line=light_line,
+        cladding_index=cladding_index, tolerance=tolerance,
+        min_group_index=min_group_index)
+
+
+def rank(table, column='ndbp', descending=True):
+    """Return the rows of *table* sorted by *column* (rows with NaN
+    last)."""
+    values = table[column].astype(float)
+    if descending:
+        values = -values
+    return table[np.argsort(np.where(np.isnan(values), np.inf, values),
+                            kind='stable')]
+
+
+def save_table(table, filename):
+    """Save *table* to the csv file *filename*."""
+    with open(filename, 'w') as f:
+        f.write(', '.join(table.dtype.names) + '\n')
+        for row in table:
+            f.write(', '.join(str(v) for v in row.tolist()) + '\n')
+    log.info('saved slow light table to {0}'.format(filename))
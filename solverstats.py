@@ -0,0 +1,202 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+"""Eigensolver statistics and timing of MPB simulations.
+
+MPB prints the number of iterations and the elapsed time for each
+k-vector, and (display-eigensolver-stats) at the end of the ctl file
+prints a summary. parse_solver_stats extracts these from the MPB output
+into numpy arrays (one record per k-vector and run), which are saved in
+post-processing next to the band data in jobname_<mode>solverstats.csv.
+
+"""
+
+from __future__ import division
+import re
+import numpy as np
+
+# one record per k-vector:
+stats_dtype = np.dtype([
+    ('k_index', int),        # k index, as in the freqs.csv file
+    ('iterations', int),     # eigensolver iterations (all band blocks)
+    ('time', float),         # elapsed time for this k-vector in seconds
+    ('converged', bool),     # False if MPB warned about convergence
+    ('change', float),       # last relative change of the trace (%)
+])
+
+_re_kpoint = re.compile(r'^solve_kpoint \(.*\):', re.MULTILINE)
+_re_finished = re.compile(
+    r'^Finished solving for bands \d+ to \d+ after (\d+) iterations',
+    re.MULTILINE)
+_re_freqs = re.compile(r'^(\w*)freqs:, (\d+),', re.MULTILINE)
+_re_time = re.compile(
+    r'^elapsed time for k point: ([0-9.eE+-]+)', re.MULTILINE)
+_re_change = re.compile(r'\(([0-9.eE+-]+)% change\)')
+_re_not_converged = re.compile(r'converge', re.IGNORECASE)
+
+
+def parse_solver_stats(output_buffer):
+    """Extract the eigensolver statistics from the MPB output.
+
+    :param output_buffer: the contents of the .out file.
+    :return: a tuple (stats, summary). stats is a dictionary with the
+    mode names (e.g. 'te', or '' for (run)) as keys and numpy arrays of
+    stats_dtype (one entry per k-vector) as values. summary is a
+    dictionary with the overall values found: 'run_times' (dictionary
+    with total elapsed time of each run), 'duration' (total wall time
+    in seconds), 'max_memory' (maximum resident memory of MPB in bytes,
+    if recorded) and 'eigensolver_stats' (the lines printed by
+    (display-eigensolver-stats)).
+
+    """
+    records = dict()
+    starts = [m.start() for m in _re_kpoint.finditer(output_buffer)]
+    starts.append(len(output_buffer))
+    for begin, end in zip(starts[:-1], starts[1:]):
+        segment = output_buffer[begin:end]
+        freqs = _re_freqs.search(segment)
+        if freqs is None:
+            # e.g. aborted simulation:
+            continue
+        mode, kindex = freqs.groups()
+        elapsed = _re_time.search(segment)
+        if elapsed:
+            # ignore the output after this k-vector (e.g. end of run):
+            segment = segment[:elapsed.end()]
+        iterations = sum(int(n) for n in _re_finished.findall(segment))
+        changes = _re_change.findall(segment)
+        converged = _re_not_converged.search(
+            segment.replace('Finished solving', '')) is None
+        records.setdefault(mode, []).append((
+            int(kindex), iterations,
+            float(elapsed.group(1)) if elapsed else np.nan,
+            converged,
+            float(changes[-1]) if changes else np.nan))
+    stats = dict(
+        (mode, np.array(recs, dtype=stats_dtype))
+        for mode, recs in records.items())
+
+    summary = dict()
+    # the runs are printed in order; the mode of each run is the mode of
+    # the last k-vector before its total elapsed time:
+    run_times = dict()
+    for match in re.finditer(
+            r'^total elapsed time for run: ([0-9.eE+-]+)',
+            output_buffer, re.MULTILINE):
+        before = list(_re_freqs.finditer(output_buffer, 0, match.start()))
+        mode = before[-1].group(1) if before else ''
+        run_times[mode] = float(match.group(1))
+    summary['run_times'] = run_times
+    duration = re.search(
+        r'^finished on: .*\(duration: (?:(\d+) days?, )?'
+        r'(\d+):(\d+):(\d+(?:\.\d*)?)\)', output_buffer, re.MULTILINE)
+    if duration:
+        days, hours, minutes, seconds = duration.groups()
+        summary['duration'] = (
+            int(days or 0) * 86400 + int(hours) * 3600 + int(minutes) * 60 +
+            float(seconds))
+    memory = re.search(
+        r'^max memory \(RSS\): (\d+) kB', output_buffer, re.MULTILINE)
+    if memory:
+        summary['max_memory'] = int(memory.group(1)) * 1024
+    summary['eigensolver_stats'] = re.findall(
+        r'^eigensolver.*$', output_buffer, re.MULTILINE | re.IGNORECASE)
+    return stats, summary
+
+
+def save_solver_stats(stats, filename):
+    """Save the *stats* (numpy array of stats_dtype) of one mode to the csv
+    file *filename*."""
+    np.savetxt(
+        filename,
+        np.column_stack([stats[name] for name in stats_dtype.names]),
+        header=', '.join(stats_dtype.names),
+        fmt=['%.0f', '%.0f', '%.6g', '%.0f', '%.6g'],
+        delimiter=', ')
+
+
+def load_solver_stats(jobname, mode):
+    """Load the statistics saved in post-processing from the file
+    jobname + '_' + mode + 'solverstats.csv' and return them as numpy
+    array of stats_dtype."""
+    data = np.loadtxt(
+        '{0}_{1}solverstats.csv'.format(jobname, mode), delimiter=',',
+        ndmin=2)
+    stats = np.empty(len(data), dtype=stats_dtype)
+    for i, name in enumerate(stats_dtype.names):
+        stats[name] = data[:, i]
+    return stats
+
+
+def summarize(stats, summary=None, num_slowest=5):
+    """Return a human readable summary of the eigensolver statistics.
+
+    :param stats: the dictionary with the statistics of each mode (see
+    parse_solver_stats).
+    :param summary: the summary returned by parse_solver_stats, or None.
+    :param num_slowest: the number of slowest k-vectors to list for
+    each mode.
+
+    """
+    lines = []
+    solve_time = 0
+    for mode in sorted(stats.keys()):
+        st = stats[mode]
+        if not len(st):
+            continue
+        times = st['time']
+        solve_time += np.nansum(times)
+        lines.append(
+            '{0}: {1} k-vectors, {2:.1f} s, iterations {3}-{4} '
+            '(mean {5:.1f})'.format(
+                mode or 'all modes', len(st), np.nansum(times),
+                st['iterations'].min(), st['iterations'].max(),
+                st['iterations'].mean()))
+        slowest = np.argsort(-np.nan_to_num(times))[:num_slowest]
+        lines.append('  slowest k-vectors: ' + ', '.join(
+            '#{0} ({1:.2f} s, {2} it.)'.format(
+                st['k_index'][i], times[i], st['iterations'][i])
+            for i in slowest))
+        if not st['converged'].all():
+            lines.append('  not converged at k-vectors: ' + ', '.join(
+                str(k) for k in st['k_index'][~st['converged']]))
+    if summary and summary.get('duration'):
+        overhead = summary['duration'] - solve_time
+        lines.append(
+            'time outside of eigensolver (initialization, epsilon '
+            'averaging, output): {0:.1f} s ({1:.0%})'.format(
+                overhead, overhead / summary['duration']))
+        if overhead > 0.3 * summary['duration']:
+            lines.append(
+                '  large overhead: consider a smaller mesh_size or fewer '
+                'exported field patterns.')
+    for mode in sorted(stats.keys()):
+        st = stats[mode]
+        if len(st) > 1 and np.median(st['iterations']) > 50:
+            lines.append(
+                '{0}: many iterations per k-vector; the highest bands might '
+                'be nearly degenerate, consider changing numbands.'.format(
+                    mode or 'all modes'))
+    if summary and 'max_memory' in summary:
+        lines.append('max memory: {0:.0f} MB'.format(
+            summary['max_memory'] / 1e6))
+    if summary:
+        lines.extend(summary.get('eigensolver_stats', []))
+    return '\n'.join(lines)
@@ -0,0 +1,297 @@
+# -*- coding:utf-8 -*-
+# ----------------------------------------------------------------------
+# Copyright 2016 Juergen Probst
+#
+# This file is part of pyMPB.
+#
+# pyMPB is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyMPB is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyMPB.  If not, see <http://www.gnu.org/licenses/>.
+# ----------------------------------------------------------------------
+
+
+"""Compare the band diagrams of all simulations of a sweep.
+
+load_sweep_bands loads the band data of all simulations (the
+jobname_<mode>freqs.csv files in their folders) into one array with
+shape (number of simulations, number of k-vectors, number of bands),
+padded with NaN where simulations have fewer k-vectors or bands. The
+array is cached in a .npy file, which is memory-mapped on later calls,
+and only rebuilt if one of the csv files changed (see
+artifacts.ArtifactRegistry).
+
+draw_sweep_overlay draws all simulations in one diagram, colored by
+the swept parameter, draw_sweep_grid draws one small diagram per
+simulation with shared axes. Each simulation is drawn as one
+LineCollection, so that even sweeps with hundreds of simulations are
+drawn quickly.
+
+"""
+
+from __future__ import division
+from os import path
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from artifacts import ArtifactRegistry
+import defaults
+import log
+
+
+class SweepBands(object):
+    def __init__(self, folders, kdata, bands):
+        """The band data of all simulations of a sweep, as returned by
+        load_sweep_bands.
+
+        :param folders: the simulation folders.
+        :param kdata: array with shape (num_sims, num_k, 4) with the k
+        vectors (3 components and magnitude) of each simulation.
+        :param bands: array with shape (num_sims, num_k, num_bands) with
+        the frequencies.
+
+        """
+        self.folders = folders
+        self.kdata = kdata
+        self.bands = bands
+
+    def __len__(self):
+        return len(self.folders)
+
+    def get_x_values(self, correct_x_axis=None):
+        """Return the x-values of the k-vectors of each simulation,
+        array with shape (num_sims, num_k). If *correct_x_axis*
+        (default: defaults.correct_x_axis), they are equidistant
+        according to the Euclidean distance between the k-vectors,
+        otherwise they are the k indexes.
+
+        """
+        if correct_x_axis is None:
+            correct_x_axis = defaults.correct_x_axis
+        num_sims, num_k = self.kdata.shape[:2]
+        if not correct_x_axis:
+            return np.tile(np.arange(num_k, dtype=float), (num_sims, 1))
+        steps = np.sqrt(np.sum(
+            np.square(np.diff(self.kdata[:, :, :3], axis=1)), axis=2))
+        x = np.zeros((num_sims, num_k))
+        # NaN steps of padded k-vectors propagate to the padded x values:
+        x[:, 1:] = np.cumsum(steps, axis=1)
+        return x
+
+    def get_segments(self, index, x_values):
+        """Return the line segments (for a LineCollection) of all bands
+        of simulation *index*."""
+        # shape (num_bands, num_k, 2):
+        return np.stack(
+            [np.broadcast_to(x_values[index][:, np.newaxis],
+                             self.bands[index].shape),
+             self.bands[index]], axis=-1).transpose(1, 0, 2)
+
+
+def _freqs_file(folder, mode):
+    jobname = path.basename(path.normpath(folder))
+    return path.join(folder, '{0}_{1}freqs.csv'.format(jobname, mode))
+
+
+def load_sweep_bands(folders, mode, cache_file=None):
+    """Load the band data of *mode* of all simulations in *folders*.
+
+    :param folders: the list of simulation folders (each named like the
+    jobname of its simulation).
+    :param mode: the mode, e.g. 'te', or '' for (run).
+    :param cache_file: the .npy file where the stacked data is cached.
+    Default: sweep_<mode>bands.npy in the folder containing the first
+    simulation folder. If False, nothing is cached.
+    :return: a SweepBands object. Missing simulations are skipped with
+    a warning.
+
+    """
+    filenames = []
+    found = []
+    for folder in folders:
+        fname = _freqs_file(folder, mode)
+        if path.isfile(fname):
+            filenames.append(fname)
+            found.append(folder)
+        else:
+            log.warning('load_sweep_bands: {0} not found, will skip this '
+                        'simulation.'.format(fname))
+    if not filenames:
+        return SweepBands([], np.zeros((0, 0, 4)), np.zeros((0, 0, 0)))
+
+    if cache_file is None:
+        cache_file = path.join(
+            path.dirname(path.normpath(path.abspath(found[0]))),
+            'sweep_{0}bands.npy'.format(mode))
+    registry = None
+    if cache_file:
+        registry = ArtifactRegistry(cache_file + '.json')
+        key = 'sweep_bands_' + mode
+        if registry.is_up_to_date(key, filenames, filenames):
+            data = np.load(cache_file, mmap_mode='r')
+            return SweepBands(found, data[..., 1:5], data[..., 5:])
+
+    datas = [np.loadtxt(fname, delimiter=',', skiprows=1, ndmin=2)
+             for fname in filenames]
+    num_k = max(d.shape[0] for d in datas)
+    num_cols = max(d.shape[1] for d in datas)
+    shape = (len(datas), num_k, num_cols)
+    if cache_file:
+        data = np.lib.format.open_memmap(
+            cache_file, mode='w+', dtype=float, shape=shape)
+    else:
+        data = np.empty(shape)
+    data[:] = np.nan
+    for i, d in enumerate(datas):
+        data[i, :d.shape[0], :d.shape[1]] = d
+    if cache_file:
+        data.flush()
+        registry.update(key, filenames, [cache_file], filenames)
+    return SweepBands(found, data[..., 1:5], data[..., 5:])
+
+
+def _colors(num, cmap):
+    return plt.get_cmap(cmap)(np.linspace(0, 1, max(num, 1)))
+
+
+def draw_sweep_overlay(
+        sweep, labels=None, title='', cmap='viridis', crop_y=True,
+        correct_x_axis=None, filename=None, show=False, ax=None,
+        linewidth=1):
+    """Draw the bands of all simulations of *sweep* (a SweepBands object)
+    in one diagram, colored with *cmap* in the order of the simulations.
+
+    :param labels: a list with one label (e.g. the swept parameter) for
+    each simulation, shown in a color bar; or None.
+    :param crop_y: if True, crop the frequency axis below the lowest
+    frequency of the highest band of all simulations; or the maximum
+    frequency, or a 2-tuple (min, max).
+    :param filename: save the figure to this file, if given.
+    :param show: show the figure.
+    :param ax: draw to this matplotlib Axes instead of a new figure.
+    :return: the Axes.
+
+    """
+    if ax is None:
+        fig = plt.figure(figsize=defaults.fig_size)
+        ax = fig.add_subplot(111)
+    fig = ax.figure
+    x_values = sweep.get_x_values(correct_x_axis)
+    colors = _colors(len(sweep), cmap)
+    for i in range(len(sweep)):
+        ax.add_collection(LineCollection(
+            sweep.get_segments(i, x_values), colors=[colors[i]],
+            linewidths=linewidth))
+    _set_limits(ax, sweep, x_values, crop_y)
+    ax.set_xlabel(
+        'wave vector (distance)' if _corrected(correct_x_axis) else
+        'k index', size='x-large')
+    ax.set_ylabel(defaults.default_y_axis_label, size='x-large')
+    ax.grid(True)
+    if title:
+        ax.set_title(title, size='x-large')
+    if labels is not None and len(sweep):
+        mappable = plt.cm.ScalarMappable(
+            cmap=cmap, norm=plt.Normalize(-0.5, len(sweep) - 0.5))
+        mappable.set_array(np.arange(len(sweep)))
+        cbar = fig.colorbar(mappable, ax=ax)
+        # not more than ~10 labels on the color bar:
+        step = max(len(labels) // 10, 1)
+        cbar.set_ticks(np.arange(0, len(labels), step))
+        cbar.set_ticklabels([str(l) for l in labels[::step]])
+    _finish(fig, filename, show)
+    return ax
+
+
+def draw_sweep_grid(
+        sweep, labels=None, title='', ncols=None, crop_y=True,
+        correct_x_axis=None, filename=None, show=False, color=None,
+        linewidth=1):
+    """Draw the bands of each simulation of *sweep* (a SweepBands
+    object) in its own small diagram, all in one figure with shared
+    axes.
+
+    :param labels: a list with one title (e.g. the swept parameter) for
+    each small diagram; or None.
+    :param ncols: the number of columns (default: about square grid).
+    :param color: the line color (default: first color of the band
+    diagrams).
+    :return: the figure.
+
+    See draw_sweep_overlay for the other parameters.
+
+    """
+    num = max(len(sweep), 1)
+    if ncols is None:
+        ncols = int(np.ceil(np.sqrt(num)))
+    nrows = int(np.ceil(num / ncols))
+    fig, axes = plt.subplots(
+        nrows, ncols, sharex=True, sharey=True, squeeze=False,
+        figsize=(2.5 * ncols, 2 * nrows))
+    if color is None:
+        from bandplotter import band_colors
+        color = band_colors[0]
+    x_values = sweep.get_x_values(correct_x_axis)
+    for i, ax in enumerate(axes.flat):
+        if i >= len(sweep):
+            ax.set_visible(False)
+            continue
+        ax.add_collection(LineCollection(
+            sweep.get_segments(i, x_values), colors=[color],
+            linewidths=linewidth))
+        if labels is not None:
+            ax.set_title(str(labels[i]), size='small')
+        ax.tick_params(labelsize='small')
+    # shared axes: setting the limits once sets them for all:
+    _set_limits(axes.flat[0], sweep, x_values, crop_y)
+    if title:
+        fig.suptitle(title, size='x-large')
+    _finish(fig, filename, show)
+    return fig
+
+
+def _corrected(correct_x_axis):
+    return defaults.correct_x_axis if correct_x_axis is None else \
+        correct_x_axis
+
+
+def _set_limits(ax, sweep, x_values, crop_y):
+    if not len(sweep):
+        return
+    ax.set_xlim(0, np.nanmax(x_values))
+    miny, maxy = np.nanmin(sweep.bands), np.nanmax(sweep.bands)
+    if crop_y is True:
+        maxy = np.nanmin(_last_bands(sweep))
+    elif hasattr(crop_y, '__len__') and len(crop_y) == 2:
+        miny, maxy = crop_y
+    elif crop_y:
+        maxy = crop_y
+    ax.set_ylim(miny, maxy)
+
+
+def _last_bands(sweep):
+    """Return the frequencies of the highest band of each simulation
+    (padded bands excluded)."""
+    bands = np.asarray(sweep.bands)
+    valid = ~np.all(np.isnan(bands), axis=1)
+    # index of the last band with data of each simulation:
+    last = valid.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1)
+    return bands[np.arange(len(bands)), :, last]
+
+
+def _finish(fig, filename, show):
+    if filename:
+        fig.savefig(filename, bbox_inches='tight')
+        log.info('saved sweep plot to {0}'.format(filename))
+    if show:
+        plt.show(block=show == 'block')
+    elif filename:
+        plt.close(fig)
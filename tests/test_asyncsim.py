@@ -0,0 +1,62 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import time
+import asyncio
+import tempfile
+import shutil
+import asyncsim
+
+class TestAsyncCall(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def sleep_args(self, retcode=0):
+        return [sys.executable, '-c',
+                'import time, sys; time.sleep(0.3); sys.exit({0})'.format(
+                    retcode)]
+
+    def test_returncode(self):
+        retcode = asyncio.run(
+            asyncsim.call(self.sleep_args(3), self.folder))
+        self.assertEqual(retcode, 3)
+
+    def test_limit(self):
+        async def run(max_concurrent):
+            limit = asyncio.Semaphore(max_concurrent)
+            return await asyncio.gather(*[
+                asyncsim.call(self.sleep_args(), self.folder, limit)
+                for i in range(4)])
+
+        start = time.time()
+        self.assertEqual(asyncio.run(run(4)), [0, 0, 0, 0])
+        concurrent = time.time() - start
+        start = time.time()
+        asyncio.run(run(1))
+        sequential = time.time() - start
+        self.assertGreater(sequential, 1.2)
+        self.assertLess(concurrent, sequential)
+
+if __name__ == '__main__':
+    unittest.main()
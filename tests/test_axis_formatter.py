@@ -56,6 +56,52 @@ class TestKSpaces(unittest.TestCase):
                 defaults.default_x_axis_label.format(target)
             )
 
+    def test_kvector_ticks_are_cached(self):
+        kvecs = np.column_stack(
+            [np.linspace(0, 0.5, 11), np.zeros(11), np.zeros(11)])
+        fmt1 = axis_formatter.KVectorAxisFormatter(
+            6, format_str='({0}, {1})', fractions=True)
+        fmt1.set_hover_data(kvecs)
+        self.assertEqual(list(fmt1.get_tick_positions()), [0, 2, 4, 6, 8, 10])
+        self.assertEqual(fmt1._labels[1], '(1/10, 0)')
+        # tweaking the ticks of one formatter must not change the cache:
+        fmt1.tweak_tick_positions(np.arange(6) * 0.1)
+        fmt2 = axis_formatter.KVectorAxisFormatter(
+            6, format_str='({0}, {1})', fractions=True)
+        fmt2.set_hover_data(kvecs.copy())
+        self.assertEqual(list(fmt2.get_tick_positions()), [0, 2, 4, 6, 8, 10])
+        self.assertEqual(fmt2._labels, fmt1._labels)
+        # different settings give different labels:
+        fmt3 = axis_formatter.KVectorAxisFormatter(
+            6, format_str='({0}, {1})', fractions=False)
+        fmt3.set_hover_data(kvecs)
+        self.assertEqual(fmt3._labels[1], '(0.1, 0.0)')
+
+    def test_fractions_and_hover_strings(self):
+        fmt = axis_formatter.KVectorAxisFormatter(
+            3, format_str='({0}, {1})', fractions=True)
+        self.assertEqual(fmt._make_fraction_str(0.25), '1/4')
+        self.assertEqual(fmt._make_fraction_str('abc'), 'abc')
+        self.assertEqual(fmt._make_fraction_str(0.123456), 0.123456)
+        self.assertEqual(
+            fmt._make_fraction_str(np.array([[0.5, 0.2], [0.2, 0.123456]])),
+            [['1/2', '1/5'], ['1/5', 0.123456]])
+        kvecs = np.column_stack([np.linspace(0, 0.5, 5), np.zeros(5)])
+        fmt.set_hover_data(kvecs)
+        self.assertEqual(fmt._labels, ['(0, 0)', '(1/4, 0)', '(1/2, 0)'])
+        self.assertEqual(fmt(1.2), str(kvecs[1]))
+        # the hover string is made only once:
+        self.assertIs(fmt(0.9), fmt(1.2))
+        self.assertEqual(fmt(-1), '-1')
+
+    def test_fraction_cache_is_bounded(self):
+        for i in range(axis_formatter._fraction_cache_size + 10):
+            axis_formatter._fraction_str(i / 7)
+        self.assertEqual(
+            len(axis_formatter._fraction_cache),
+            axis_formatter._fraction_cache_size)
+        self.assertEqual(axis_formatter._fraction_str(0.5), '1/2')
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
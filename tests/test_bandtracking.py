@@ -0,0 +1,62 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import numpy as np
+import bandtracking
+
+class TestBandTracking(unittest.TestCase):
+
+    def setUp(self):
+        # two crossing bands and a flat band above:
+        self.k = np.linspace(0, 0.5, 11)
+        self.bands = np.array(
+            [0.1 + self.k, 0.6 - self.k, np.full_like(self.k, 0.8)]).T
+        self.vel = np.zeros(self.bands.shape + (3,))
+        self.vel[:, 0, 0] = 1
+        self.vel[:, 1, 0] = -1
+        # MPB sorts by frequency:
+        sort = np.argsort(self.bands, axis=1)
+        self.sorted_bands = bandtracking.reorder_bands(self.bands, sort)
+        self.sorted_vel = bandtracking.reorder_bands(self.vel, sort)
+        self.kvecs = np.zeros((len(self.k), 3))
+        self.kvecs[:, 0] = self.k
+
+    def test_track_bands_by_extrapolation(self):
+        order = bandtracking.track_bands(self.sorted_bands)
+        np.testing.assert_allclose(
+            bandtracking.reorder_bands(self.sorted_bands, order), self.bands)
+
+    def test_track_bands_with_velocities(self):
+        order = bandtracking.track_bands(
+            self.sorted_bands, k_vectors=self.kvecs,
+            velocities=self.sorted_vel)
+        np.testing.assert_allclose(
+            bandtracking.reorder_bands(self.sorted_bands, order), self.bands)
+        np.testing.assert_allclose(
+            bandtracking.reorder_bands(self.sorted_vel, order), self.vel)
+
+    def test_greedy_assignment(self):
+        cost = np.array([[0.1, 5, 3], [4, 6, 0.2], [2, 0.3, 7]])
+        rows, cols = bandtracking._greedy_assignment(cost)
+        np.testing.assert_array_equal(cols, [0, 2, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import numpy as np
+import batchrender
+
+class TestBandRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_freqs(self, jobname, mode, offset=0):
+        k = np.linspace(0, 0.5, 6)
+        bands = np.column_stack([k, 0.6 + offset - 0.2 * k])
+        data = np.column_stack(
+            [np.arange(1, 7), k, np.zeros((6, 2)), k, bands])
+        fname = path.join(self.folder, '{0}_{1}freqs.csv'.format(
+            jobname, mode))
+        np.savetxt(fname, data, delimiter=', ', header='k index, ...')
+        return path.join(self.folder, jobname)
+
+    def test_corrected_x_values(self):
+        k = np.array([[0, 0, 0, 0], [0.3, 0.4, 0, 0.5], [0.3, 0.4, 1, 0]])
+        self.assertTrue(np.allclose(
+            batchrender.corrected_x_values(k), [0, 0.5, 1.5]))
+
+    def test_render_reuses_lines(self):
+        renderer = batchrender.BandRenderer(figure_size=(4, 3), dpi=50)
+        job1 = self.write_freqs('job1', 'te')
+        job2 = self.write_freqs('job2', 'te', offset=0.1)
+        saved = renderer.render(job1, ['te'], formats=('png', 'svg'),
+                                light_cone=True)
+        self.assertEqual(saved, [job1 + '_bands.png', job1 + '_bands.svg'])
+        self.assertTrue(all(path.isfile(f) for f in saved))
+        lines = renderer._lines['te']
+        renderer.render(job2, ['te'], crop_y=False)
+        self.assertIs(renderer._lines['te'], lines)
+        self.assertTrue(np.allclose(lines[1].get_ydata()[0], 0.7))
+        self.assertTrue(path.isfile(job2 + '_bands.png'))
+
+    def test_render_batch(self):
+        jobs = [(self.write_freqs(name, 'tm'), ['tm'])
+                for name in ['a', 'b']]
+        saved = batchrender.render_batch(
+            jobs, processes=2, formats=('png',), figure_size=(4, 3))
+        self.assertEqual(saved, [[jobs[0][0] + '_bands.png'],
+                                 [jobs[1][0] + '_bands.png']])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+from geometry import Geometry
+from kspace import KSpace
+from costmodel import CostModel, parse_out_file, work_units
+
+OUTPUT = '''This is a simulation started by pyMPB
+Date: 2016-05-01 10:00:00.000000
+Number of processors: 4
+2D-Simulation
+(set! resolution 32)
+
+(set! mesh-size 7)
+
+(set! num-bands 8)
+Grid size is 32 x 32 x 1.
+tefreqs:, k index, k1, k2, k3, kmag/2pi, te band 1
+tefreqs:, 1, 0, 0, 0, 0, 0
+tefreqs:, 2, 0.5, 0, 0, 0.5, 0.4
+tmfreqs:, 1, 0, 0, 0, 0, 0
+tmfreqs:, 2, 0.5, 0, 0, 0.5, 0.4
+finished on: 2016-05-01 10:01:40.000000 (duration: 0:01:40.000000)
+returncode: 0'''
+
+class SimulationParameters(object):
+    """The parameters of a Simulation needed by the cost model."""
+    def __init__(self, resolution):
+        self.geometry = Geometry(width=1, height=1, objects=[])
+        self.resolution = resolution
+        self.kspace = KSpace(
+            points_list=[(0, 0, 0), (0.5, 0, 0)], k_interpolation=0)
+        self.modes = ['te', 'tm']
+        self.numbands = 8
+        self.meshsize = 7
+
+class TestCostModel(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.out_file = path.join(self.folder, 'job.out')
+        with open(self.out_file, 'w') as f:
+            f.write(OUTPUT)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_parse_out_file(self):
+        rec = parse_out_file(self.out_file)
+        self.assertEqual(rec['grid_points'], 1024)
+        self.assertEqual(rec['dimensions'], 2)
+        self.assertEqual(rec['num_solves'], 4)
+        self.assertEqual(rec['num_processors'], 4)
+        self.assertEqual(rec['duration'], 100)
+
+    def test_calibrated_estimate_reproduces_duration(self):
+        model = CostModel()
+        self.assertEqual(model.calibrate(self.folder), 1)
+        est = model.estimate(SimulationParameters(32), num_processors=4)
+        self.assertAlmostEqual(est['wall_time'], 100)
+        # four times the grid points takes more than four times longer:
+        est = model.estimate(SimulationParameters(64), num_processors=4)
+        self.assertGreater(est['wall_time'], 400)
+        self.assertEqual(
+            model.suggest_num_processors(
+                SimulationParameters(32), max_wall_time=150), 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import numpy as np
+from geometry import Geometry
+from objects import RodArray
+from utility import get_triangular_phc_waveguide_air_rods
+from disorder import DisorderEnsemble, EnsembleStatistics, perturb_geometry
+
+class TestDisorder(unittest.TestCase):
+
+    def setUp(self):
+        self.geometry = Geometry(
+            width=1, height=9, triangular=False,
+            objects=get_triangular_phc_waveguide_air_rods(
+                radius=0.3, supercell_size=9))
+
+    def test_realizations_are_reproducible(self):
+        ensemble = DisorderEnsemble(
+            self.geometry, 5, seed=42, position_sigma=0.01,
+            radius_sigma=0.005)
+        realizations = list(ensemble)
+        self.assertEqual(len(realizations), 5)
+        self.assertEqual(str(ensemble.realization(3)), str(realizations[3]))
+        self.assertNotEqual(str(realizations[0]), str(realizations[1]))
+        # the original geometry is unchanged:
+        self.assertFalse(
+            any(isinstance(obj, RodArray) for obj in self.geometry.objects))
+
+    def test_mask(self):
+        ensemble = DisorderEnsemble(
+            self.geometry, 1, position_sigma=0.01, mask=[0, 1])
+        diff = ensemble.realization(0).centers - self.geometry.centers
+        self.assertTrue(np.all(diff[:2, :2] != 0))
+        self.assertTrue(np.all(diff[2:] == 0))
+
+    def test_shifts_are_cartesian(self):
+        for triangular in [False, True]:
+            geometry = Geometry(
+                width=1, height=9, triangular=triangular,
+                objects=self.geometry.objects)
+            perturbed = perturb_geometry(
+                geometry, 7, position_sigma=0.01)
+            shifts = (perturbed.centers - geometry.centers).dot(
+                geometry.basis)
+            expected = np.random.RandomState(7).normal(
+                0, 0.01, (len(shifts), 2))
+            np.testing.assert_allclose(shifts[:, :2], expected, atol=1e-14)
+            np.testing.assert_allclose(shifts[:, 2], 0, atol=1e-14)
+
+    def test_statistics(self):
+        stats = EnsembleStatistics()
+        # two bands; gap between them only in first realization:
+        stats.add(np.array([[0.1, 0.3], [0.2, 0.4]]))
+        stats.add(np.array([[0.1, 0.2], [0.3, 0.4]]))
+        np.testing.assert_allclose(
+            stats.mean_band_edges, [[0.1, 0.25], [0.25, 0.4]])
+        np.testing.assert_allclose(
+            stats.band_edge_variance, [[0, 0.005], [0.005, 0]])
+        np.testing.assert_allclose(stats.gap_closure_probability, [0.5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import os
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import gapmap
+from utility import get_gap_bands
+
+
+class TestGapMap(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = path.join(self.folder, 'gapmap.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def add_simulation(self, radius, thickness, mode='te'):
+        jobname = 'TriHolesSlab_SiN_r{0:03.0f}_t{1:03.0f}'.format(
+            radius * 1000, thickness * 1000)
+        folder = path.join(self.folder, jobname)
+        if not path.isdir(folder):
+            os.mkdir(folder)
+        k = np.linspace(0, 0.5, 5)
+        # 3 bands, gap between band 1 and 2 grows with radius:
+        bands = np.array([k * 0.5, 0.3 + radius / 2 - k * 0.1, 0.6 + k * 0.1])
+        rows = np.column_stack(
+            [np.arange(1, 6), k, 0 * k, 0 * k, k, bands.T])
+        np.savetxt(path.join(folder, jobname + '_' + mode + 'freqs.csv'),
+                   rows, delimiter=',', header='k index', comments='')
+        return folder
+
+    def test_parse_jobname(self):
+        self.assertEqual(
+            gapmap.parse_jobname('TriHolesSlab_SiN_r300_t200_for_gap'),
+            dict(material='SiN', radius=0.3, thickness=0.2))
+        # waveguides:
+        self.assertEqual(
+            gapmap.parse_jobname('TriHoles2D_W1_eps12.000_r300'),
+            dict(material='eps12.000', radius=0.3))
+        self.assertEqual(
+            gapmap.parse_jobname('TriHolesSlab_W1_SiN_r350_t200_shift_t50'),
+            dict(material='SiN', radius=0.35, thickness=0.2))
+        # with job_name_suffix:
+        self.assertEqual(
+            gapmap.parse_jobname('TriHoles2D_eps12.000_r300_projk250000'),
+            dict(material='eps12.000', radius=0.3))
+        # no parameters:
+        self.assertEqual(gapmap.parse_jobname('TriHoles2D_r300'),
+                         dict(radius=0.3))
+        self.assertEqual(gapmap.parse_jobname('my_simulation'), dict())
+
+    def test_gaps_and_cache(self):
+        for radius in [0.2, 0.3, 0.4]:
+            self.add_simulation(radius, 0.2)
+        gmap = gapmap.GapMap(self.cache)
+        gmap.update(gapmap.find_simulations(self.folder), modes=['te'])
+        lower, upper, width = gmap.get_gaps('te')
+        self.assertEqual(width.shape, (3, 2))
+        # compare with get_gap_bands of each simulation:
+        for i, folder in enumerate(gmap.folders):
+            jobname = path.basename(folder)
+            data = np.loadtxt(path.join(folder, jobname + '_tefreqs.csv'),
+                              delimiter=',', skiprows=1)
+            gaps = get_gap_bands(data[:, 5:])
+            self.assertEqual(
+                [g[0] for g in gaps], list(np.nonzero(width[i])[0] + 1))
+            for bandnum, lo, hi, w in gaps:
+                self.assertAlmostEqual(width[i, bandnum - 1], w)
+        self.assertTrue(np.allclose(gmap.get_parameters('radius'),
+                                    [0.2, 0.3, 0.4]))
+
+        # only the new simulation is loaded:
+        newfolder = self.add_simulation(0.3, 0.25)
+        gmap = gapmap.GapMap(self.cache)
+        gmap._load_orig = gmap._load
+        loaded = []
+        def load(fname, sig):
+            loaded.append(fname)
+            return gmap._load_orig(fname, sig)
+        gmap._load = load
+        gmap.update(gapmap.find_simulations(self.folder), modes=['te'])
+        self.assertEqual(len(gmap), 4)
+        self.assertEqual([path.dirname(f) for f in loaded], [newfolder])
+
+        fname = path.join(self.folder, 'gapmap.png')
+        fig = gapmap.draw_gap_map(gmap, 'radius', filename=fname)
+        self.assertTrue(path.isfile(fname))
+        # one diagram for each thickness:
+        self.assertEqual(sum(ax.get_visible() for ax in fig.axes), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import math
+import numpy as np
+from geometry import Geometry
+from objects import Dielectric, Rod, Block, RodArray, BlockArray
+from utility import get_triangular_phc_waveguide_air_rods
+
+class TestGeometry(unittest.TestCase):
+
+    def test_rod_string_representation(self):
+        rod = Rod(x=0.5, y='(/ -3)', material=Dielectric(12), radius=0.2)
+        target = '\n'.join([
+            '',
+            '    (make cylinder',
+            '        (center 0.5 (/ -3) 0)',
+            '        (height infinity)',
+            '        (radius 0.2)',
+            '        (material (make dielectric (epsilon 12))) )'])
+        self.assertEqual(str(rod), target)
+        # rendering must not change the object:
+        self.assertFalse(hasattr(rod, 'other'))
+        self.assertEqual(str(rod), target)
+
+    def test_changed_object_is_rendered_again(self):
+        rod = Rod(x=0, y=0, material=Dielectric(12), radius=0.2)
+        before = str(rod)
+        rod.x = 1
+        self.assertNotEqual(str(rod), before)
+        self.assertIn('(center 1 0 0)', str(rod))
+
+    def test_geometry_string_representation(self):
+        eps = Dielectric(12)
+        rods = [Rod(x=i, y=0, material=eps, radius=0.2) for i in range(3)]
+        geom = Geometry(width=3, height=1, objects=rods)
+        self.assertEqual(
+            str(geom), '(list' + ''.join(str(r) for r in rods) + ')')
+        np.testing.assert_allclose(
+            geom.centers, [[0, 0, 0], [1, 0, 0], [2, 0, 0]])
+
+    def test_rod_array_renders_like_rods(self):
+        rods = get_triangular_phc_waveguide_air_rods(
+            radius=0.3, supercell_size=7, first_row_radius=0.25)
+        array = get_triangular_phc_waveguide_air_rods(
+            radius=0.3, supercell_size=7, first_row_radius=0.25,
+            as_array=True)
+        self.assertEqual(len(array), len(rods))
+        np.testing.assert_allclose(
+            Geometry(width=1, height=7, objects=[array]).centers,
+            Geometry(width=1, height=7, objects=rods).centers)
+        np.testing.assert_allclose(
+            array.radii, [r.radius for r in rods])
+        self.assertEqual(
+            str(array[0]),
+            '\n'.join([
+                '',
+                '    (make cylinder',
+                '        (center 0.0 %r 0.0)' % (-math.sqrt(3)),
+                '        (height infinity)',
+                '        (radius 0.3)',
+                '        (material air) )']))
+
+    def test_rod_array_equals_rod_list(self):
+        for ydirection in [False, True]:
+            for size in [1, 6, 21]:
+                kwargs = dict(
+                    radius=0.3, supercell_size=size, ydirection=ydirection,
+                    first_row_longitudinal_shift=0.05,
+                    first_row_transversal_shift=-0.1,
+                    first_row_radius=0.25,
+                    second_row_longitudinal_shift=-0.02,
+                    second_row_transversal_shift=0.03,
+                    second_row_radius=0.28)
+                rods = get_triangular_phc_waveguide_air_rods(**kwargs)
+                array = get_triangular_phc_waveguide_air_rods(
+                    as_array=True, **kwargs)
+                expected = RodArray.from_rods(rods)
+                np.testing.assert_allclose(
+                    array.centers, expected.centers, rtol=0, atol=1e-14)
+                np.testing.assert_array_equal(array.radii, expected.radii)
+                self.assertEqual(array.materials, ['air'])
+                self.assertTrue(np.all(array.material_indices == 0))
+
+    def test_rod_array_transformations(self):
+        array = RodArray(
+            np.zeros((4, 2)), materials=Dielectric(12), radii=0.2)
+        array.shift(dx=0.1, mask=[0, 2])
+        np.testing.assert_allclose(array.x, [0.1, 0, 0.1, 0])
+        first = array.copy().perturb(0.01, 0.01, random_state=1)
+        second = array.copy().perturb(0.01, 0.01, random_state=1)
+        np.testing.assert_array_equal(first.centers, second.centers)
+        np.testing.assert_array_equal(first.radii, second.radii)
+        self.assertTrue(np.all(first.z == 0))
+        before = str(first)
+        first.radii[0] = 0.3
+        self.assertNotEqual(str(first), before)
+        self.assertEqual(len(array[array.x > 0]), 2)
+
+    def test_block_array_renders_like_blocks(self):
+        eps = Dielectric(12)
+        blocks = BlockArray([[0, 0, 0.5]], materials=eps, sizes=(1, 2, 3))
+        self.assertEqual(
+            str(blocks),
+            str(Block(0.0, 0.0, 0.5, eps, (1.0, 2.0, 3.0))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from kspace import KSpaceRectangularGrid
+import graphics
+
+
+class TestBandSurfaces(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.jobname = path.join(self.folder, 'grid')
+        self.kspace = KSpaceRectangularGrid(x_steps=5, y_steps=4)
+        k = np.array(self.kspace.points())
+        # two bands: |k|^2 and 1 - k_x:
+        rows = np.column_stack([
+            np.arange(1, len(k) + 1), k, np.sqrt(np.sum(k**2, axis=1)),
+            np.sum(k**2, axis=1), 1 - k[:, 0]])
+        np.savetxt(self.jobname + '_tefreqs.csv', rows, delimiter=', ',
+                   header='k index, k1, k2, k3, kmag/2pi, te band 1, '
+                          'te band 2')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load(self):
+        kx, ky, freqs = graphics.load_band_surfaces(
+            self.jobname, 'te', self.kspace)
+        self.assertTrue(np.allclose(kx, np.linspace(-0.5, 0.5, 5)))
+        self.assertTrue(np.allclose(ky, np.linspace(-0.5, 0.5, 4)))
+        self.assertEqual(freqs.shape, (2, 4, 5))
+        self.assertTrue(np.allclose(
+            freqs[0], kx[np.newaxis, :]**2 + ky[:, np.newaxis]**2))
+        self.assertTrue(np.allclose(freqs[1], 1 - kx[np.newaxis, :]))
+
+    def test_draw(self):
+        fig = graphics.draw_band_surfaces(
+            self.jobname, ['te'], self.kspace, format='png', legend=True)
+        self.assertTrue(path.isfile(self.jobname + '_bandsurfaces.png'))
+        self.assertEqual(
+            sum(1 for ax in fig.axes if ax.get_title()), 2)
+        graphics.draw_band_surfaces(
+            self.jobname, ['te'], self.kspace, bands=[2], format='png',
+            stacked=True)
+        graphics.draw_bandstructure_2D(
+            self.jobname, 'te', self.kspace, 1, format='png', show=False)
+        self.assertTrue(path.isfile(self.jobname + '_teband01.png'))
+        # old positional calls with ext; doesn't block on show:
+        graphics.draw_bandstructure_2D(
+            self.jobname, 'te', self.kspace, 2, '.csv', 'png')
+        self.assertTrue(path.isfile(self.jobname + '_teband02.png'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from kspace import KSpaceRectangularGrid
+import isofreq
+
+
+class TestIsofrequencyContours(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.jobname = path.join(self.folder, 'grid')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_circles(self):
+        kx = np.linspace(-0.5, 0.5, 41)
+        ky = np.linspace(-0.5, 0.5, 31)
+        freqs = np.sqrt(kx[np.newaxis, :]**2 + ky[:, np.newaxis]**2)
+        contours = isofreq.isofrequency_contours(
+            kx, ky, freqs, [0.1, 0.3, 0.6])
+        self.assertEqual([len(c) for c in contours], [1, 1, 4])
+        for radius, lines in zip([0.1, 0.3], contours):
+            line = lines[0]
+            # closed contour:
+            self.assertTrue(np.allclose(line[0], line[-1]))
+            self.assertTrue(np.allclose(
+                np.sqrt(np.sum(line**2, axis=1)), radius, atol=2e-3))
+        # a saddle has two branches:
+        saddle = kx[np.newaxis, :] * ky[:, np.newaxis]
+        self.assertEqual(
+            len(isofreq.isofrequency_contours(kx, ky, saddle, 0.01)[0]), 2)
+
+    def test_load_band_grid(self):
+        kspace = KSpaceRectangularGrid(x_steps=5, y_steps=3)
+        k = np.array(kspace.points())
+        rows = np.column_stack([
+            np.arange(1, len(k) + 1), k, np.zeros(len(k)),
+            k[:, 0] + 2 * k[:, 1] + 1])
+        np.savetxt(self.jobname + '_tefreqs.csv', rows, delimiter=', ',
+                   header='k index, k1, k2, k3, kmag/2pi, te band 1')
+        grid = isofreq.load_band_grid(self.jobname, 'te', kspace)
+        self.assertIs(isofreq.load_band_grid(self.jobname, 'te', kspace),
+                      grid)
+        # finite differences if no velocities were exported:
+        self.assertTrue(np.allclose(grid.get_group_velocities(1), [1, 2]))
+
+        with open(self.jobname + '_tevelocity.csv', 'w') as f:
+            for i in range(len(k)):
+                f.write('{0}, #(0.5 0.25 0)\n'.format(i + 1))
+        grid2 = isofreq.load_band_grid(self.jobname, 'te', kspace)
+        self.assertIsNot(grid2, grid)
+        self.assertTrue(np.allclose(grid2.get_group_velocities(1),
+                                    [0.5, 0.25]))
+        isofreq.draw_isofrequency_contours(
+            grid2, 1, [1.0, 1.5], filename=path.join(self.folder, 'c.png'))
+        self.assertTrue(path.isfile(path.join(self.folder, 'c.png')))
+
+if __name__ == '__main__':
+    unittest.main()
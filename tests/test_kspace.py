@@ -190,5 +190,46 @@ class TestKSpaces(unittest.TestCase):
         self.assertEqual(test_kspace.points(), corrected_points)
         self.assertFalse(test_kspace.has_labels())
 
+    def test_KSpaceRectangular_interpolated_points(self):
+        k_interpolation = 3
+        test_kspace = KSpaceRectangular(k_interpolation=k_interpolation)
+        points = test_kspace.interpolated_points()
+        self.assertEqual(points.shape, (test_kspace.count_interpolated(), 3))
+        np.testing.assert_allclose(
+            points[:5],
+            [(0, 0, 0), (0.125, 0, 0), (0.25, 0, 0), (0.375, 0, 0),
+             (0.5, 0, 0)])
+        np.testing.assert_allclose(points[-1], (0, 0, 0))
+        np.testing.assert_array_equal(
+            test_kspace.point_indices(), [0, 4, 8, 12])
+
+    def test_KSpaceTriangular_interpolated_points_scheme_expressions(self):
+        test_kspace = KSpaceTriangular(k_interpolation=0)
+        np.testing.assert_allclose(
+            test_kspace.interpolated_points(),
+            [(0, 0, 0), (0, 0.5, 0), (-1 / 3, 1 / 3, 0), (0, 0, 0)])
+
+    def test_KSpaceTriangular_uniform_interpolation(self):
+        k_interpolation = 10
+        old_func = defaults.k_uniform_interpolation_function
+        defaults.k_uniform_interpolation_function = 'kinterpolate-uniform'
+        try:
+            test_kspace = KSpaceTriangular(k_interpolation=k_interpolation)
+            test_kspace.use_uniform_interpolation = True
+            points = test_kspace.interpolated_points()
+            indices = test_kspace.point_indices()
+            self.assertEqual(len(points), test_kspace.count_interpolated())
+        finally:
+            defaults.k_uniform_interpolation_function = old_func
+        # steps in cartesian k-space must be (nearly) equal:
+        steps = np.sqrt(np.sum(np.square(np.diff(
+            points.dot(test_kspace.reciprocal_basis()), axis=0)), axis=1))
+        self.assertLess(steps.max() / steps.min(), 1.2)
+        # the critical points must still be included:
+        np.testing.assert_allclose(
+            points[indices],
+            [(0, 0, 0), (0, 0.5, 0), (-1 / 3, 1 / 3, 0), (0, 0, 0)],
+            atol=1e-12)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
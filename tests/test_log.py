@@ -0,0 +1,95 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import json
+import shutil
+import tempfile
+import log
+from artifacts import ArtifactRegistry
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = path.join(self.folder, 'events.jsonl')
+
+    def tearDown(self):
+        log.reset_logger()
+        shutil.rmtree(self.folder)
+
+    def read_events(self):
+        with open(self.filename) as f:
+            return [json.loads(line) for line in f]
+
+    def test_disabled(self):
+        log.event('job_start', ncpu=2)
+        with log.timed('stage', name='test') as ev:
+            ev['extra'] = 1
+        self.assertFalse(path.exists(self.filename))
+
+    def test_events(self):
+        log.setup_event_log(self.filename, job='testjob')
+        log.setup_logger(
+            'root.testjob', path.join(self.folder, 'test.log'), quiet=True)
+        with log.timed('subprocess', command='true') as ev:
+            ev['returncode'] = 0
+        log.warning('something %s', 'happened')
+        log.close_event_log()
+        # not written anymore:
+        log.event('job_start')
+        events = self.read_events()
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0]['event'], 'subprocess')
+        self.assertEqual(events[0]['returncode'], 0)
+        self.assertEqual(events[0]['job'], 'testjob')
+        self.assertGreaterEqual(events[0]['duration'], 0)
+        self.assertEqual(events[1]['event'], 'log')
+        self.assertEqual(events[1]['message'], 'something happened')
+
+    def test_buffered_warning_emitted_once(self):
+        log.reset_logger()
+        log.setup_event_log(self.filename)
+        # buffered, the logger is not set up yet:
+        log.warning('early warning')
+        log.setup_logger(
+            'root.buffered', path.join(self.folder, 'test.log'), quiet=True)
+        log.close_event_log()
+        events = self.read_events()
+        self.assertEqual(
+            [(e['event'], e['message']) for e in events],
+            [('log', 'early warning')])
+
+    def test_cache_events(self):
+        log.setup_event_log(self.filename)
+        registry = ArtifactRegistry(path.join(self.folder, 'reg.json'))
+        output = path.join(self.folder, 'output')
+        self.assertFalse(registry.is_up_to_date('step', [], 'recipe'))
+        open(output, 'w').close()
+        registry.update('step', [], [output], 'recipe')
+        self.assertTrue(registry.is_up_to_date('step', [], 'recipe'))
+        log.close_event_log()
+        events = self.read_events()
+        self.assertEqual(
+            [(e['event'], e.get('hit')) for e in events],
+            [('cache', False), ('stage', None), ('cache', True)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import os
+import shutil
+import tempfile
+import json
+from glob import glob
+import numpy as np
+import optimize
+
+
+class DummySim(object):
+    def __init__(self, folder, jobname, x, y, clear_subfolder):
+        self.workingdir = folder
+        self.jobname = jobname
+        self.x = x
+        self.y = y
+        # like Simulation, move old results to a backup folder and start
+        # a log file:
+        if clear_subfolder and path.isdir(folder):
+            if path.isdir(folder + '_bak'):
+                shutil.rmtree(folder + '_bak')
+            os.rename(folder, folder + '_bak')
+        if not path.isdir(folder):
+            os.mkdir(folder)
+        self.log_file = path.join(
+            folder, '{0}_{1}.log'.format(jobname, len(os.listdir(folder))))
+        open(self.log_file, 'w').close()
+
+
+class DummyJob(object):
+    def __init__(self, sim):
+        self.jobname = sim.jobname
+        self.sim = sim
+
+    def setup_logger(self):
+        pass
+
+    def run_mpb(self):
+        if not path.isdir(self.sim.workingdir):
+            os.mkdir(self.sim.workingdir)
+        index = len(glob(path.join(self.sim.workingdir, '*.out')))
+        fname = path.join(self.sim.workingdir, '{0}_{1}.out'.format(
+            self.jobname, index))
+        with open(fname, 'w') as f:
+            f.write('finished on: ...\nreturncode: 0')
+        return 0
+
+    def post_process(self):
+        return True
+
+
+class TestOptimize(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def make_job(self, job_name_suffix, runmode, x, y):
+        # like the functions in phc_simulations:
+        jobname = 'dummy' + job_name_suffix
+        sim = DummySim(path.join(self.folder, jobname), jobname, x, y,
+                       clear_subfolder=runmode == 'queue')
+        if runmode == 'queue':
+            return DummyJob(sim)
+        return sim
+
+    def test_cmaes(self):
+        es = optimize.CMAES([3, -2], 1.0)
+        for gen in range(80):
+            xs = es.ask(seed=gen)
+            es.tell(xs, [np.sum((x - [1, 0.5]) ** 2) for x in xs])
+        self.assertTrue(np.allclose(es.mean, [1, 0.5], atol=1e-3))
+
+    def test_optimizer(self):
+        checkpoint = path.join(self.folder, 'checkpoint.json')
+        objective = lambda job: (
+            (job.sim.x - 0.3) ** 2 + (job.sim.y + 0.1) ** 2)
+        params = dict(x=(-1, 1), y=(-1, 1))
+        opt = optimize.Optimizer(
+            params, self.make_job, objective, checkpoint, popsize=4,
+            mpb_workers=2)
+        opt.run(generations=3)
+        self.assertEqual(len(opt.history), 12)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['strategy']['generation'], 3)
+
+        # resume and continue:
+        opt2 = optimize.Optimizer(
+            params, self.make_job, objective, checkpoint, popsize=4)
+        self.assertEqual(opt2.strategy.generation, 3)
+        best, value = opt2.run(generations=30)
+        self.assertEqual(len(opt2.history), 120)
+        self.assertAlmostEqual(best['x'], 0.3, places=2)
+        self.assertAlmostEqual(best['y'], -0.1, places=2)
+        self.assertAlmostEqual(value, 0, places=4)
+
+        # a new search with the same seed finds the finished simulations:
+        numout = len(glob(path.join(self.folder, '*', '*.out')))
+        opt3 = optimize.Optimizer(
+            params, self.make_job, objective, popsize=4)
+        opt3.run(generations=2)
+        self.assertEqual(
+            len(glob(path.join(self.folder, '*', '*.out'))), numout)
+        # and did not move them to backup folders:
+        self.assertEqual(glob(path.join(self.folder, '*_bak')), [])
+        self.assertEqual(
+            [h['value'] for h in opt3.history],
+            [h['value'] for h in opt2.history[:8]])
+
+if __name__ == '__main__':
+    unittest.main()
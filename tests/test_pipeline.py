@@ -0,0 +1,91 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import pipeline
+
+class DummyJob(object):
+    def __init__(self, name, retcode=0, post_ok=True, folder=None):
+        self.jobname = name
+        self.key = name
+        self.retcode = retcode
+        self.post_ok = post_ok
+        self.requires = []
+        # if given, post_process creates a file there and run_mpb fails
+        # if the files of the required jobs do not exist:
+        self.folder = folder
+
+    def setup_logger(self):
+        pass
+
+    def run_mpb(self):
+        if self.folder and not all(
+                path.isfile(path.join(self.folder, job.jobname))
+                for job in self.requires):
+            return 2
+        return self.retcode
+
+    def post_process(self):
+        if not self.post_ok:
+            raise RuntimeError('post-processing failed')
+        if self.folder:
+            open(path.join(self.folder, self.jobname), 'w').close()
+        return True
+
+class TestPipeline(unittest.TestCase):
+
+    def test_run_pipelined(self):
+        jobs = [DummyJob('a'), DummyJob('b', retcode=1),
+                DummyJob('c', post_ok=False), DummyJob('d')]
+        results = pipeline.run_pipelined(jobs, mpb_workers=2, post_workers=1)
+        self.assertEqual(
+            results, [(0, True), (1, False), (0, False), (0, True)])
+    def test_required_jobs(self):
+        folder = tempfile.mkdtemp()
+        try:
+            bulk = DummyJob('bulk', folder=folder)
+            failing = DummyJob('failing', retcode=1, folder=folder)
+            first = DummyJob('first', folder=folder)
+            first.requires = [bulk]
+            # the same prerequisite, queued a second time:
+            second = DummyJob('second', folder=folder)
+            second.requires = [DummyJob('bulk', folder=folder)]
+            skipped = DummyJob('skipped', folder=folder)
+            skipped.requires = [bulk, failing]
+            results = pipeline.run_pipelined(
+                [first, second, skipped], mpb_workers=2, post_workers=2)
+            self.assertEqual(results, [(0, True), (0, True), (None, False)])
+            self.assertFalse(path.isfile(path.join(folder, 'skipped')))
+        finally:
+            shutil.rmtree(folder)
+    def test_unpicklable_job(self):
+        # fails outside of the worker, must not block run_pipelined:
+        bad = DummyJob('bad')
+        bad.unpicklable = lambda: None
+        dependent = DummyJob('dependent')
+        dependent.requires = [bad]
+        results = pipeline.run_pipelined(
+            [DummyJob('a'), bad, dependent], mpb_workers=1, post_workers=1)
+        self.assertEqual(results, [(0, True), (None, False), (None, False)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import log
+import profiler
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiler.disable()
+        shutil.rmtree(self.folder)
+
+    def test_disabled(self):
+        with profiler.stage('post_process') as entry:
+            self.assertIsNone(entry)
+        with profiler.job('job1', self.folder):
+            pass
+        self.assertFalse(
+            path.exists(path.join(self.folder, 'job1_timing.json')))
+
+    def test_stages_and_subprocesses(self):
+        prof = profiler.enable()
+        with profiler.job('job1', self.folder):
+            with profiler.stage('post_process'):
+                with log.timed('subprocess', command='/usr/bin/h5topng x'):
+                    pass
+                with profiler.stage('export_csv'):
+                    pass
+            log.event('job_finish', returncode=0, duration=2.0)
+        records = dict((rec['stage'], rec) for rec in prof.records)
+        self.assertEqual(
+            sorted(records),
+            ['job', 'job/post_process', 'job/post_process/export_csv'])
+        self.assertEqual(records['job']['subprocesses'], 2)
+        self.assertEqual(records['job/post_process']['subprocesses'], 1)
+        self.assertEqual(
+            records['job/post_process']['programs']['h5topng'][0], 1)
+        self.assertEqual(records['job']['programs']['mpb'], (1, 2.0))
+        self.assertGreaterEqual(records['job']['wall_time'], 0)
+
+        fname = path.join(self.folder, 'job1_timing.json')
+        self.assertTrue(path.isfile(fname))
+        report = profiler.aggregate_reports([fname, fname])
+        line = [l for l in report.splitlines()
+                if l.strip().startswith('export_csv')][0]
+        self.assertEqual(line.split()[1], '2')
+
+    def test_profiled(self):
+        @profiler.profiled('work')
+        def work(x):
+            return 2 * x
+        self.assertEqual(work(1), 2)
+        prof = profiler.enable()
+        self.assertEqual(work(2), 4)
+        self.assertEqual([rec['stage'] for rec in prof.records], ['work'])
+        self.assertIs(profiler.disable(), prof)
+        self.assertNotIn(prof._on_event, log.event_handlers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import os
+import shutil
+import tempfile
+import numpy as np
+import defaults
+import projectedbands
+
+
+class TestProjectedBandsTable(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = []
+        for i in range(3):
+            jobname = 'TriHoles2D_SiN_r300_projk{0:06.0f}'.format(i * 1e5)
+            os.mkdir(path.join(self.folder, jobname))
+            fname = path.join(self.folder, jobname, jobname + '_te_ranges.csv')
+            self.write_ranges(fname, i)
+            self.files.append(fname)
+        projectedbands._loaded.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_ranges(self, fname, offset):
+        np.savetxt(
+            fname,
+            [[1, 0.1 + offset, 0.2 + offset], [2, 0.3 + offset, 0.4 + offset]],
+            header='bandnum, min, max', fmt=['%.0f', '%.6f', '%.6f'],
+            delimiter=', ')
+
+    def test_load_ranges(self):
+        missing = path.join(self.folder, 'missing', 'missing_te_ranges.csv')
+        ranges = projectedbands.load_ranges(self.files + [missing])
+        self.assertIsNone(ranges[-1])
+        self.assertTrue(np.allclose(ranges[2], [[1, 2.1, 2.2], [2, 2.3, 2.4]]))
+        tfile = path.join(self.folder, defaults.projected_bands_table_file)
+        self.assertTrue(path.isfile(tfile))
+
+        # the saved table holds the ranges of all files:
+        projectedbands._loaded.clear()
+        table = projectedbands.ProjectedBandsTable(tfile)
+        for fname, rng in zip(self.files, ranges):
+            self.assertTrue(np.array_equal(
+                table._entries[table._key(fname)][1], rng))
+        self.assertEqual(len(table._entries), 3)
+
+        # changed files are loaded again:
+        self.write_ranges(self.files[0], 5)
+        os.utime(self.files[0], (0, 12345))
+        ranges = projectedbands.load_ranges(self.files)
+        self.assertTrue(np.allclose(ranges[0][:, 1], [5.1, 5.3]))
+        projectedbands._loaded.clear()
+        ranges = projectedbands.load_ranges(self.files)
+        self.assertTrue(np.allclose(ranges[0][:, 1], [5.1, 5.3]))
+
+    def test_tables_saved_one_after_the_other(self):
+        # e.g. two processes post-processing at the same time, both
+        # loaded the (not yet existing) table before the other saved it:
+        tfile = path.join(self.folder, defaults.projected_bands_table_file)
+        first = projectedbands.ProjectedBandsTable(tfile)
+        second = projectedbands.ProjectedBandsTable(tfile)
+        first.get(self.files[0])
+        second.get(self.files[1])
+        second.get(self.files[2])
+        first.save()
+        second.save()
+        table = projectedbands.ProjectedBandsTable(tfile)
+        self.assertEqual(
+            sorted(table._entries),
+            sorted(table._key(fname) for fname in self.files))
+
+if __name__ == '__main__':
+    unittest.main()
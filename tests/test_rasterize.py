@@ -0,0 +1,91 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import numpy as np
+from geometry import Geometry
+from objects import Dielectric, Rod, RodArray, BlockArray
+from rasterize import rasterize_epsilon
+
+class TestRasterize(unittest.TestCase):
+
+    def test_filling_fraction_triangular(self):
+        geom = Geometry(
+            width=1, height=1, triangular=True,
+            objects=[Rod(x=0, y=0, material='air', radius=0.3)])
+        eps = rasterize_epsilon(geom, 64, default_epsilon=12)
+        self.assertEqual(eps.shape, (64, 64))
+        self.assertEqual(set(np.unique(eps)), set([1, 12]))
+        # area of hole / area of unit cell:
+        self.assertAlmostEqual(
+            np.mean(eps == 1), np.pi * 0.09 / (np.sqrt(3) / 2), places=2)
+
+    def test_periodic_images(self):
+        # a rod in the corner of the cell is continued periodically:
+        corner = Geometry(
+            width=1, height=1,
+            objects=[Rod(x=0.5, y=0.5, material='air', radius=0.2)])
+        center = Geometry(
+            width=1, height=1,
+            objects=[RodArray([[0, 0]], materials='air', radii=0.2)])
+        self.assertEqual(
+            np.sum(rasterize_epsilon(corner, 32, 12) == 1),
+            np.sum(rasterize_epsilon(center, 32, 12) == 1))
+
+    def test_block_in_cartesian_coordinates(self):
+        geom = Geometry(
+            width=1, height=1, triangular=True,
+            objects=[BlockArray(
+                [[0, 0, 0]], materials='air', sizes=(0.4, 0.2, 1))])
+        eps = rasterize_epsilon(geom, 128, default_epsilon=12)
+        # area of block / area of unit cell:
+        self.assertAlmostEqual(
+            np.mean(eps == 1), 0.08 / (np.sqrt(3) / 2), places=2)
+
+    def test_rod_array_equals_rods(self):
+        rnd = np.random.RandomState(1)
+        num = 40
+        array = RodArray(
+            rnd.uniform(-1, 1, (num, 2)),
+            materials=['air', Dielectric(4)],
+            radii=rnd.uniform(0.05, 0.3, num),
+            material_indices=rnd.randint(0, 2, num))
+        for triangular in [False, True]:
+            eps_array = rasterize_epsilon(
+                Geometry(width=2, height=3, triangular=triangular,
+                         objects=[array]),
+                16, default_epsilon=12)
+            eps_rods = rasterize_epsilon(
+                Geometry(width=2, height=3, triangular=triangular,
+                         objects=array.to_objects()),
+                16, default_epsilon=12)
+            # overlapping rods: the later one takes precedence in both:
+            np.testing.assert_array_equal(eps_array, eps_rods)
+
+    def test_substrate(self):
+        geom = Geometry(width=1, height=1, depth=4, objects=[])
+        geom.add_substrate(Dielectric(2), start_at=-0.5)
+        eps = rasterize_epsilon(geom, 8, default_epsilon=1, z=None)
+        self.assertEqual(eps.shape, (8, 8, 32))
+        # z from -2 to 2 in steps of 0.125, substrate below -0.5:
+        np.testing.assert_array_equal(
+            eps[0, 0], [2] * 13 + [1] * 19)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import os
+import shutil
+import tempfile
+import numpy as np
+import slowlight
+
+
+class TestSlowLight(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.folders = []
+        k = np.linspace(0, 0.5, 51)
+        # band 1: slow light band, slower for smaller amplitude;
+        # band 2: constant n_g = 1 / 0.3:
+        for i, amp in enumerate([0.02, 0.01]):
+            jobname = 'W1_{0}'.format(i)
+            folder = path.join(self.folder, jobname)
+            os.mkdir(folder)
+            rows = np.column_stack([
+                np.arange(1, 52), k, 0 * k, 0 * k, k,
+                0.25 + amp * np.sin(np.pi * k), 0.2 + 0.3 * k])
+            np.savetxt(path.join(folder, jobname + '_tefreqs.csv'), rows,
+                       delimiter=', ', header='k index, k1, k2, k3, kmag')
+            with open(path.join(folder, jobname + '_tevelocity.csv'),
+                      'w') as f:
+                for j, kx in enumerate(k):
+                    f.write('{0}, #({1} 0 0), #(0.3 0 0)\n'.format(
+                        j + 1, amp * np.pi * np.cos(np.pi * kx)))
+            self.folders.append(folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_group_index(self):
+        analysis = slowlight.analyze_sweep(
+            self.folders, 'te', light_line=False, cache_file=False)
+        k = np.linspace(0, 0.5, 51)[:40]
+        self.assertTrue(np.allclose(
+            analysis.group_index[0, :40, 0],
+            1 / (0.02 * np.pi * np.cos(np.pi * k))))
+        self.assertTrue(np.allclose(analysis.group_index[:, :, 1], 1 / 0.3))
+        # finite differences give (almost) the same:
+        fd = slowlight.SlowLightAnalysis(
+            analysis.jobnames, analysis.kdata, analysis.freqs,
+            light_line=False)
+        self.assertTrue(np.allclose(
+            fd.group_index[:, 1:40], analysis.group_index[:, 1:40],
+            rtol=1e-3))
+        self.assertTrue(np.allclose(fd.gvd[:, :, 1], 0))
+
+    def test_table(self):
+        analysis = slowlight.analyze_sweep(
+            self.folders, 'te', light_line=False, cache_file=False)
+        table = analysis.get_table()
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(table['band']), [1, 2, 1, 2])
+        # constant n_g: the window is the whole band:
+        row = table[1]
+        self.assertAlmostEqual(row['bandwidth'], 0.15 / 0.275)
+        self.assertAlmostEqual(row['ndbp'], 0.15 / 0.275 / 0.3)
+        # the flatter band of W1_1 is slower:
+        ranked = slowlight.rank(table[table['band'] == 1], 'mean_group_index')
+        self.assertEqual(ranked['jobname'][0], 'W1_1')
+        fname = path.join(self.folder, 'table.csv')
+        slowlight.save_table(ranked, fname)
+        with open(fname) as f:
+            self.assertEqual(len(f.readlines()), 3)
+
+    def test_light_line(self):
+        analysis = slowlight.analyze_sweep(
+            self.folders, 'te', cache_file=False)
+        freqs = analysis.freqs[analysis.guided]
+        kmag = np.broadcast_to(
+            analysis.kdata[:, :, 3:], analysis.freqs.shape)[analysis.guided]
+        self.assertTrue(np.all(freqs < kmag))
+        table = analysis.get_table()
+        self.assertTrue(np.all(table['guided_points'] < 51))
+
+if __name__ == '__main__':
+    unittest.main()
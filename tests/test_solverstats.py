@@ -0,0 +1,91 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+import os
+from os import path
+import shutil
+import subprocess as sp
+import tempfile
+import numpy as np
+from solverstats import parse_solver_stats, save_solver_stats
+from solverstats import load_solver_stats, summarize
+from simulation import _wait_with_max_rss
+
+OUTPUT = '''Solving for band polarization: te.
+solve_kpoint (0,0,0):
+Solving for bands 1 to 4...
+    iteration    1: trace = 2.5 (100% change)
+    iteration    2: trace = 2.4 (0.01% change)
+Finished solving for bands 1 to 4 after 12 iterations.
+Solving for bands 5 to 8...
+Finished solving for bands 5 to 8 after 20 iterations.
+tefreqs:, 1, 0, 0, 0, 0, 0.1
+elapsed time for k point: 0.5
+solve_kpoint (0.5,0,0):
+Solving for bands 1 to 8...
+    iteration    1: trace = 2.5 (1e-05% change)
+Warning: eigensolver did not converge.
+Finished solving for bands 1 to 8 after 100 iterations.
+tefreqs:, 2, 0.5, 0, 0, 0.5, 0.4
+elapsed time for k point: 2.5
+total elapsed time for run: 3.5
+done.
+finished on: 2016-05-01 10:00:04.000000 (duration: 0:00:04.000000)
+max memory (RSS): 2048 kB
+'''
+
+class TestSolverStats(unittest.TestCase):
+
+    def test_parse_and_save(self):
+        stats, summary = parse_solver_stats(OUTPUT)
+        self.assertEqual(list(stats.keys()), ['te'])
+        st = stats['te']
+        np.testing.assert_array_equal(st['k_index'], [1, 2])
+        np.testing.assert_array_equal(st['iterations'], [32, 100])
+        np.testing.assert_array_equal(st['time'], [0.5, 2.5])
+        np.testing.assert_array_equal(st['converged'], [True, False])
+        self.assertEqual(summary['run_times'], {'te': 3.5})
+        self.assertEqual(summary['duration'], 4)
+        self.assertEqual(summary['max_memory'], 2048 * 1024)
+        self.assertIn('#2 (2.50 s', summarize(stats, summary))
+
+        folder = tempfile.mkdtemp()
+        try:
+            jobname = path.join(folder, 'job')
+            save_solver_stats(st, jobname + '_tesolverstats.csv')
+            loaded = load_solver_stats(jobname, 'te')
+        finally:
+            shutil.rmtree(folder)
+        for name in st.dtype.names:
+            np.testing.assert_array_equal(loaded[name], st[name])
+    @unittest.skipUnless(hasattr(os, 'wait4'), 'needs os.wait4')
+    def test_max_rss_of_process(self):
+        # a process using (at least) 100 MB:
+        process = sp.Popen([
+            sys.executable, '-c',
+            'import sys; x = b"x" * (100 * 2**20); sys.exit(3)'])
+        retcode, max_rss = _wait_with_max_rss(process)
+        self.assertEqual(retcode, 3)
+        self.assertEqual(process.returncode, 3)
+        self.assertGreater(max_rss, 100 * 1024)
+        self.assertLess(max_rss, 1024 * 1024)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import os
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import sweepplot
+
+
+class TestSweepPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.folders = []
+        # two simulations with 3 k-vectors and 2 bands, one with 4 and 3:
+        for i, (nk, nb) in enumerate([(3, 2), (3, 2), (4, 3)]):
+            jobname = 'sim{0}'.format(i)
+            folder = path.join(self.folder, jobname)
+            os.mkdir(folder)
+            k = np.linspace(0, 0.5, nk)
+            rows = [[j + 1, kx, 0, 0, kx] +
+                    [(b + 1) * 0.1 * (kx + 1) + i * 0.01 for b in range(nb)]
+                    for j, kx in enumerate(k)]
+            np.savetxt(path.join(folder, jobname + '_tefreqs.csv'), rows,
+                       delimiter=',', header='k index, k1, k2, k3, kmag',
+                       comments='')
+            self.folders.append(folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_load(self):
+        sweep = sweepplot.load_sweep_bands(
+            self.folders + [path.join(self.folder, 'missing')], 'te')
+        self.assertEqual(len(sweep), 3)
+        self.assertEqual(sweep.bands.shape, (3, 4, 3))
+        self.assertTrue(np.all(np.isnan(sweep.bands[0, 3])))
+        self.assertTrue(np.all(np.isnan(sweep.bands[0, :, 2])))
+        self.assertAlmostEqual(sweep.bands[2, 0, 2], 0.32)
+        x = sweep.get_x_values()
+        self.assertTrue(np.allclose(x[2], [0, 1 / 6, 2 / 6, 0.5]))
+        self.assertTrue(np.isnan(x[0, 3]))
+
+        # second call uses the memory-mapped cache:
+        cached = sweepplot.load_sweep_bands(self.folders, 'te')
+        self.assertIsInstance(cached.bands, np.memmap)
+        self.assertTrue(np.array_equal(
+            cached.bands, sweep.bands, equal_nan=True))
+
+    def test_draw(self):
+        sweep = sweepplot.load_sweep_bands(self.folders, 'te',
+                                           cache_file=False)
+        overlay = path.join(self.folder, 'overlay.png')
+        ax = sweepplot.draw_sweep_overlay(
+            sweep, labels=[1, 2, 3], filename=overlay)
+        self.assertTrue(path.isfile(overlay))
+        self.assertEqual(len(ax.collections), 3)
+        # cropped below the lowest frequency of the highest bands:
+        self.assertAlmostEqual(ax.get_ylim()[1], 0.2)
+
+        grid = path.join(self.folder, 'grid.png')
+        fig = sweepplot.draw_sweep_grid(
+            sweep, labels=['a', 'b', 'c'], filename=grid)
+        self.assertTrue(path.isfile(grid))
+        self.assertEqual(sum(ax.get_visible() for ax in fig.axes), 3)
+
+if __name__ == '__main__':
+    unittest.main()
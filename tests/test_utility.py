@@ -0,0 +1,104 @@
+    #Copyright 2016 Juergen Probst
+    #This program is free software; you can redistribute it and/or modify
+    #it under the terms of the GNU General Public License as published by
+    #the Free Software Foundation; either version 3 of the License, or
+    #(at your option) any later version.
+
+    #This program is distributed in the hope that it will be useful,
+    #but WITHOUT ANY WARRANTY; without even the implied warranty of
+    #MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    #GNU General Public License for more details.
+
+    #You should have received a copy of the GNU General Public License
+    #along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import division
+
+import unittest
+
+import sys
+sys.path.append('../')
+from os import path
+import shutil
+import tempfile
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import defaults
+import utility
+
+class TestComposePatternImages(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # 2 k-vectors, 2 bands, real and imaginary parts, 6x4 pixels:
+        for k in (1, 5):
+            for b in (1, 2):
+                for ri in 'ri':
+                    img = np.empty((4, 6, 3))
+                    img.fill(0.1 * b + (0.5 if ri == 'i' else 0))
+                    plt.imsave(
+                        path.join(self.folder,
+                                  'e.k{0:02d}.b{1:02d}.z.{2}.te.png'.format(
+                                      k, b, ri)),
+                        img)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_layout(self):
+        tiles = [('e.k{0:02d}.b{1:02d}.z.{2}.te.png'.format(k, b, ri),
+                  b, k, ri) for k in (1, 5) for b in (1, 2) for ri in 'ri']
+        canvas, imgsize = utility.compose_pattern_images(
+            self.folder, tiles, [1, 5], [1, 2], ['r', 'i'],
+            borderpixel=4)
+        self.assertEqual(imgsize, (6, 4))
+        # cells are (6 + 2*4) x (4 + 3*4) pixels:
+        self.assertEqual(canvas.shape, (2 * 16, 4 * 14, 4))
+        # border:
+        self.assertAlmostEqual(canvas[0, 0, 0], 0.5)
+        # real part of band 2 (top row), first k-vector; a thin
+        # border of 2 pixels to the imaginary part on the right:
+        self.assertAlmostEqual(canvas[8, 14 - 2 - 1, 0], 0.2, 2)
+        self.assertAlmostEqual(canvas[8, 14 - 2, 0], 0.5)
+        # imaginary part of band 1, second k-vector:
+        self.assertAlmostEqual(canvas[16 + 8, 3 * 14 + 2, 0], 0.6, 2)
+
+    def test_load_images(self):
+        fname = path.join(self.folder, 'e.k01.b01.z.r.te.png')
+        self.assertEqual(utility.png_size(fname), (6, 4))
+        fnames = [path.join(self.folder, 'e.k01.b01.z.{0}.te.png'.format(ri))
+                  for ri in 'ri']
+        images = utility.load_images(fnames, num_threads=2)
+        self.assertEqual(images[fnames[0]].shape[:2], (4, 6))
+        # second time from cache:
+        again = utility.load_images(fnames)
+        self.assertIs(again[fnames[1]], images[fnames[1]])
+
+    def test_tile_cache_is_bounded_by_bytes(self):
+        fnames = [path.join(self.folder, 'e.k01.b01.z.{0}.te.png'.format(ri))
+                  for ri in 'ri']
+        size = defaults.field_dist_tile_cache_bytes
+        try:
+            # only room for one image:
+            defaults.field_dist_tile_cache_bytes = utility.load_images(
+                fnames[:1])[fnames[0]].nbytes
+            first = utility.load_images(fnames[:1])[fnames[0]]
+            utility.load_images(fnames[1:])
+            self.assertIsNot(utility.load_images(fnames[:1])[fnames[0]], first)
+            self.assertLessEqual(
+                sum(img.nbytes for img in utility._tile_cache.values()),
+                defaults.field_dist_tile_cache_bytes)
+        finally:
+            defaults.field_dist_tile_cache_bytes = size
+
+    def test_raw_sheet(self):
+        utility.distribute_pattern_images(
+            self.folder, path.join(self.folder, 'patterns'), 'png',
+            raw=True)
+        self.assertTrue(
+            path.isfile(path.join(self.folder, 'patterns.e_z.te.png')))
+
+if __name__ == '__main__':
+    unittest.main()
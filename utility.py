@@ -22,16 +22,23 @@ from __future__ import division
 from math import sqrt, pi, sin, cos
 import numpy as np
 from geometry import Geometry
-from objects import Rod
+from objects import Rod, RodArray
 from copy import copy
-from os import path
+from os import path, stat
 from glob import glob1
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import struct
 import re
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
 
 import log
 import defaults
+import profiler
+import pipeline
+# re-exported, many scripts import it from here:
+from scheme import scheme_to_float
 
 
 class ContinuousStepwiseLinearFunction:
@@ -90,7 +97,10 @@ def get_triangular_phc_waveguide_air_rods(
         first_row_radius=None,
         second_row_longitudinal_shift=0,
         second_row_transversal_shift=0,
-        second_row_radius=None):
+        second_row_radius=None, as_array=False):
+    # If as_array, return the rods as objects.RodArray (with the same
+    # order of rods), computed directly with numpy without creating Rod
+    # objects, which is faster for big supercells.
     # make it odd:
     if supercell_size % 2 == 0:
         supercell_size += 1
@@ -106,6 +116,41 @@ def get_triangular_phc_waveguide_air_rods(
     else:
         r2 = second_row_radius
 
+    if as_array:
+        # Row numbers (in units of sqrt(3), perpendicular to the waveguide)
+        # of the center holes, in the same order as in the list below:
+        center_rows = np.array(
+            [-1, 1] + list(range(-sch, -1)) + list(range(2, sch + 1)),
+            dtype=float)
+        # ...and of the perimeter holes:
+        perimeter_rows = np.array(
+            [-1, 0, -2, 1] + list(range(-sch, -2)) + list(range(2, sch + 1)),
+            dtype=float) + 0.5
+        nc = len(center_rows)
+        transversal = np.concatenate(
+            [center_rows, perimeter_rows]) * np.sqrt(3)
+        longitudinal = np.concatenate(
+            [np.zeros(nc), np.full(len(perimeter_rows), 0.5)])
+        radii = np.full(len(transversal), float(radius))
+        # overrides of the first two rows next to the waveguide:
+        row2 = np.zeros(len(transversal), dtype=bool)
+        row2[:2] = True
+        row1 = np.zeros(len(transversal), dtype=bool)
+        row1[nc:nc + 2] = True
+        transversal[row2] += second_row_transversal_shift
+        longitudinal[row2] += second_row_longitudinal_shift
+        radii[row2] = r2
+        transversal[row1] += first_row_transversal_shift
+        longitudinal[row1] += first_row_longitudinal_shift
+        radii[row1] = r1
+        if ydirection:
+            x, y = transversal, longitudinal
+        else:
+            x, y = longitudinal, transversal
+        return RodArray(
+            centers=np.column_stack([x, y, np.zeros(len(x))]),
+            materials='air', radii=radii)
+
     # template for hole positions perpendicular to waveguide direction:
     perp_pos_template = '(* {0:.1f} (sqrt 3))'
     perp_pos_template_row1 = perp_pos_template
@@ -118,7 +163,7 @@ def get_triangular_phc_waveguide_air_rods(
     # Create geometry and add objects.
     # Note: (0, 0, 0) is the center of the unit cell.
     if ydirection:
-        return (
+        rods = (
             # center holes (holes along axis of computational domain strip):
 
             # second set of holes next to waveguide:
@@ -178,7 +223,7 @@ def get_triangular_phc_waveguide_air_rods(
             ]
         )
     else:
-        return (
+        rods = (
             # center holes (holes along axis of computational domain strip):
 
             # second set of holes next to waveguide:
@@ -238,13 +283,15 @@ def get_triangular_phc_waveguide_air_rods(
             ]
         )
 
+    return rods
+
 
 def max_epsilon(geometry, anisotropic_component=0):
     return max(
         obj.material.epsilon[anisotropic_component] 
         if isinstance(obj.material.epsilon, (list, tuple)) 
         else obj.material.epsilon 
-        for obj in geometry.objects)
+        for obj in geometry.get_all_objects())
 
 
 def get_intersection_freq(freq_left1, freq_right1, freq_left2, freq_right2):
@@ -298,22 +345,16 @@ def get_intersection(freq_left1, freq_right1, freq_left2, freq_right2):
     return (knum, ifreq)
 
 
-def get_gap_bands(
-        banddata, threshold=5e-4, light_line=None):
-    """Calculate the band gaps from the banddata.
-
-    Return the band number after which a gap occurs (first band is band 1),
-    the highest frequency of the band just below the gap, the lowest frequency 
-    of the band just above the gap and the normalized gap width.
+def get_band_edges(banddata, light_line=None):
+    """Return the minimum and maximum frequency of each band, two arrays
+    with number_of_bands entries.
 
     *banddata* must have shape: (number_of_k_vecs, number_of_bands).
-    Gaps smaller than *threshold* will not be counted as gap.
     If *light_line* is given (list of frequency values, one for each k-vector),
     band frequencies higher than the light line frequencies will be ignored.
+    The edges of bands entirely above the light line are -1.
 
     """
-
-    bands = []
     # the minimum frequency of each band:
     minfreqs = banddata.min(axis=0)
     # the maximum frequency of each band:
@@ -358,7 +399,26 @@ def get_gap_bands(
             else:
                 maxfreqs[bandnum] = -1
                 minfreqs[bandnum] = -1
+    return minfreqs, maxfreqs
+
+
+def get_gap_bands(
+        banddata, threshold=5e-4, light_line=None):
+    """Calculate the band gaps from the banddata.
+
+    Return the band number after which a gap occurs (first band is band 1),
+    the highest frequency of the band just below the gap, the lowest frequency 
+    of the band just above the gap and the normalized gap width.
+
+    *banddata* must have shape: (number_of_k_vecs, number_of_bands).
+    Gaps smaller than *threshold* will not be counted as gap.
+    If *light_line* is given (list of frequency values, one for each k-vector),
+    band frequencies higher than the light line frequencies will be ignored.
 
+    """
+
+    bands = []
+    minfreqs, maxfreqs = get_band_edges(banddata, light_line=light_line)
     for i in range(len(minfreqs) - 1):
         if (minfreqs[i + 1] - maxfreqs[i]) > threshold:
             # the bands are counted from 1:
@@ -410,6 +470,27 @@ def sum_of_squares(band1_data, band2_data, light_line=None):
     return np.sum(np.square(band1 - band2))
 
 
+def load_velocity_data(filename):
+    """Load the group velocities exported from MPB's output with
+    display-group-velocities (i.e. a <jobname>_<mode>velocity.csv file).
+
+    Each line of the file contains the k-index followed by one vector
+    for each band, formatted like #(vx vy vz).
+
+    :param filename: the csv-file's name
+    :return: an array with shape (number_of_k_vecs, number_of_bands, 3)
+    with the group velocities in cartesian coordinates (in units of c).
+
+    """
+    rows = []
+    with open(filename, 'r') as f:
+        for line in f:
+            vecs = re.findall(r'#\(([^)]*)\)', line)
+            if vecs:
+                rows.append([[float(c) for c in v.split()] for v in vecs])
+    return np.array(rows, dtype=float)
+
+
 def strip_format_spec(format_str):
     """Remove all format-specifications from the format-string.
 
@@ -451,10 +532,180 @@ def strip_format_spec(format_str):
     return fstr
 
 
+def png_size(filename):
+    """Return the size (width, height) of the png image *filename*,
+    read from its header without decoding the image."""
+    with open(filename, 'rb') as f:
+        header = f.read(24)
+    if header[:8] == b'\x89PNG\r\n\x1a\n' and header[12:16] == b'IHDR':
+        return struct.unpack('>II', header[16:24])
+    # not a png, decode it:
+    img = mpimg.imread(filename)
+    return img.shape[1], img.shape[0]
+
+
+# decoded pattern images, keys: (file name, modification time, file size):
+_tile_cache = OrderedDict()
+
+
+def load_images(filenames, num_threads=None):
+    """Decode the images *filenames* (with mpimg.imread) in a thread pool
+    and return a dictionary with the file names as keys and the images
+    as values.
+
+    Decoded images are cached (up to defaults.field_dist_tile_cache_bytes
+    bytes, least recently used ones are dropped first), so they are not
+    decoded again in later calls, unless the files changed.
+
+    :param num_threads: the number of threads decoding the images.
+    Default: defaults.field_dist_loader_threads
+
+    """
+    if num_threads is None:
+        num_threads = defaults.field_dist_loader_threads
+    result = dict()
+    keys = dict()
+    missing = []
+    for fname in filenames:
+        st = stat(fname)
+        key = (path.abspath(fname), st.st_mtime, st.st_size)
+        keys[fname] = key
+        if key in _tile_cache:
+            # mark as recently used:
+            result[fname] = _tile_cache.pop(key)
+            _tile_cache[key] = result[fname]
+        else:
+            missing.append(fname)
+
+    if len(missing) > 1 and num_threads > 1:
+        pool = ThreadPool(min(num_threads, len(missing)))
+        try:
+            images = pool.map(mpimg.imread, missing)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        images = [mpimg.imread(fname) for fname in missing]
+
+    for fname, img in zip(missing, images):
+        # shared by all users of the cache:
+        img.setflags(write=False)
+        result[fname] = img
+        _tile_cache[keys[fname]] = img
+    cache_bytes = sum(img.nbytes for img in _tile_cache.values())
+    while _tile_cache and cache_bytes > defaults.field_dist_tile_cache_bytes:
+        cache_bytes -= _tile_cache.popitem(last=False)[1].nbytes
+    return result
+
+
+def compose_pattern_images(
+        imgfolder, tiles, knums, bnums, ris, vertical_complex_pairs=False,
+        borderpixel=5, background=0.5):
+    """Compose field pattern pngs into one image (numpy RGBA array), in a
+    grid with one column per k-vector and one row per band (highest band
+    on top), with the real and imaginary parts next to each other (or on
+    top of each other if *vertical_complex_pairs*).
+
+    :param imgfolder: the folder with the png files.
+    :param tiles: list of tuples (png file name, band number, k-vector
+    index, 'r' or 'i' or ''). Pngs of k-vectors or bands not in *knums*
+    or *bnums* are skipped.
+    :param knums: sorted list of the k-vector indexes to include.
+    :param bnums: sorted list of the band numbers to include.
+    :param ris: list of the complex parts ('r', 'i' or '') in the order
+    in which they are placed.
+    :param borderpixel: the border between the real and imaginary parts
+    in pixels; the border between different bands and k-vectors is
+    3*borderpixel.
+    :param background: the gray level of the borders.
+    :return: a tuple (canvas, imgsize), with the composed image and the
+    size (width, height) of the individual pngs. All pngs must have the
+    same size; others are skipped with a warning.
+
+    """
+    num_cmplx_comps = len(ris)
+    positions = dict()
+    for tile in tiles:
+        fname, bandnum, knum, ri = tile
+        if knum not in knums or bandnum not in bnums or ri not in ris:
+            # kvec was excluded from distribution
+            continue
+        ic = ris.index(ri)
+        if vertical_complex_pairs:
+            col = knums.index(knum)
+            # count rows from top:
+            row = (len(bnums) - 1 - bnums.index(bandnum)) * num_cmplx_comps
+            row += num_cmplx_comps - 1 - ic
+        else:
+            col = knums.index(knum) * num_cmplx_comps + ic
+            row = len(bnums) - 1 - bnums.index(bandnum)
+        positions[fname] = (row, col, ic)
+
+    if not positions:
+        return np.zeros((0, 0, 4)), (0, 0)
+    # read img size from header of first file, all images should be the
+    # same!
+    imgsize = tuple(png_size(path.join(imgfolder, sorted(positions)[0])))
+    w, h = imgsize
+
+    # borders: thin between complex parts, thick otherwise:
+    thin = borderpixel // 2
+    if vertical_complex_pairs:
+        cell_w, cell_h = w + 3 * borderpixel, h + 2 * borderpixel
+    else:
+        cell_w, cell_h = w + 2 * borderpixel, h + 3 * borderpixel
+    if vertical_complex_pairs:
+        ncols = len(knums)
+        nrows = len(bnums) * num_cmplx_comps
+    else:
+        ncols = len(knums) * num_cmplx_comps
+        nrows = len(bnums)
+
+    canvas = np.empty((nrows * cell_h, ncols * cell_w, 4), dtype=np.float32)
+    canvas[..., :3] = background
+    canvas[..., 3] = 1
+
+    images = load_images(
+        [path.join(imgfolder, fname) for fname in positions])
+    for fname, (row, col, ic) in positions.items():
+        img = images[path.join(imgfolder, fname)]
+        if img.shape[:2] != (h, w):
+            log.warning('compose_pattern_images: {0} has a different size '
+                        'than the other images, will skip it.'.format(fname))
+            continue
+        if img.dtype == np.uint8:
+            img = img / 255.0
+        if img.ndim == 2:
+            # grayscale:
+            img = img[:, :, np.newaxis]
+        # offsets of the png in its cell:
+        if vertical_complex_pairs:
+            x = (cell_w - w) // 2
+            # real part (ic=0) is below, close to the imaginary part:
+            y = thin if ic == 0 else cell_h - h - thin
+        else:
+            x = cell_w - w - thin if ic == 0 else thin
+            y = (cell_h - h) // 2
+        if num_cmplx_comps == 1:
+            x = (cell_w - w) // 2
+            y = (cell_h - h) // 2
+        y0 = row * cell_h + y
+        x0 = col * cell_w + x
+        target = canvas[y0:y0 + h, x0:x0 + w]
+        if img.shape[2] == 4:
+            # blend with the background:
+            alpha = img[:, :, 3:]
+            target[..., :3] = img[:, :, :3] * alpha + target[..., :3] * (
+                1 - alpha)
+        else:
+            target[..., :3] = img[:, :, :3]
+    return canvas, imgsize
+
+
 def distribute_pattern_images(
         imgfolder, dstfile_prefix, dstfile_type='pdf', borderpixel=5,
         vertical_complex_pairs=False,
-        only_k=None, title='', show=False):
+        only_k=None, title='', show=False, raw=False):
     """Read all pngs (from MPB simulation) from *imgfolder* and distribute
     them according to bandnumber and k vector number.
 
@@ -482,6 +733,11 @@ def distribute_pattern_images(
     k-vectors where field patterns were exported will be added to the
     diagram.
 
+    The pngs are composed into one image with compose_pattern_images,
+    which is shown in a matplotlib figure with axis labels. If *raw* is
+    True, the figure is skipped and only the composed image is saved
+    (use a raster format for *dstfile_type* then, e.g. 'png').
+
     """
     if not path.isdir(imgfolder):
         return 0
@@ -584,12 +840,17 @@ def distribute_pattern_images(
         log.info(', '.join(
             [tpl[0] for tpl in dst_list[4:] if tpl[2] in knums]))
 
-        # prepare the figure:
+        # compose all pngs into one image:
+        canvas, imgsize = compose_pattern_images(
+            imgfolder, dst_list[4:], knums, bnums, ris,
+            vertical_complex_pairs, borderpixel)
 
-        # read img size from first file, all images should be the same!
-        img = mpimg.imread(path.join(imgfolder, dst_list[4][0]))
-        imgsize = (img.shape[1], img.shape[0])
-        # img_aspect = imgsize[1] / imgsize[0]
+        if raw:
+            # no figure with labels, just the composed images:
+            plt.imsave(dstfile_name, canvas)
+            continue
+
+        # prepare the figure:
 
         # calc pixelsize in data units: I want to force the individual
         # pngs into areas of 1x1 data units, including a half-border
@@ -602,29 +863,16 @@ def distribute_pattern_images(
             pixelsize_x = 1.0 / (imgsize[0] + 3 * borderpixel)
             # border belonging to one png in y: (0.5 + 1.5) * bordersize:
             pixelsize_y = 1.0 / (imgsize[1] + 2 * borderpixel)
-            # print 'pixel sizes (in data space)', pixelsize_x, pixelsize_y
         else:
             # border belonging to one png in x: (0.5 + 1.5) * bordersize:
             pixelsize_x = 1.0 / (imgsize[0] + 2 * borderpixel)
             # border belonging to one png in y: (1.5 + 1.5) * bordersize:
             pixelsize_y = 1.0 / (imgsize[1] + 3 * borderpixel)
-            # print 'pixel sizes (in data space)', pixelsize_x, pixelsize_y
 
         # the aspect ratio for the subplot so the pixels turn out
         # rectangular:
         ax_aspect = pixelsize_x / pixelsize_y
 
-        # calc extents of the indivdual pngs: These values are given in
-        # data units. They denote the distance between an integer value
-        # of an axis (near png center) to where the boundaries of the
-        # pngs will be placed in data space, thereby
-        # stretching/shrinking the pngs and leaving an empty border
-        # between adjacent pngs.
-        ext_thin_border_x = 0.5 - 0.5 * pixelsize_x * borderpixel
-        ext_thick_border_x = 0.5 - 1.5 * pixelsize_x * borderpixel
-        ext_thin_border_y = 0.5 - 0.5 * pixelsize_y * borderpixel
-        ext_thick_border_y = 0.5 - 1.5 * pixelsize_y * borderpixel
-
         # size in data units:
         if vertical_complex_pairs:
             w_dataunits = len(knums)
@@ -643,41 +891,13 @@ def distribute_pattern_images(
         )
         ax = fig.add_subplot(111, axisbg='0.5', aspect=ax_aspect)
 
-        # now, we can place each image on the subplot:
-        for src_tuple in dst_list[4:]:
-            fname = path.join(imgfolder, src_tuple[0])
-            bandnum = src_tuple[1]
-            knum = src_tuple[2]
-            ri = src_tuple[3]
-
-            # where must the image go?
-            try:
-                ic = ris.index(ri)
-                if vertical_complex_pairs:
-                    x0 = knums.index(knum)
-                    y0 = bnums.index(bandnum) * num_cmplx_comps + ic
-                else:
-                    x0 = knums.index(knum) * num_cmplx_comps + ic
-                    y0 = bnums.index(bandnum)
-            except ValueError:
-                # kvec was excluded from distribution
-                continue
-            if vertical_complex_pairs:
-                xl = x0 - ext_thick_border_x
-                xr = x0 + ext_thick_border_x
-                yb = y0 - ext_thin_border_y if ic else y0 - ext_thick_border_y
-                yt = y0 + ext_thick_border_y if ic else y0 + ext_thin_border_y
-            else:
-                xl = x0 - ext_thin_border_x if ic else x0 - ext_thick_border_x
-                xr = x0 + ext_thick_border_x if ic else x0 + ext_thin_border_x
-                yb = y0 - ext_thick_border_y
-                yt = y0 + ext_thick_border_y
-            img = mpimg.imread(fname)
-            ax.imshow(
-                img,
-                origin='upper',
-                extent=(xl, xr, yb, yt),
-                interpolation='none')
+        # the composed image covers the whole data region, with each
+        # png (and its share of the border) in an area of 1x1 data units:
+        ax.imshow(
+            canvas,
+            origin='upper',
+            extent=(-0.5, w_dataunits - 0.5, -0.5, h_dataunits - 0.5),
+            interpolation='none')
 
         # set aspect; must be done after ax.imshow, as the latter changes it:
         ax.set_aspect(ax_aspect)
@@ -783,6 +1003,9 @@ def do_runmode(
         ''       : just create and return the simulation object
         'ctl'    : just write the ctl file to disk
         'sim'    : run the simulation and do all postprocessing
+        'queue'  : return a pipeline.Job with the simulation and the
+                   postprocessing arguments, which can be run together
+                   with other jobs with pipeline.run_pipelined
         'postpc' : do all postprocessing; simulation should have run
                    before!
         'display': display all pngs done during postprocessing. This is
@@ -845,38 +1068,69 @@ def do_runmode(
     :param color_by_parity:
         Specify 'y' or 'z' to color the plot lines with the data taken
         from the parity files <jobname>_<mode>[z/y]parity.csv.
-    :return: the simulation object
+    :return: the simulation object, or a pipeline.Job with the
+        simulation if runmode is 'queue' (the simulation is not run).
+        False if the simulation failed.
 
     """
-    if not isinstance(runmode, str):
+    if not isinstance(runmode, str) or not runmode:
         return sim
 
+    if runmode.startswith('q'):  # queue for pipelined sweep
+        return pipeline.Job(
+            sim, num_processors,
+            bands_plot_title=bands_plot_title, plot_crop_y=plot_crop_y,
+            x_axis_hint=x_axis_hint,
+            convert_field_patterns=convert_field_patterns,
+            field_pattern_plot_k_selection=field_pattern_plot_k_selection,
+            field_pattern_plot_filetype=field_pattern_plot_filetype,
+            project_bands_list=project_bands_list,
+            color_by_parity=color_by_parity)
+
+    with profiler.job(sim.jobname, sim.workingdir):
+        return _do_runmode(
+            sim, runmode, num_processors, bands_plot_title, plot_crop_y,
+            x_axis_hint, convert_field_patterns,
+            field_pattern_plot_k_selection, field_pattern_plot_filetype,
+            project_bands_list, color_by_parity)
+
+
+def _do_runmode(
+        sim, runmode, num_processors, bands_plot_title, plot_crop_y,
+        x_axis_hint, convert_field_patterns, field_pattern_plot_k_selection,
+        field_pattern_plot_filetype, project_bands_list, color_by_parity):
+    """The stages of do_runmode, each timed with the profiler."""
     if runmode.startswith('c'):  # create ctl file
-        sim.write_ctl_file(sim.workingdir)
+        with profiler.stage('write_ctl'):
+            sim.write_ctl_file(sim.workingdir)
     elif runmode.startswith('s'):  # run simulation
-        error = sim.run_simulation(num_processors=num_processors)
+        with profiler.stage('run_mpb'):
+            error = sim.run_simulation(num_processors=num_processors)
         if error:
             return False
         # now continue with postprocessing:
         runmode = 'postpc'
     if runmode.startswith('p'):  # postprocess
         # create csv files of data and pngs:
-        sim.post_process(
-            convert_field_patterns=convert_field_patterns,
-            project_bands_list=project_bands_list
-        )
+        with profiler.stage('post_process'):
+            sim.post_process(
+                convert_field_patterns=convert_field_patterns,
+                project_bands_list=project_bands_list
+            )
         # save band diagram as pdf&png:
-        sim.draw_bands(
-            title=bands_plot_title, crop_y=plot_crop_y,
-            x_axis_hint=x_axis_hint,
-            add_epsilon_as_inset=defaults.add_epsilon_as_inset,
-            color_by_parity=color_by_parity)
+        with profiler.stage('draw_bands'):
+            sim.draw_bands(
+                title=bands_plot_title, crop_y=plot_crop_y,
+                x_axis_hint=x_axis_hint,
+                add_epsilon_as_inset=defaults.add_epsilon_as_inset,
+                color_by_parity=color_by_parity)
         # save mode patterns to pdf&png:
         if convert_field_patterns:
-            sim.draw_field_patterns(
-                title=bands_plot_title,
-                filetype=field_pattern_plot_filetype,
-                only_k=field_pattern_plot_k_selection)
+            with profiler.stage('draw_field_patterns'):
+                sim.draw_field_patterns(
+                    title=bands_plot_title,
+                    filetype=field_pattern_plot_filetype,
+                    only_k=field_pattern_plot_k_selection)
     elif runmode.startswith('d'):  # display pngs
         # display png of epsilon:
         sim.display_epsilon()